@@ -0,0 +1,113 @@
+"""Micro-benchmark for page content extraction.
+
+Compares the single-pass extractor (readthedocs.extract_main_content) with
+the previous approach, which called get_text() on every candidate selector
+and again for the final text. Parsing is timed separately so the numbers
+show the extraction work itself.
+
+Usage:
+    python benchmarks/bench_extraction.py [--repeat 5] [--json]
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bs4 import BeautifulSoup  # noqa: E402
+
+import readthedocs  # noqa: E402
+from pages import THEMES  # noqa: E402
+
+SIZES = {
+    "tutorial": {"sections": 10, "api_entries": 0},
+    "api-reference": {"sections": 40, "api_entries": 800},
+}
+
+
+def legacy_extract(soup: BeautifulSoup) -> str | None:
+    """The multi-pass extraction used before the single-pass walk."""
+    content = None
+    for tag, attrs in readthedocs.CONTENT_SELECTORS:
+        content = soup.find(tag, attrs)
+        if content and len(content.get_text(strip=True)) > 100:
+            break
+    if not content or len(content.get_text(strip=True)) < 100:
+        body = soup.find("body")
+        if body:
+            for nav in body.find_all(["nav", "header", "footer"]):
+                nav.decompose()
+            content = body
+    if content:
+        return readthedocs.clean_text(content.get_text(separator="\n"))
+    return None
+
+
+def single_pass_extract(soup: BeautifulSoup) -> str | None:
+    """Single-pass extraction (including the section index) via extract_page_from_soup."""
+    with contextlib.redirect_stderr(io.StringIO()):
+        page = readthedocs.extract_page_from_soup(soup)
+    return page["text"] if page else None
+
+
+def best_of(func, html: str, parser: str, repeat: int) -> tuple[float, float, str | None]:
+    """Return (median parse seconds, median extract seconds, output)."""
+    parse_times, extract_times = [], []
+    output = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        soup = BeautifulSoup(html, parser)
+        parsed = time.perf_counter()
+        output = func(soup)
+        extract_times.append(time.perf_counter() - parsed)
+        parse_times.append(parsed - start)
+    return statistics.median(parse_times), statistics.median(extract_times), output
+
+
+def main() -> None:
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument("--repeat", type=int, default=5)
+    arg_parser.add_argument("--parsers", default="html.parser,lxml")
+    arg_parser.add_argument("--json", action="store_true", help="Print machine-readable results")
+    args = arg_parser.parse_args()
+
+    results = []
+    for theme, make_page in THEMES.items():
+        for size, options in SIZES.items():
+            html = make_page(**options)
+            for parser in args.parsers.split(","):
+                _, legacy_time, legacy_text = best_of(legacy_extract, html, parser, args.repeat)
+                parse_time, new_time, new_text = best_of(single_pass_extract, html, parser, args.repeat)
+                results.append({
+                    "theme": theme,
+                    "size": size,
+                    "html_bytes": len(html),
+                    "parser": parser,
+                    "parse_ms": round(parse_time * 1000, 2),
+                    "legacy_extract_ms": round(legacy_time * 1000, 2),
+                    "single_pass_extract_ms": round(new_time * 1000, 2),
+                    "speedup": round(legacy_time / new_time, 2) if new_time else None,
+                    "same_output": legacy_text == new_text,
+                })
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    header = f"{'theme':<11} {'size':<14} {'KiB':>6} {'parser':<12} {'parse ms':>9} {'legacy ms':>10} {'1-pass ms':>10} {'speedup':>8}  same"
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        print(f"{r['theme']:<11} {r['size']:<14} {r['html_bytes'] // 1024:>6} {r['parser']:<12} "
+              f"{r['parse_ms']:>9} {r['legacy_extract_ms']:>10} {r['single_pass_extract_ms']:>10} "
+              f"{r['speedup']:>7}x  {r['same_output']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,208 @@
+"""Startup benchmark: time from spawning the stdio server to its first answers.
+
+MCP clients often spawn a new server process for every session, so spawn
+latency is paid on each one. This script starts readthedocs.py over stdio
+the way a client does and measures time to the ``initialize`` reply, the
+``tools/list`` reply and the first two tool calls (lookup_symbol and
+get_project_versions). Those calls go to the local fake Read the Docs from
+fakertd.py. It also measures a bare interpreter start and a plain
+``import readthedocs`` for reference.
+
+There are three scenarios:
+
+- ``cold``: no disk tier.
+- ``disk``: a disk tier filled by an earlier session, with the warm start
+  off.
+- ``warm-start``: the same disk tier with the snapshot restored in the
+  background.
+
+Each run reports medians over ``--repeat`` spawns, upstream requests made by
+the first calls and bytes written to stderr.
+
+Usage:
+    python benchmarks/bench_startup.py [--repeat 5] [--latency-ms 20] [--json]
+"""
+
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+FIRST_CALLS = [
+    ("lookup_symbol", {"symbol": "demo.Client.method_3", "project": "sphinxdemo"}),
+    ("get_project_versions", {"project": "sphinxdemo"}),
+]
+
+
+def serve(port: int) -> None:
+    """Child process: run the stdio server with its HTTP clients routed to the fake server."""
+    sys.path[:0] = [ROOT, BENCH_DIR]
+    import readthedocs
+
+    def routed_client(host: str):
+        # Imported on the first request so the routing does not count towards startup
+        from bench_tools import route_to_fake
+        route_to_fake(readthedocs, port)
+        return readthedocs.get_http_client(host)
+
+    readthedocs.get_http_client = routed_client
+    sys.exit(readthedocs.main(["serve"]))
+
+
+class Session:
+    """A spawned stdio server and a minimal JSON-RPC client for it."""
+
+    def __init__(self, port: int, env: dict[str, str]):
+        self.next_id = 0
+        self.stderr = tempfile.TemporaryFile()
+        self.process = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), "--serve", str(port)],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=self.stderr, env=env, bufsize=0,
+        )
+
+    def send(self, method: str, params: dict | None = None, notify: bool = False) -> None:
+        message = {"jsonrpc": "2.0", "method": method}
+        if params is not None:
+            message["params"] = params
+        if not notify:
+            self.next_id += 1
+            message["id"] = self.next_id
+        self.process.stdin.write(json.dumps(message).encode() + b"\n")
+
+    def request(self, method: str, params: dict | None = None) -> dict:
+        """Send a request and return its result, skipping any notifications in between."""
+        self.send(method, params)
+        while True:
+            line = self.process.stdout.readline()
+            if not line:
+                raise RuntimeError(f"server exited before answering {method}: {self.read_stderr()[-500:]}")
+            message = json.loads(line)
+            if message.get("id") == self.next_id:
+                if "error" in message:
+                    raise RuntimeError(f"{method} failed: {message['error']}")
+                return message["result"]
+
+    def close(self) -> float:
+        """Close stdin like a client ending the session; return how long the server took to exit."""
+        start = time.perf_counter()
+        self.process.stdin.close()
+        self.process.wait(timeout=30)
+        return time.perf_counter() - start
+
+    def read_stderr(self) -> str:
+        self.stderr.seek(0)
+        return self.stderr.read().decode(errors="replace")
+
+
+def run_session(port: int, env: dict[str, str], fake, linger: float = 0.0) -> dict:
+    """One spawn: milliseconds from spawn to each reply, plus upstream requests and stderr output.
+
+    ``linger`` keeps the session open after the calls, so listings finish
+    loading in the background before the server exits.
+    """
+    start = time.perf_counter()
+    session = Session(port, env)
+    session.request("initialize", {
+        "protocolVersion": "2025-06-18",
+        "capabilities": {},
+        "clientInfo": {"name": "bench_startup", "version": "1.0"},
+    })
+    times = {"initialize": time.perf_counter() - start}
+    session.send("notifications/initialized", notify=True)
+    session.request("tools/list")
+    times["tools/list"] = time.perf_counter() - start
+    before = fake.stats["requests"]
+    for name, arguments in FIRST_CALLS:
+        result = session.request("tools/call", {"name": name, "arguments": arguments})
+        if result.get("isError"):
+            raise RuntimeError(f"{name} failed: {result}")
+        times[name] = time.perf_counter() - start
+    upstream = fake.stats["requests"] - before
+    time.sleep(linger)
+    times["shutdown"] = session.close()
+    return {
+        "ms": {step: seconds * 1000 for step, seconds in times.items()},
+        "upstream_requests": upstream,
+        "stderr_bytes": len(session.read_stderr().encode()),
+    }
+
+
+def time_command(code: str, env: dict[str, str], repeat: int) -> float:
+    """Median milliseconds for ``python -c code`` to run and exit."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", code], env=env, cwd=ROOT, check=True)
+        times.append(time.perf_counter() - start)
+    return statistics.median(times) * 1000
+
+
+def main() -> None:
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument("--repeat", type=int, default=5, help="Spawns per scenario")
+    arg_parser.add_argument("--latency-ms", type=float, default=20.0, help="Latency the fake server adds to each request")
+    arg_parser.add_argument("--json", action="store_true", help="Print machine-readable results")
+    arg_parser.add_argument("--serve", type=int, help=argparse.SUPPRESS)
+    args = arg_parser.parse_args()
+    if args.serve is not None:
+        serve(args.serve)
+        return
+
+    sys.path.insert(0, BENCH_DIR)
+    from fakertd import FakeReadTheDocs
+
+    fake = FakeReadTheDocs(latency=args.latency_ms / 1000).start()
+    base_env = {name: value for name, value in os.environ.items() if not name.startswith("READTHEDOCS_")}
+    cache_dir = tempfile.mkdtemp(prefix="bench-startup-")
+    disk_env = {**base_env, "READTHEDOCS_CACHE_DIR": cache_dir}
+    try:
+        reference = {
+            "python": time_command("pass", base_env, args.repeat),
+            "import readthedocs": time_command("import readthedocs", base_env, args.repeat),
+        }
+        # One session fills the disk tier and, on exit, writes the warm-start snapshot
+        run_session(fake.port, disk_env, fake, linger=1.0)
+        scenarios = {
+            "cold": base_env,
+            "disk": {**disk_env, "READTHEDOCS_WARM_START": "0"},
+            "warm-start": disk_env,
+        }
+        results = []
+        for scenario, env in scenarios.items():
+            runs = [run_session(fake.port, env, fake) for _ in range(args.repeat)]
+            results.append({
+                "scenario": scenario,
+                "ms": {step: round(statistics.median(run["ms"][step] for run in runs), 1) for step in runs[0]["ms"]},
+                "upstream_requests": max(run["upstream_requests"] for run in runs),
+                "stderr_bytes": max(run["stderr_bytes"] for run in runs),
+            })
+    finally:
+        fake.stop()
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+    if args.json:
+        print(json.dumps({"reference_ms": {k: round(v, 1) for k, v in reference.items()}, "scenarios": results}, indent=2))
+        return
+
+    for name, ms in reference.items():
+        print(f"{name:<20} {ms:>8.1f} ms")
+    print()
+    steps = list(results[0]["ms"])
+    header = f"{'scenario':<11} " + " ".join(f"{step:>20}" for step in steps) + f" {'upstream':>9} {'stderr':>7}"
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        print(f"{r['scenario']:<11} " + " ".join(f"{r['ms'][step]:>20}" for step in steps)
+              + f" {r['upstream_requests']:>9} {r['stderr_bytes']:>7}")
+    print("\nTimes are milliseconds from spawn, except shutdown (from closing stdin to exit).")
+
+
+if __name__ == "__main__":
+    main()
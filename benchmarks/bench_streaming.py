@@ -0,0 +1,116 @@
+"""Benchmark for streaming extraction of very large pages.
+
+Compares building a full parse tree (readthedocs.extract_page) with feeding
+the page to readthedocs.StreamingPageParser in network-sized chunks, for
+the whole page and for a single section near the start. Reports time, the
+peak memory allocated during extraction (tracemalloc, excluding the HTML
+input itself) and how much of the page had to be read. Times are taken
+with tracemalloc running, which slows the allocation-heavy tree build most.
+
+Usage:
+    python benchmarks/bench_streaming.py [--repeat 3] [--json]
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import readthedocs  # noqa: E402
+from pages import THEMES  # noqa: E402
+
+SIZES = {
+    "large": {"sections": 100, "api_entries": 1000, "nav_pages": 200},
+    "single-html": {"sections": 400, "api_entries": 3000, "nav_pages": 300},
+}
+CHUNK_CHARS = 64 * 1024
+
+
+def full_extract(html: str, section: str | None) -> tuple[dict | None, int]:
+    """Whole-document parse, as used for ordinary pages."""
+    return readthedocs.extract_page(html, readthedocs.HTML_PARSER), len(html)
+
+
+def streaming_extract(html: str, section: str | None) -> tuple[dict | None, int]:
+    """Chunked incremental parse; stops after the section when one is given."""
+    parser = readthedocs.StreamingPageParser(section)
+    read = 0
+    while read < len(html) and not parser.done:
+        parser.feed(html[read:read + CHUNK_CHARS])
+        read += CHUNK_CHARS
+    return parser.close(), min(read, len(html))
+
+
+def measure(func, html: str, section: str | None, repeat: int) -> tuple[float, int, int, dict | None]:
+    """Return (median seconds, peak bytes allocated, characters read, page)."""
+    times, peaks = [], []
+    page, read = None, 0
+    for _ in range(repeat):
+        tracemalloc.start()
+        start = time.perf_counter()
+        with contextlib.redirect_stderr(io.StringIO()):
+            page, read = func(html, section)
+        times.append(time.perf_counter() - start)
+        peaks.append(tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    return statistics.median(times), max(peaks), read, page
+
+
+def main() -> None:
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument("--repeat", type=int, default=3)
+    arg_parser.add_argument("--json", action="store_true", help="Print machine-readable results")
+    args = arg_parser.parse_args()
+
+    results = []
+    for theme, make_page in THEMES.items():
+        for size, options in SIZES.items():
+            html = make_page(**options)
+            reference = full_extract(html, None)[0]
+            section = reference["sections"][2]["id"] if reference and len(reference["sections"]) > 2 else None
+            for mode, func, wanted in (
+                ("tree", full_extract, None),
+                ("stream", streaming_extract, None),
+                ("stream-section", streaming_extract, section),
+            ):
+                seconds, peak, read, page = measure(func, html, wanted, args.repeat)
+                if wanted is None:
+                    same = page == reference
+                else:
+                    got = readthedocs.find_section(page, wanted) if page else None
+                    expected = readthedocs.find_section(reference, wanted)
+                    same = bool(got and expected) and (
+                        page["text"][got["start"]:got["end"]] == reference["text"][expected["start"]:expected["end"]]
+                    )
+                results.append({
+                    "theme": theme,
+                    "size": size,
+                    "html_bytes": len(html),
+                    "mode": mode,
+                    "ms": round(seconds * 1000, 1),
+                    "peak_mib": round(peak / 2**20, 1),
+                    "read_fraction": round(read / len(html), 3),
+                    "same_output": same,
+                })
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    header = f"{'theme':<11} {'size':<12} {'KiB':>6} {'mode':<15} {'ms':>8} {'peak MiB':>9} {'read':>6}  same"
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        print(f"{r['theme']:<11} {r['size']:<12} {r['html_bytes'] // 1024:>6} {r['mode']:<15} "
+              f"{r['ms']:>8} {r['peak_mib']:>9} {r['read_fraction']:>6.0%}  {r['same_output']}")
+
+
+if __name__ == "__main__":
+    main()
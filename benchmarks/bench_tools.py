@@ -0,0 +1,405 @@
+"""Load test for every MCP tool against a local fake Read the Docs.
+
+Starts the fake server from fakertd.py (Sphinx, Furo and MkDocs sites plus
+API v3 JSON, with configurable latency), routes the server's HTTP clients
+to it and calls each registered tool through FastMCP at the requested
+concurrency. The same mixed schedule of calls runs for several passes, so
+the first pass shows cold-cache behaviour and later ones warm-cache
+behaviour. For each pass it reports per-tool p50/p95/p99 latency,
+throughput, upstream requests per call, cache hit ratios and memory use.
+
+Rate limits and prefetch politeness delays are lifted by default so the
+numbers measure the server rather than its throttling; pass
+--keep-rate-limits to measure with the configured limits.
+
+Usage:
+    python benchmarks/bench_tools.py [--concurrency 8] [--requests 20] [--passes 2]
+        [--latency-ms 20] [--jitter-ms 10] [--disk-cache] [--json | --output results.json]
+        [--compare baseline.json]
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx  # noqa: E402
+
+from fakertd import API_ENTRIES, PAGES, FakeReadTheDocs, LocalTransport  # noqa: E402
+from pages import WORDS  # noqa: E402
+
+SITES = ["sphinxdemo", "furodemo", "mkdocsdemo"]
+SPHINX_SITES = ["sphinxdemo", "furodemo"]
+
+
+def page_path(project: str, number: int) -> str:
+    return f"page{number}/" if project == "mkdocsdemo" else f"page{number}.html"
+
+
+def page_item(rng: random.Random) -> dict:
+    project = rng.choice(SITES)
+    item = {"project": project, "version": "latest", "path": page_path(project, rng.randrange(PAGES))}
+    if rng.random() < 0.3:
+        item["section"] = f"section-{rng.randrange(12)}"
+    return item
+
+
+def search_item(rng: random.Random) -> dict:
+    return {"query": " ".join(rng.choice(WORDS) for _ in range(2)), "project": rng.choice(SITES)}
+
+
+# Tool name -> (calls per --requests, argument factory). Every registered tool needs an entry.
+WORKLOADS = {
+    "get_page": (4.0, page_item),
+    "get_pages": (1.0, lambda rng: {"pages": [page_item(rng) for _ in range(3)], "limit": 2000}),
+    "search_docs": (2.0, search_item),
+    "search_docs_multi": (1.0, lambda rng: {"searches": [search_item(rng) for _ in range(3)]}),
+    "get_toc": (1.0, lambda rng: {"project": rng.choice(SITES)}),
+    "lookup_symbol": (2.0, lambda rng: {"symbol": f"demo.Client.method_{rng.randrange(API_ENTRIES)}",
+                                        "project": rng.choice(SPHINX_SITES)}),
+    "list_projects": (1.0, lambda rng: {"query": rng.choice(["demo", "furo", "sphinx"])}),
+    "get_project_details": (1.0, lambda rng: {"project": rng.choice(SITES)}),
+    "get_project_versions": (1.0, lambda rng: {"project": rng.choice(SITES), "query": rng.choice(["", "3."])}),
+    "prefetch_project": (0.1, lambda rng: {"project": rng.choice(SITES), "max_pages": 10}),
+    "prefetch_status": (0.2, lambda rng: {}),
+    "cancel_prefetch": (0.1, lambda rng: {"job_id": "1"}),
+    "ingest_docs": (0.1, lambda rng: {"project": "archivedemo"}),
+    "cache_stats": (0.2, lambda rng: {}),
+    "connection_pool_stats": (0.2, lambda rng: {}),
+    "server_stats": (0.2, lambda rng: {}),
+}
+ERROR_PREFIXES = ("Error", "Unable")
+
+
+def configure_environment(args: argparse.Namespace) -> None:
+    """Set the server's environment before it is imported."""
+    os.environ.setdefault("READTHEDOCS_LOG_LEVEL", "ERROR")
+    if not args.keep_rate_limits:
+        for name, value in (
+            ("READTHEDOCS_RATE_LIMIT", "100000"),
+            ("READTHEDOCS_RATE_BURST", "100000"),
+            ("READTHEDOCS_TOKEN_RATE_LIMIT", "100000"),
+            ("READTHEDOCS_PREFETCH_DELAY", "0"),
+            ("READTHEDOCS_PREFETCH_RATE", "100000"),
+        ):
+            os.environ[name] = value
+    if args.disk_cache:
+        os.environ["READTHEDOCS_CACHE_DIR"] = args.disk_cache
+
+
+def route_to_fake(readthedocs, port: int) -> None:
+    """Build the server's per-host clients as usual, but with a transport that targets the fake server."""
+
+    def get_http_client(host: str) -> httpx.AsyncClient:
+        client = readthedocs.http_clients.get(host)
+        if client is None or client.is_closed:
+            limits = httpx.Limits(
+                max_connections=readthedocs.HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=readthedocs.HTTP_MAX_KEEPALIVE,
+                keepalive_expiry=readthedocs.HTTP_KEEPALIVE_EXPIRY,
+            )
+            client = httpx.AsyncClient(
+                follow_redirects=True,
+                timeout=readthedocs.HTTP_TIMEOUT,
+                headers={"User-Agent": readthedocs.USER_AGENT},
+                transport=LocalTransport(port, limits),
+            )
+            readthedocs.http_clients[host] = client
+        return client
+
+    readthedocs.get_http_client = get_http_client
+
+
+def build_schedule(tool_names: list[str], requests: int, seed: int) -> list[tuple[str, dict]]:
+    """A shuffled list of (tool, arguments) calls, weighted per tool."""
+    rng = random.Random(seed)
+    schedule = []
+    for name in tool_names:
+        weight, make_args = WORKLOADS[name]
+        for _ in range(max(1, round(requests * weight))):
+            schedule.append((name, make_args(rng)))
+    rng.shuffle(schedule)
+    return schedule
+
+
+def result_text(result) -> str:
+    """Text of a FastMCP call_tool result (a content list, or (content, structured) in newer releases)."""
+    content = result[0] if isinstance(result, tuple) else result
+    return "".join(getattr(block, "text", "") for block in content)
+
+
+def percentile(values: list[float], q: int) -> float:
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method="inclusive")[q - 1]
+
+
+def rss_mib() -> float:
+    """Current resident set size (Linux), falling back to the peak elsewhere."""
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return peak_rss_mib()
+
+
+def peak_rss_mib() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2**20 if sys.platform == "darwin" else peak / 1024
+
+
+def cache_counters(readthedocs) -> dict:
+    """Cumulative cache counters, to be diffed between the start and end of a pass."""
+    counters = {
+        f"memory.{namespace}.{key}": stats[key]
+        for namespace, stats in readthedocs.cache.stats()["namespaces"].items()
+        for key in ("hits", "misses")
+    }
+    counters["coalesced"] = readthedocs.coalescing_stats["coalesced"]
+    if readthedocs.disk_cache is not None:
+        for key in ("hits", "misses", "revalidated", "stale_served"):
+            counters[f"disk.{key}"] = readthedocs.disk_cache.stats[key]
+    return counters
+
+
+def cache_summary(readthedocs, before: dict) -> dict:
+    """Hit ratio per in-memory namespace, and disk tier outcomes, during one pass."""
+    after = cache_counters(readthedocs)
+    delta = {key: value - before.get(key, 0) for key, value in after.items()}
+    namespaces = sorted({key.split(".")[1] for key in delta if key.startswith("memory.")})
+    summary = {
+        "memory_bytes": readthedocs.cache.current_bytes,
+        "hit_ratio": {},
+        "coalesced": delta["coalesced"],
+    }
+    for namespace in namespaces:
+        hits, misses = delta[f"memory.{namespace}.hits"], delta[f"memory.{namespace}.misses"]
+        if hits + misses:
+            summary["hit_ratio"][namespace] = round(hits / (hits + misses), 3)
+    if readthedocs.disk_cache is not None:
+        summary["disk"] = {key[len("disk."):]: value for key, value in delta.items() if key.startswith("disk.")}
+    return summary
+
+
+async def run_pass(readthedocs, fake: FakeReadTheDocs, schedule: list[tuple[str, dict]], concurrency: int) -> dict:
+    """Run one pass of the schedule and summarise it."""
+    latencies: dict[str, list[float]] = {}
+    errors: dict[str, int] = {}
+    upstream_before = dict(fake.stats["by_kind"]), fake.stats["requests"], fake.stats["not_modified"]
+    received_before = sum(readthedocs.bytes_received.values())
+    cache_before = cache_counters(readthedocs)
+    queue = list(reversed(schedule))
+
+    async def worker() -> None:
+        while queue:
+            name, arguments = queue.pop()
+            start = time.perf_counter()
+            try:
+                text = result_text(await readthedocs.mcp.call_tool(name, arguments))
+                failed = text.startswith(ERROR_PREFIXES)
+            except Exception:
+                failed = True
+            latencies.setdefault(name, []).append(time.perf_counter() - start)
+            if failed:
+                errors[name] = errors.get(name, 0) + 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    calls = len(schedule)
+    kinds_before, requests_before, not_modified_before = upstream_before
+    upstream_requests = fake.stats["requests"] - requests_before
+    all_latencies = [value for values in latencies.values() for value in values]
+    return {
+        "calls": calls,
+        "seconds": round(elapsed, 3),
+        "throughput_per_s": round(calls / elapsed, 1),
+        "p50_ms": round(percentile(all_latencies, 50) * 1000, 2),
+        "p95_ms": round(percentile(all_latencies, 95) * 1000, 2),
+        "p99_ms": round(percentile(all_latencies, 99) * 1000, 2),
+        "errors": sum(errors.values()),
+        "tools": {
+            name: {
+                "calls": len(values),
+                "errors": errors.get(name, 0),
+                "p50_ms": round(percentile(values, 50) * 1000, 2),
+                "p95_ms": round(percentile(values, 95) * 1000, 2),
+                "p99_ms": round(percentile(values, 99) * 1000, 2),
+                "mean_ms": round(statistics.fmean(values) * 1000, 2),
+            }
+            for name, values in sorted(latencies.items())
+        },
+        "upstream": {
+            "requests": upstream_requests,
+            "requests_per_call": round(upstream_requests / calls, 3),
+            "not_modified": fake.stats["not_modified"] - not_modified_before,
+            "bytes_received": sum(readthedocs.bytes_received.values()) - received_before,
+            "by_kind": {
+                kind: count - kinds_before.get(kind, 0)
+                for kind, count in sorted(fake.stats["by_kind"].items())
+                if count - kinds_before.get(kind, 0)
+            },
+        },
+        "cache": cache_summary(readthedocs, cache_before),
+        "rss_mib": round(rss_mib(), 1),
+    }
+
+
+async def run(args: argparse.Namespace) -> dict:
+    import readthedocs
+
+    # FastMCP sets up INFO logging, under which httpx logs every request
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    fake = FakeReadTheDocs(latency=args.latency_ms / 1000, jitter=args.jitter_ms / 1000, seed=args.seed).start()
+    route_to_fake(readthedocs, fake.port)
+    tool_names = sorted(tool.name for tool in await readthedocs.mcp.list_tools())
+    untested = [name for name in tool_names if name not in WORKLOADS]
+    if args.tools:
+        tool_names = [name for name in tool_names if name in args.tools.split(",")]
+    tool_names = [name for name in tool_names if name in WORKLOADS]
+    schedule = build_schedule(tool_names, args.requests, args.seed)
+
+    rss_start = rss_mib()
+    passes = []
+    try:
+        async with readthedocs.server_lifespan(readthedocs.mcp):
+            for _ in range(args.passes):
+                passes.append(await run_pass(readthedocs, fake, schedule, args.concurrency))
+                # Let prefetch jobs and index updates settle between passes
+                await asyncio.wait_for(
+                    asyncio.gather(*readthedocs.background_tasks, return_exceptions=True), timeout=60
+                )
+    finally:
+        fake.stop()
+
+    return {
+        "commit": git_commit(),
+        "config": {
+            "concurrency": args.concurrency,
+            "requests": args.requests,
+            "passes": args.passes,
+            "latency_ms": args.latency_ms,
+            "jitter_ms": args.jitter_ms,
+            "disk_cache": bool(args.disk_cache),
+            "rate_limits": args.keep_rate_limits,
+            "html_parser": readthedocs.HTML_PARSER,
+            "seed": args.seed,
+        },
+        "untested_tools": untested,
+        "passes": passes,
+        "rss_mib": {"start": round(rss_start, 1), "end": round(rss_mib(), 1), "peak": round(peak_rss_mib(), 1)},
+        "phases": {
+            phase: {
+                "count": histogram.count,
+                "total_s": round(histogram.total, 3),
+                "p50_ms": round(histogram.quantile(0.5) * 1000, 2),
+                "p95_ms": round(histogram.quantile(0.95) * 1000, 2),
+            }
+            for phase, histogram in readthedocs.phase_latency.items()
+        },
+    }
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_report(results: dict) -> None:
+    config = results["config"]
+    print(f"commit {results['commit']}: concurrency {config['concurrency']}, latency {config['latency_ms']} ms "
+          f"(+{config['jitter_ms']} jitter), parser {config['html_parser']}")
+    if results["untested_tools"]:
+        print(f"WARNING: no workload for {', '.join(results['untested_tools'])}")
+    for number, summary in enumerate(results["passes"], 1):
+        upstream = summary["upstream"]
+        print(f"\npass {number}: {summary['calls']} calls in {summary['seconds']}s ({summary['throughput_per_s']}/s), "
+              f"p50 {summary['p50_ms']} ms, p95 {summary['p95_ms']} ms, p99 {summary['p99_ms']} ms, "
+              f"{summary['errors']} errors, RSS {summary['rss_mib']} MiB")
+        print(f"upstream: {upstream['requests']} requests ({upstream['requests_per_call']}/call), "
+              f"{upstream['not_modified']} not modified, {upstream['bytes_received'] // 1024} KiB received")
+        print("cache hit ratio: " + ", ".join(f"{ns} {ratio:.0%}" for ns, ratio in summary["cache"]["hit_ratio"].items()))
+        header = f"{'tool':<22} {'calls':>6} {'errors':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}"
+        print(header)
+        print("-" * len(header))
+        for name, tool in summary["tools"].items():
+            print(f"{name:<22} {tool['calls']:>6} {tool['errors']:>6} {tool['p50_ms']:>9} {tool['p95_ms']:>9} {tool['p99_ms']:>9}")
+    rss = results["rss_mib"]
+    print(f"\nRSS: {rss['start']} MiB at start, {rss['end']} MiB at end, peak {rss['peak']} MiB")
+
+
+def print_comparison(results: dict, baseline: dict) -> None:
+    """Per-tool latency of the last pass relative to a saved run."""
+    current, previous = results["passes"][-1], baseline["passes"][-1]
+    print(f"\nlast pass vs {baseline.get('commit')}: throughput {previous['throughput_per_s']} -> {current['throughput_per_s']}/s")
+    header = f"{'tool':<22} {'p50 before':>11} {'p50 now':>9} {'p95 before':>11} {'p95 now':>9}  change"
+    print(header)
+    print("-" * len(header))
+    for name, tool in current["tools"].items():
+        before = previous["tools"].get(name)
+        if before is None:
+            continue
+        change = (tool["p50_ms"] - before["p50_ms"]) / before["p50_ms"] if before["p50_ms"] else 0.0
+        print(f"{name:<22} {before['p50_ms']:>11} {tool['p50_ms']:>9} {before['p95_ms']:>11} {tool['p95_ms']:>9}  {change:+.0%}")
+
+
+def main() -> None:
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument("--concurrency", type=int, default=8, help="Tool calls in flight at once")
+    arg_parser.add_argument("--requests", type=int, default=20, help="Calls per tool per pass (scaled by tool weight)")
+    arg_parser.add_argument("--passes", type=int, default=2, help="Runs of the same schedule (the first one is cold)")
+    arg_parser.add_argument("--latency-ms", type=float, default=20.0, help="Latency the fake server adds to every response")
+    arg_parser.add_argument("--jitter-ms", type=float, default=10.0, help="Extra random latency, up to this much")
+    arg_parser.add_argument("--tools", help="Comma-separated subset of tools to run")
+    arg_parser.add_argument("--disk-cache", action="store_true", help="Enable the SQLite tier in a temporary directory")
+    arg_parser.add_argument("--keep-rate-limits", action="store_true", help="Keep the configured rate limits and prefetch delays")
+    arg_parser.add_argument("--seed", type=int, default=0)
+    arg_parser.add_argument("--json", action="store_true", help="Print machine-readable results")
+    arg_parser.add_argument("--output", help="Also write the JSON results to this file")
+    arg_parser.add_argument("--compare", help="JSON results of an earlier run to compare against")
+    args = arg_parser.parse_args()
+
+    if args.disk_cache:
+        args.disk_cache = tempfile.mkdtemp(prefix="readthedocs-bench-")
+    configure_environment(args)
+    try:
+        results = asyncio.run(run(args))
+    finally:
+        if args.disk_cache:
+            shutil.rmtree(args.disk_cache, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(results, output, indent=2)
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print_report(results)
+    if args.compare:
+        with open(args.compare) as baseline:
+            print_comparison(results, json.load(baseline))
+
+
+if __name__ == "__main__":
+    main()
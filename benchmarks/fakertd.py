@@ -0,0 +1,307 @@
+"""A local stand-in for Read the Docs, for benchmarks and load tests.
+
+Serves documentation sites built from the synthetic pages in pages.py
+(one project per theme: Sphinx with the Read the Docs theme, Furo and
+MkDocs Material), a Sphinx ``objects.inv``, an htmlzip download and the
+API v3 endpoints the server uses (projects, versions, search) with
+``next`` pagination. Every response carries an ``ETag`` and honours
+``If-None-Match``. A fixed latency plus random jitter is added to each
+request to stand in for the network.
+
+The server answers plain HTTP on 127.0.0.1 and routes by ``Host`` header,
+so clients keep using the real ``https://<project>.readthedocs.io`` URLs
+and send them here with ``LocalTransport``.
+
+Usage (standalone, e.g. to point other tools at it):
+    python benchmarks/fakertd.py [--port 8765] [--latency-ms 50]
+"""
+
+import argparse
+import functools
+import hashlib
+import io
+import json
+import random
+import threading
+import time
+import zipfile
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import httpx
+
+from pages import furo_page, mkdocs_page, sphinx_rtd_page
+
+# Project slug -> theme; 'archivedemo' is the one benchmarks ingest as an htmlzip
+PROJECTS = {
+    "sphinxdemo": "sphinx_rtd",
+    "furodemo": "furo",
+    "mkdocsdemo": "mkdocs",
+    "archivedemo": "sphinx_rtd",
+}
+VERSIONS = ["latest", "stable", "main", "3.x", "3.1.0", "3.0.0", "3.0.0rc1", "2.9.1", "2.9.0", "1.0"]
+PAGES = 30  # Documentation pages per project and version
+API_ENTRIES = 40  # API reference entries on each project's first page
+API_PAGE_SIZE = 5  # Records per API v3 page, small so listings need several pages
+GENERATORS = {"sphinx_rtd": sphinx_rtd_page, "furo": furo_page, "mkdocs": mkdocs_page}
+
+
+@functools.lru_cache(maxsize=None)
+def page_html(project: str, number: int) -> bytes:
+    """HTML of page ``number`` of a project; page 0 carries the API reference."""
+    make_page = GENERATORS[PROJECTS[project]]
+    html = make_page(sections=12, api_entries=API_ENTRIES if number == 0 else 0, nav_pages=PAGES, seed=number)
+    return html.replace("demo documentation", f"{project} documentation").encode()
+
+
+@functools.lru_cache(maxsize=None)
+def inventory(project: str) -> bytes:
+    """A Sphinx objects.inv (version 2) for a Sphinx project."""
+    lines = [f"demo.Client.method_{k} py:method 1 page0.html#$ -" for k in range(API_ENTRIES)]
+    lines.append("demo.Client py:class 1 page0.html#$ -")
+    for number in range(PAGES):
+        lines.append(f"page{number} std:doc -1 page{number}.html Page {number}")
+        lines += [f"section-{i} std:label -1 page{number}.html#$ Section {i}" for i in range(3)]
+    header = f"# Sphinx inventory version 2\n# Project: {project}\n# Version: latest\n# The remainder of this file is compressed using zlib.\n"
+    return header.encode() + zlib.compress("\n".join(lines).encode())
+
+
+@functools.lru_cache(maxsize=None)
+def htmlzip(project: str, version: str) -> bytes:
+    """A zipped multi-page HTML build, as served by the htmlzip download."""
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+        root = f"{project}-{version}"
+        archive.writestr(f"{root}/index.html", page_html(project, 0))
+        for number in range(PAGES):
+            archive.writestr(f"{root}/page{number}.html", page_html(project, number))
+        archive.writestr(f"{root}/objects.inv", inventory(project))
+    return buffer.getvalue()
+
+
+def project_record(slug: str) -> dict:
+    return {
+        "slug": slug,
+        "name": slug.replace("demo", " demo").title(),
+        "description": f"Benchmark project built with {PROJECTS[slug]}",
+        "homepage": f"https://{slug}.example.com",
+        "language": {"code": "en", "name": "English"},
+        "programming_language": {"code": "py", "name": "Python"},
+        "repository": {"url": f"https://github.com/example/{slug}", "type": "git"},
+        "default_version": "latest",
+    }
+
+
+def version_record(project: str, slug: str) -> dict:
+    identifier = {"latest": "main", "stable": "3.1.0"}.get(slug, slug)
+    return {
+        "slug": slug,
+        "verbose_name": slug,
+        "identifier": identifier,
+        "type": "branch" if slug in ("latest", "main", "3.x") else "tag",
+        "active": slug != "1.0",
+        "hidden": False,
+        "built": True,
+        "urls": {"documentation": f"https://{project}.readthedocs.io/en/{slug}/"},
+        "downloads": {"htmlzip": f"https://{project}.readthedocs.io/_/downloads/en/{slug}/htmlzip/"},
+    }
+
+
+def paginate(request_url: str, records: list, query: dict) -> dict:
+    """An API v3 list response with ``next``/``previous`` links."""
+    offset = int(query.get("offset", ["0"])[0])
+    limit = min(int(query.get("limit", [str(API_PAGE_SIZE)])[0]), API_PAGE_SIZE)
+    base = request_url.split("?")[0]
+
+    def link(at: int) -> str:
+        return f"{base}?limit={limit}&offset={at}"
+
+    return {
+        "count": len(records),
+        "next": link(offset + limit) if offset + limit < len(records) else None,
+        "previous": link(max(offset - limit, 0)) if offset else None,
+        "results": records[offset:offset + limit],
+    }
+
+
+def search_results(query: str) -> dict:
+    """Search API results: one hit per page for a term, in the shape of API v3."""
+    terms = query.split()
+    project = next((term.split(":", 1)[1] for term in terms if term.startswith("project:")), "sphinxdemo")
+    words = [term for term in terms if ":" not in term]
+    hits = [] if not words or project not in PROJECTS else [
+        {
+            "title": f"Page {number}",
+            "domain": f"https://{project}.readthedocs.io",
+            "path": f"/en/latest/page{number}.html",
+            "project": {"slug": project},
+            "version": {"slug": "latest"},
+            "blocks": [{"type": "section", "id": "section-0", "title": "Section 0",
+                        "content": f"... {' '.join(words)} ..."}],
+        }
+        for number in range(sum(map(ord, " ".join(words))) % 7, PAGES, 7)
+    ]
+    return {"count": len(hits), "next": None, "previous": None, "results": hits}
+
+
+class FakeReadTheDocs:
+    """Threaded HTTP server answering for readthedocs.org and <project>.readthedocs.io."""
+
+    def __init__(self, port: int = 0, latency: float = 0.0, jitter: float = 0.0, seed: int = 0):
+        self.latency = latency
+        self.jitter = jitter
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.stats = {"requests": 0, "not_modified": 0, "not_found": 0, "bytes_sent": 0, "by_kind": {}}
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self) -> None:
+                fake.handle(self)
+
+            def log_message(self, *args) -> None:
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        self.server.daemon_threads = True
+        self.port = self.server.server_address[1]
+        self.thread = threading.Thread(target=self.server.serve_forever, name="fakertd", daemon=True)
+
+    def start(self) -> "FakeReadTheDocs":
+        self.thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+    def route(self, host: str, url: str) -> tuple[str, int, str, bytes]:
+        """Return (kind, status, content type, body) for a request.
+
+        For redirects the content type slot carries the Location instead.
+        """
+        parts = urlsplit(url)
+        path, query = parts.path, parse_qs(parts.query)
+        full_url = f"https://{host}{url}"
+        if host == "readthedocs.org":
+            segments = [segment for segment in path.split("/") if segment]
+            if segments[:2] != ["api", "v3"]:
+                return "other", 404, "text/plain", b"not found"
+            rest = segments[2:]
+            if rest == ["search"]:
+                return "api_search", 200, "application/json", json.dumps(search_results(query.get("q", [""])[0])).encode()
+            if rest == ["projects"]:
+                body = paginate(full_url, [project_record(slug) for slug in PROJECTS], query)
+                return "api_projects", 200, "application/json", json.dumps(body).encode()
+            if len(rest) >= 2 and rest[0] == "projects" and rest[1] in PROJECTS:
+                project = rest[1]
+                if len(rest) == 2:
+                    return "api_project", 200, "application/json", json.dumps(project_record(project)).encode()
+                if rest[2] == "versions" and len(rest) == 3:
+                    body = paginate(full_url, [version_record(project, slug) for slug in VERSIONS], query)
+                    return "api_versions", 200, "application/json", json.dumps(body).encode()
+                if rest[2] == "versions" and len(rest) == 4 and rest[3] in VERSIONS:
+                    return "api_version", 200, "application/json", json.dumps(version_record(project, rest[3])).encode()
+            return "api_other", 404, "application/json", b'{"detail": "Not found."}'
+
+        project = host.split(".")[0]
+        if project not in PROJECTS or not host.endswith(".readthedocs.io"):
+            return "other", 404, "text/plain", b"not found"
+        segments = [segment for segment in path.split("/") if segment]
+        if segments[:2] == ["_", "downloads"] and segments[-1] == "htmlzip":
+            return "htmlzip", 200, "application/zip", htmlzip(project, segments[3])
+        if segments and segments[0] in VERSIONS:
+            # Like Read the Docs, send version URLs without a language to the default one
+            return "redirect", 302, f"https://{host}/en{url}", b""
+        if len(segments) < 2 or segments[0] != "en" or segments[1] not in VERSIONS:
+            return "other", 404, "text/html", b"<html><body>Not found</body></html>"
+        rest = segments[2:]
+        mkdocs = PROJECTS[project] == "mkdocs"
+        if rest == ["objects.inv"] and not mkdocs:
+            return "inventory", 200, "application/octet-stream", inventory(project)
+        if mkdocs and not rest:
+            # MkDocs pages link to their siblings as '../pageN/', so start from the first page
+            return "redirect", 302, f"https://{host}/en/{segments[1]}/page0/", b""
+        name = rest[0] if rest else "index.html"
+        number = None
+        if name == "index.html" and len(rest) <= 1:
+            number = 0
+        elif mkdocs and name.startswith("page") and name[4:].isdigit() and (len(rest) == 1 or rest[1:] == ["index.html"]):
+            number = int(name[4:])
+        elif not mkdocs and name.startswith("page") and name.endswith(".html") and name[4:-5].isdigit() and len(rest) == 1:
+            number = int(name[4:-5])
+        if number is None or number >= PAGES:
+            return "other", 404, "text/html", b"<html><body>Not found</body></html>"
+        return "page", 200, "text/html; charset=utf-8", page_html(project, number)
+
+    def handle(self, handler: BaseHTTPRequestHandler) -> None:
+        host = (handler.headers.get("Host") or "").split(":")[0]
+        kind, status, content_type, body = self.route(host, handler.path)
+        etag = '"' + hashlib.md5(body).hexdigest() + '"'
+        if status == 200 and handler.headers.get("If-None-Match") == etag:
+            status, body = 304, b""
+        with self.lock:
+            delay = self.latency + (self.rng.uniform(0, self.jitter) if self.jitter else 0.0)
+            self.stats["requests"] += 1
+            self.stats["by_kind"][kind] = self.stats["by_kind"].get(kind, 0) + 1
+            self.stats["bytes_sent"] += len(body)
+            if status == 304:
+                self.stats["not_modified"] += 1
+            elif status == 404:
+                self.stats["not_found"] += 1
+        if delay:
+            time.sleep(delay)
+        handler.send_response(status)
+        if status == 302:
+            handler.send_header("Location", content_type)
+            content_type = "text/plain"
+        handler.send_header("Content-Type", content_type)
+        handler.send_header("Content-Length", str(len(body)))
+        handler.send_header("ETag", etag)
+        handler.end_headers()
+        try:
+            handler.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            # The client went away, e.g. a server process exiting with background fetches in flight
+            pass
+
+
+class LocalTransport(httpx.AsyncBaseTransport):
+    """Send every request to the fake server, keeping the original Host header."""
+
+    def __init__(self, port: int, limits: httpx.Limits):
+        self.port = port
+        self.inner = httpx.AsyncHTTPTransport(limits=limits)
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        # Only the connection is redirected; responses and redirects still see the real URL
+        original = request.url
+        request.url = original.copy_with(scheme="http", host="127.0.0.1", port=self.port)
+        try:
+            return await self.inner.handle_async_request(request)
+        finally:
+            request.url = original
+
+    async def aclose(self) -> None:
+        await self.inner.aclose()
+
+
+def main() -> None:
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument("--port", type=int, default=8765)
+    arg_parser.add_argument("--latency-ms", type=float, default=0.0, help="Delay added to every response")
+    arg_parser.add_argument("--jitter-ms", type=float, default=0.0, help="Extra random delay, up to this much")
+    args = arg_parser.parse_args()
+    fake = FakeReadTheDocs(args.port, args.latency_ms / 1000, args.jitter_ms / 1000).start()
+    print(f"Serving on http://127.0.0.1:{fake.port} (send requests with the real Host header)")
+    try:
+        fake.thread.join()
+    except KeyboardInterrupt:
+        fake.stop()
+
+
+if __name__ == "__main__":
+    main()
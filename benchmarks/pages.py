@@ -0,0 +1,173 @@
+"""Synthetic documentation pages shaped like real Read the Docs builds.
+
+The generators reproduce the element structure of the themes the server
+has to handle (Sphinx with the Read the Docs theme, Furo and MkDocs
+Material): sidebars full of links, breadcrumbs, header links, highlighted
+code blocks and API reference entries. Page size is controlled by the
+number of sections so benchmarks can scale from a tutorial page to a
+multi-megabyte API reference.
+"""
+
+import random
+
+WORDS = (
+    "request response session client server connection timeout retry cache "
+    "header cookie stream upload download proxy certificate redirect encoding "
+    "parameter argument return value default optional instance method attribute"
+).split()
+
+
+def prose(rng: random.Random, sentences: int) -> str:
+    """Return a paragraph of plausible-looking documentation text."""
+    out = []
+    for _ in range(sentences):
+        words = [rng.choice(WORDS) for _ in range(rng.randint(8, 18))]
+        out.append(" ".join(words).capitalize() + ".")
+    return " ".join(out)
+
+
+def sphinx_body(rng: random.Random, title: str, sections: int, api_entries: int) -> tuple[str, list[str]]:
+    """Return Sphinx article HTML and the section ids it contains."""
+    slug = title.lower().replace(" ", "-")
+    ids = [slug]
+    parts = [f'<section id="{slug}"><h1>{title}<a class="headerlink" href="#{slug}" title="Link to this heading">¶</a></h1>']
+    parts.append(f"<p>{prose(rng, 3)}</p>")
+    for i in range(sections):
+        sid = f"section-{i}"
+        ids.append(sid)
+        parts.append(f'<section id="{sid}"><h2>Section {i}<a class="headerlink" href="#{sid}">¶</a></h2>')
+        parts.append(f'<p>{prose(rng, 5)} See <a class="reference internal" href="#section-{max(i - 1, 0)}">'
+                     f'<span class="std std-ref">Section {max(i - 1, 0)}</span></a>.</p>')
+        parts.append('<div class="highlight-python notranslate"><div class="highlight"><pre><span></span>'
+                     f'<span class="kn">import</span> <span class="nn">demo</span>\n'
+                     f'<span class="n">demo</span><span class="o">.</span><span class="n">run</span>'
+                     f'<span class="p">(</span><span class="mi">{i}</span><span class="p">)</span>\n</pre></div></div>')
+        for j in range(2):
+            sub = f"subsection-{i}-{j}"
+            ids.append(sub)
+            parts.append(f'<section id="{sub}"><h3>Subsection {i}.{j}<a class="headerlink" href="#{sub}">¶</a></h3>'
+                         f'<p>{prose(rng, 4)}</p><ul class="simple"><li><p>{prose(rng, 1)}</p></li>'
+                         f'<li><p>{prose(rng, 1)}</p></li></ul></section>')
+        parts.append("</section>")
+    for k in range(api_entries):
+        name = f"demo.Client.method_{k}"
+        ids.append(name)
+        parts.append(f'<dl class="py method"><dt class="sig sig-object py" id="{name}">'
+                     f'<span class="sig-name descname"><span class="pre">method_{k}</span></span>'
+                     f'<span class="sig-paren">(</span><em class="sig-param"><span class="n"><span class="pre">url</span>'
+                     f'</span></em><span class="sig-paren">)</span><a class="headerlink" href="#{name}">¶</a></dt>'
+                     f'<dd><p>{prose(rng, 2)}</p><dl class="field-list simple"><dt class="field-odd">Parameters<span class="colon">:</span></dt>'
+                     f'<dd class="field-odd"><p><strong>url</strong> – {prose(rng, 1)}</p></dd></dl></dd></dl>')
+    parts.append("</section>")
+    return "".join(parts), ids
+
+
+def sidebar_links(pages: int) -> str:
+    """Return a nested toctree-style sidebar list."""
+    items = []
+    for i in range(pages):
+        children = "".join(
+            f'<li class="toctree-l2"><a class="reference internal" href="page{i}.html#part-{j}">Part {i}.{j}</a></li>'
+            for j in range(4)
+        )
+        items.append(f'<li class="toctree-l1"><a class="reference internal" href="page{i}.html">Page {i}</a><ul>{children}</ul></li>')
+    return f'<ul class="current">{"".join(items)}</ul>'
+
+
+def sphinx_rtd_page(sections: int = 20, api_entries: int = 0, nav_pages: int = 40, seed: int = 0) -> str:
+    """A Sphinx page built with sphinx_rtd_theme."""
+    rng = random.Random(seed)
+    article, _ = sphinx_body(rng, "Quickstart", sections, api_entries)
+    return (
+        '<!DOCTYPE html><html class="writer-html5" lang="en"><head><meta charset="utf-8"/>'
+        '<title>Quickstart — demo documentation</title><link rel="stylesheet" href="_static/css/theme.css"/>'
+        '<script src="_static/jquery.js"></script></head><body class="wy-body-for-nav">'
+        '<div class="wy-grid-for-nav"><nav data-toggle="wy-nav-shift" class="wy-nav-side"><div class="wy-side-scroll">'
+        '<div class="wy-side-nav-search"><a href="index.html" class="icon icon-home">demo</a>'
+        '<div role="search"><form id="rtd-search-form" class="wy-form" action="search.html" method="get">'
+        '<input type="text" name="q" placeholder="Search docs"/></form></div></div>'
+        f'<div class="wy-menu wy-menu-vertical" data-spy="affix" role="navigation" aria-label="Navigation menu">'
+        f'<p class="caption" role="heading"><span class="caption-text">Contents:</span></p>{sidebar_links(nav_pages)}</div>'
+        '</div></nav><section data-toggle="wy-nav-shift" class="wy-nav-content-wrap">'
+        '<nav class="wy-nav-top" aria-label="Mobile navigation menu"><i data-toggle="wy-nav-top" class="fa fa-bars"></i>'
+        '<a href="index.html">demo</a></nav><div class="wy-nav-content"><div class="rst-content">'
+        '<div role="navigation" aria-label="Page navigation"><ul class="wy-breadcrumbs"><li><a href="index.html" class="icon icon-home"></a></li>'
+        '<li class="breadcrumb-item active">Quickstart</li></ul><hr/></div>'
+        '<div role="main" class="document" itemscope="itemscope" itemtype="http://schema.org/Article">'
+        f'<div itemprop="articleBody">{article}</div></div>'
+        '<footer><div class="rst-footer-buttons" role="navigation" aria-label="Footer">'
+        '<a href="index.html" class="btn btn-neutral float-left" rel="prev">Previous</a>'
+        '<a href="api.html" class="btn btn-neutral float-right" rel="next">Next</a></div><hr/>'
+        '<div role="contentinfo"><p>© Copyright 2024.</p></div>Built with Sphinx.</footer>'
+        '</div></div></section></div><script>jQuery(function () { SphinxRtdTheme.Navigation.enable(true); });</script>'
+        '</body></html>'
+    )
+
+
+def furo_page(sections: int = 20, api_entries: int = 0, nav_pages: int = 40, seed: int = 0) -> str:
+    """A Sphinx page built with the Furo theme."""
+    rng = random.Random(seed)
+    article, ids = sphinx_body(rng, "Quickstart", sections, api_entries)
+    toc = "".join(f'<li><a class="reference internal" href="#{sid}">{sid}</a></li>' for sid in ids[:200])
+    return (
+        '<!doctype html><html class="no-js" lang="en"><head><meta charset="utf-8"/>'
+        '<title>Quickstart - demo documentation</title><link rel="stylesheet" href="_static/styles/furo.css"/></head>'
+        '<body><svg xmlns="http://www.w3.org/2000/svg" style="display: none;"><symbol id="svg-toc"><title>Contents</title></symbol></svg>'
+        '<input type="checkbox" class="sidebar-toggle" name="__navigation" id="__navigation">'
+        '<div class="page"><header class="mobile-header"><div class="header-center"><a href="index.html"><div class="brand">demo</div></a></div></header>'
+        '<aside class="sidebar-drawer"><div class="sidebar-container"><div class="sidebar-sticky">'
+        '<a class="sidebar-brand" href="index.html"><span class="sidebar-brand-text">demo</span></a>'
+        '<form class="sidebar-search-container" method="get" action="search.html" role="search"><input class="sidebar-search" name="q"></form>'
+        f'<div class="sidebar-scroll"><div class="sidebar-tree">{sidebar_links(nav_pages)}</div></div></div></div></aside>'
+        '<div class="main"><div class="content"><div class="article-container">'
+        f'<article role="main" id="furo-main-content">{article}</article></div>'
+        '<footer><div class="related-pages"><a class="next-page" href="api.html"><div class="page-info">'
+        '<div class="context"><span>Next</span></div><div class="title">API reference</div></div></a></div>'
+        '<div class="bottom-of-page"><div class="left-details"><div class="copyright">Copyright © 2024</div>'
+        'Made with <a href="https://www.sphinx-doc.org/">Sphinx</a> and <a href="https://github.com/pradyunsg/furo">Furo</a></div></div></footer>'
+        '</div><aside class="toc-drawer"><div class="toc-sticky toc-scroll"><div class="toc-tree-container">'
+        f'<div class="toc-tree"><ul>{toc}</ul></div></div></div></aside></div></div>'
+        '<script src="_static/scripts/furo.js"></script></body></html>'
+    )
+
+
+def mkdocs_page(sections: int = 20, api_entries: int = 0, nav_pages: int = 40, seed: int = 0) -> str:
+    """A page built with MkDocs and the Material theme."""
+    rng = random.Random(seed)
+    parts = ['<h1 id="quickstart">Quickstart</h1>', f"<p>{prose(rng, 3)}</p>"]
+    for i in range(sections):
+        parts.append(f'<h2 id="section-{i}">Section {i}<a class="headerlink" href="#section-{i}" title="Permanent link">¶</a></h2>')
+        parts.append(f"<p>{prose(rng, 5)} See <a href=\"#section-{max(i - 1, 0)}\">Section {max(i - 1, 0)}</a>.</p>")
+        parts.append(f'<div class="highlight"><pre><span></span><code>import demo\ndemo.run({i})\n</code></pre></div>')
+        for j in range(2):
+            parts.append(f'<h3 id="subsection-{i}-{j}">Subsection {i}.{j}<a class="headerlink" href="#subsection-{i}-{j}">¶</a></h3>'
+                         f"<p>{prose(rng, 4)}</p><ul><li>{prose(rng, 1)}</li><li>{prose(rng, 1)}</li></ul>")
+    for k in range(api_entries):
+        parts.append(f'<div class="doc doc-object doc-function"><h3 id="demo.Client.method_{k}" class="doc doc-heading">'
+                     f'<code>method_{k}(url)</code></h3><div class="doc doc-contents"><p>{prose(rng, 2)}</p></div></div>')
+    nav = "".join(
+        f'<li class="md-nav__item"><a href="../page{i}/" class="md-nav__link">Page {i}</a></li>' for i in range(nav_pages)
+    )
+    return (
+        '<!doctype html><html lang="en" class="no-js"><head><meta charset="utf-8">'
+        '<title>Quickstart - demo</title><link rel="stylesheet" href="../assets/stylesheets/main.css"></head>'
+        '<body dir="ltr"><input class="md-toggle" data-md-toggle="drawer" type="checkbox" id="__drawer">'
+        '<header class="md-header" data-md-component="header"><nav class="md-header__inner md-grid" aria-label="Header">'
+        '<a href=".." title="demo" class="md-header__button md-logo">demo</a></nav></header>'
+        '<div class="md-container" data-md-component="container"><main class="md-main" data-md-component="main">'
+        '<div class="md-main__inner md-grid"><div class="md-sidebar md-sidebar--primary" data-md-component="sidebar" data-md-type="navigation">'
+        f'<div class="md-sidebar__scrollwrap"><div class="md-sidebar__inner"><nav class="md-nav md-nav--primary" aria-label="Navigation">'
+        f'<ul class="md-nav__list" data-md-scrollfix>{nav}</ul></nav></div></div></div>'
+        '<div class="md-content" data-md-component="content"><article class="md-content__inner md-typeset">'
+        f'{"".join(parts)}</article></div></div></main>'
+        '<footer class="md-footer"><div class="md-footer-meta md-typeset"><div class="md-copyright">'
+        'Made with <a href="https://squidfunk.github.io/mkdocs-material/">Material for MkDocs</a></div></div></footer>'
+        '</div><script src="../assets/javascripts/bundle.js"></script></body></html>'
+    )
+
+
+THEMES = {
+    "sphinx_rtd": sphinx_rtd_page,
+    "furo": furo_page,
+    "mkdocs": mkdocs_page,
+}
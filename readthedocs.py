@@ -1,20 +1,227 @@
-from typing import Any, List, Optional
+from typing import TYPE_CHECKING, Any, AsyncIterator, Awaitable, Callable, Iterator, List, Optional, TypeVar
+from collections import Counter, OrderedDict
+from concurrent.futures import Executor, ThreadPoolExecutor
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
 import httpx
 import asyncio
+import bisect
+import copy
+import hashlib
+import importlib
+import importlib.util
+import itertools
+import email.utils
+import functools
+import io
+import json
+import logging
+import math
+import mmap
+import re
 import sys
 import os
-from bs4 import BeautifulSoup
+import random
+import shutil
+import tempfile
+import threading
+import time
+import zipfile
+import zlib
+from html.parser import HTMLParser
 from mcp.server.fastmcp import FastMCP
-import traceback
+from mcp.server.transport_security import TransportSecuritySettings
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import PlainTextResponse, Response
 
-# Initialize FastMCP server
-mcp = FastMCP("readthedocs")
+if TYPE_CHECKING:
+    # Imported on first use (see walk_content), so spawning the server does not load them
+    from bs4 import BeautifulSoup, Tag
+    # Likewise for the disk tier (DiskCache._connect)
+    import sqlite3
 
 # Constants
 READTHEDOCS_API_BASE = "https://readthedocs.org/api/v3"
 USER_AGENT = "readthedocs-mcp/1.0"
 CACHE_TTL = 3600  # Cache time to live in seconds
 
+# In-memory cache budget and per-namespace time to live (seconds)
+CACHE_MAX_BYTES = int(os.environ.get("READTHEDOCS_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+CACHE_TTLS = {
+    "api": int(os.environ.get("READTHEDOCS_CACHE_TTL_API", str(CACHE_TTL))),
+    "page": int(os.environ.get("READTHEDOCS_CACHE_TTL_PAGE", str(CACHE_TTL))),
+    "toc": int(os.environ.get("READTHEDOCS_CACHE_TTL_TOC", str(CACHE_TTL))),
+    "search": int(os.environ.get("READTHEDOCS_CACHE_TTL_SEARCH", "600")),
+    "metadata": int(os.environ.get("READTHEDOCS_CACHE_TTL_METADATA", str(CACHE_TTL))),
+    # Symbol indexes (objects.inv), and how long a project without one is not asked again
+    "inventory": int(os.environ.get("READTHEDOCS_CACHE_TTL_INVENTORY", str(CACHE_TTL))),
+}
+
+# Optional persistent cache tier; disabled unless a directory is configured
+DISK_CACHE_DIR = os.environ.get("READTHEDOCS_CACHE_DIR")
+# Rows kept in the SQLite tier; the least recently fetched are deleted beyond this (0 for no limit)
+DISK_CACHE_MAX_ROWS = int(os.environ.get("READTHEDOCS_CACHE_MAX_ROWS", "20000"))
+# Alternative persistent tier as 'module:factory'; the factory gets DISK_CACHE_DIR
+CACHE_BACKEND = os.environ.get("READTHEDOCS_CACHE_BACKEND")
+# Save listings and symbol indexes to the disk tier on shutdown and restore them,
+# in the background, on the next start
+WARM_START = os.environ.get("READTHEDOCS_WARM_START", "1") != "0"
+
+# Offline documentation archives (htmlzip builds) ingested with ingest_docs;
+# kept under the cache directory by default so they survive restarts
+DOCS_DIR = os.environ.get("READTHEDOCS_DOCS_DIR") or (os.path.join(DISK_CACHE_DIR, "archives") if DISK_CACHE_DIR else None)
+# Project and version slugs allowed in archive paths
+SLUG_PATTERN = re.compile(r"[A-Za-z0-9][A-Za-z0-9_.-]*")
+# Hosts ingest_docs may download archives from (and their subdomains)
+ARCHIVE_HOSTS = ("readthedocs.io", "readthedocs.org", "readthedocs-hosted.com")
+# Largest archive download accepted, in bytes
+ARCHIVE_MAX_BYTES = int(os.environ.get("READTHEDOCS_ARCHIVE_MAX_BYTES", str(512 * 1024 * 1024)))
+# Archives kept loaded; stored ones dropped beyond this are loaded again on use
+MAX_LOADED_ARCHIVES = int(os.environ.get("READTHEDOCS_MAX_LOADED_ARCHIVES", "8"))
+# Symbol indexes (one per project version) kept in memory
+MAX_SYMBOL_INDEXES = int(os.environ.get("READTHEDOCS_MAX_SYMBOL_INDEXES", "64"))
+
+# Project and version listings walked page by page from API v3
+METADATA_PAGE_SIZE = 100  # Records requested per API page
+METADATA_MAX_PAGES = int(os.environ.get("READTHEDOCS_METADATA_MAX_PAGES", "50"))
+METADATA_MAX_LISTINGS = int(os.environ.get("READTHEDOCS_METADATA_MAX_LISTINGS", "256"))  # Kept in memory
+
+# Local full-text search index (BM25) built from fetched pages
+LOCAL_SEARCH_ENABLED = os.environ.get("READTHEDOCS_LOCAL_SEARCH", "1") != "0"
+# In 'auto' mode, answer locally only once this many pages of a project are indexed
+LOCAL_SEARCH_MIN_PAGES = int(os.environ.get("READTHEDOCS_LOCAL_SEARCH_MIN_PAGES", "10"))
+SEARCH_SOURCES = ("auto", "local", "remote")  # Accepted values of search_docs' source
+BM25_K1 = 1.2
+BM25_B = 0.75
+TITLE_WEIGHT = 3  # Heading terms count this many times towards term frequency
+EXCERPT_CHARS = 600  # Section text kept per indexed section for result excerpts
+# Indexes kept in memory; least recently used projects are dropped beyond either limit
+LOCAL_SEARCH_MAX_PROJECTS = int(os.environ.get("READTHEDOCS_LOCAL_SEARCH_MAX_PROJECTS", "50"))
+LOCAL_SEARCH_MAX_DOCUMENTS = int(os.environ.get("READTHEDOCS_LOCAL_SEARCH_MAX_DOCUMENTS", "50000"))
+
+# Pages larger than this (characters of HTML) are parsed incrementally while
+# downloading, and downloads stop after the byte budget
+STREAM_THRESHOLD = int(os.environ.get("READTHEDOCS_STREAM_THRESHOLD", str(1024 * 1024)))
+STREAM_MAX_BYTES = int(os.environ.get("READTHEDOCS_STREAM_MAX_BYTES", str(32 * 1024 * 1024)))
+STREAM_FEED_CHARS = 64 * 1024  # Parser input is batched to at least this size
+
+# Batch tools (get_pages, search_docs_multi): items in flight at once, and items per call
+BATCH_CONCURRENCY = int(os.environ.get("READTHEDOCS_BATCH_CONCURRENCY", "8"))
+BATCH_MAX_ITEMS = int(os.environ.get("READTHEDOCS_BATCH_MAX_ITEMS", "50"))
+
+# Reply formats for the content tools: the descriptive default, a terse one, Markdown and JSON
+OUTPUT_FORMATS = ("text", "compact", "markdown", "json")
+OUTPUT_FORMAT = os.environ.get("READTHEDOCS_OUTPUT_FORMAT", "text")
+CHARS_PER_TOKEN = 4  # Rough characters per token, for max_tokens budgets
+MIN_BUDGET_CHARS = 200  # Smallest budget honoured, so a reply keeps its heading and notes
+MIN_PAGE_BUDGET_CHARS = 600  # Smallest share of a get_pages budget per page: its notes and some text
+
+# Background prefetching of a project's pages (prefetch_project tool / CLI)
+PREFETCH_CONCURRENCY = int(os.environ.get("READTHEDOCS_PREFETCH_CONCURRENCY", "4"))
+PREFETCH_MAX_PAGES = int(os.environ.get("READTHEDOCS_PREFETCH_MAX_PAGES", "200"))
+# Politeness delay between requests to the same host, and a requests/second cap
+PREFETCH_DELAY = float(os.environ.get("READTHEDOCS_PREFETCH_DELAY", "0.25"))
+PREFETCH_RATE = float(os.environ.get("READTHEDOCS_PREFETCH_RATE", "4.0"))
+
+# Log level for stderr output (stdout carries the MCP protocol); DEBUG traces every fetch
+LOG_LEVEL = os.environ.get("READTHEDOCS_LOG_LEVEL", "WARNING").upper()
+# Optional Prometheus text endpoint (e.g. 9464); disabled when unset
+METRICS_PORT = int(os.environ.get("READTHEDOCS_METRICS_PORT", "0"))
+METRICS_HOST = os.environ.get("READTHEDOCS_METRICS_HOST", "127.0.0.1")
+
+# How `serve` talks to clients: stdio (one client per process), streamable-http or sse
+TRANSPORT = os.environ.get("READTHEDOCS_TRANSPORT", "stdio")
+SERVER_HOST = os.environ.get("READTHEDOCS_HOST", "127.0.0.1")
+SERVER_PORT = int(os.environ.get("READTHEDOCS_PORT", "8080"))
+# Worker processes for the HTTP transports; they share the disk cache and archives
+SERVER_WORKERS = int(os.environ.get("READTHEDOCS_WORKERS", "1"))
+# Open HTTP connections per worker before new ones get 503 (0 = unlimited)
+SERVER_MAX_CONNECTIONS = int(os.environ.get("READTHEDOCS_SERVER_MAX_CONNECTIONS", "0"))
+# Tool calls running at once per process; further calls wait for a slot
+MAX_CONCURRENT_CALLS = int(os.environ.get("READTHEDOCS_MAX_CONCURRENT_CALLS", "32"))
+# Streamable HTTP without server-side sessions, so any worker can answer any request;
+# always on with several workers
+STATELESS_HTTP = os.environ.get("READTHEDOCS_STATELESS_HTTP", "0") == "1" or SERVER_WORKERS > 1
+# Host headers accepted over HTTP (comma separated, e.g. 'docs.internal:*'); loopback hosts by default
+ALLOWED_HOSTS = [host.strip() for host in os.environ.get("READTHEDOCS_ALLOWED_HOSTS", "").split(",") if host.strip()]
+
+logger = logging.getLogger("readthedocs")
+if not logger.handlers:
+    log_handler = logging.StreamHandler(sys.stderr)
+    log_handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(message)s"))
+    logger.addHandler(log_handler)
+    logger.propagate = False
+logger.setLevel(LOG_LEVEL)
+
+# HTML extraction: parser backend ('auto', 'lxml', 'html.parser' or 'selectolax')
+# and the worker pool that runs it ('thread', 'process' or 'inline')
+def resolve_html_parser(name: str) -> str:
+    """Pick the parser backend, falling back when an optional one is missing."""
+    if name == "auto":
+        return "lxml" if importlib.util.find_spec("lxml") is not None else "html.parser"
+    if name in ("lxml", "selectolax") and importlib.util.find_spec(name) is None:
+        logger.warning("HTML parser '%s' is not installed. Using html.parser.", name)
+        return "html.parser"
+    return name
+
+HTML_PARSER = resolve_html_parser(os.environ.get("READTHEDOCS_HTML_PARSER", "auto"))
+EXTRACT_POOL = os.environ.get("READTHEDOCS_EXTRACT_POOL", "thread")
+EXTRACT_WORKERS = int(os.environ.get("READTHEDOCS_EXTRACT_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+# Candidates whose text is mostly link text are treated as navigation
+MAX_LINK_DENSITY = 0.75
+
+# Heading tags and their outline level, for the per-page section index
+HEADING_LEVELS = {f"h{level}": level for level in range(1, 7)}
+
+# Characters themes use for heading permalinks (pilcrow, hash, Font Awesome link icon)
+PERMALINK_MARKERS = "¶#\uf0c1"
+
+# Common content selectors in different themes, tried in order
+CONTENT_SELECTORS = [
+    ('div', {'role': 'main'}),
+    ('div', {'class': 'document'}),
+    ('div', {'class': 'rst-content'}),
+    ('article', {'role': 'main'}),
+    ('main', {}),
+    ('div', {'class': 'section'}),
+    ('div', {'id': 'content'}),
+    ('div', {'class': 'content'}),
+]
+
+# Table of contents containers for different themes, tried in order
+TOC_SELECTORS = [
+    ('div', {'class': 'toctree-wrapper'}),
+    ('nav', {'class': 'toc'}),
+    ('div', {'class': 'sphinxsidebarwrapper'}),
+    ('div', {'class': 'sidebar-tree'}),
+]
+
+# HTTP connection pool settings (limits apply to each upstream host's pool)
+HTTP_TIMEOUT = float(os.environ.get("READTHEDOCS_HTTP_TIMEOUT", "10.0"))
+HTTP_MAX_CONNECTIONS = int(os.environ.get("READTHEDOCS_HTTP_MAX_CONNECTIONS", "20"))
+HTTP_MAX_KEEPALIVE = int(os.environ.get("READTHEDOCS_HTTP_MAX_KEEPALIVE", "10"))
+HTTP_KEEPALIVE_EXPIRY = float(os.environ.get("READTHEDOCS_HTTP_KEEPALIVE_EXPIRY", "60.0"))
+# HTTP/2 needs the optional 'h2' package (pip install httpx[http2])
+HTTP2_ENABLED = (
+    os.environ.get("READTHEDOCS_HTTP2", "1") != "0"
+    and importlib.util.find_spec("h2") is not None
+)
+
+# Outgoing request scheduling: token buckets per host and per API token
+RATE_LIMIT_HOST = float(os.environ.get("READTHEDOCS_RATE_LIMIT", "10.0"))  # requests/second
+RATE_LIMIT_BURST = int(os.environ.get("READTHEDOCS_RATE_BURST", "20"))
+RATE_LIMIT_TOKEN = float(os.environ.get("READTHEDOCS_TOKEN_RATE_LIMIT", "5.0"))
+# Retries for GETs that fail with a transport error, 429 or 502/503/504
+HTTP_RETRIES = int(os.environ.get("READTHEDOCS_HTTP_RETRIES", "3"))
+BACKOFF_BASE = float(os.environ.get("READTHEDOCS_BACKOFF_BASE", "0.5"))
+BACKOFF_MAX = float(os.environ.get("READTHEDOCS_BACKOFF_MAX", "30.0"))
+RETRY_STATUSES = {429, 502, 503, 504}
+# Stop calling a host after this many consecutive failures, for the cooldown period
+CIRCUIT_THRESHOLD = int(os.environ.get("READTHEDOCS_CIRCUIT_THRESHOLD", "5"))
+CIRCUIT_COOLDOWN = float(os.environ.get("READTHEDOCS_CIRCUIT_COOLDOWN", "30.0"))
+
 # Get API token from environment or set directly
 # Either:
 # 1. Set API_TOKEN directly here:
@@ -23,126 +230,3450 @@ CACHE_TTL = 3600  # Cache time to live in seconds
 # 2. Or use environment variable (recommended):
 API_TOKEN = os.environ.get("READTHEDOCS_TOKEN")
 
-# Simple in-memory cache
-cache = {}
+def estimate_size(value: Any) -> int:
+    """Roughly estimate the memory footprint of a cached value in bytes."""
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(estimate_size(k) + estimate_size(v) for k, v in value.items())
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        size += sum(estimate_size(item) for item in value)
+    return size
+
+class ResponseCache:
+    """Size-bounded LRU cache with a separate time to live per namespace.
+
+    Entries are keyed by ``(namespace, key)``. When the total estimated size
+    exceeds ``max_bytes`` the least recently used entries are evicted, and
+    expired entries are dropped on lookup and by a periodic sweep. Expiry
+    uses ``time.monotonic()`` so it does not depend on a running event loop.
+    """
+
+    SWEEP_INTERVAL = 256  # Sweep expired entries every N insertions
+
+    def __init__(self, max_bytes: int, ttls: dict[str, int], default_ttl: int = CACHE_TTL):
+        self.max_bytes = max_bytes
+        self.ttls = ttls
+        self.default_ttl = default_ttl
+        self.current_bytes = 0
+        self._entries: OrderedDict[tuple[str, str], tuple[Any, float, int]] = OrderedDict()
+        self._inserts = 0
+        self._stats: dict[str, dict[str, int]] = {}
+
+    def _namespace_stats(self, namespace: str) -> dict[str, int]:
+        if namespace not in self._stats:
+            self._stats[namespace] = {"hits": 0, "misses": 0, "evictions": 0, "expirations": 0}
+        return self._stats[namespace]
+
+    def _remove(self, entry_key: tuple[str, str]) -> None:
+        _, _, size = self._entries.pop(entry_key)
+        self.current_bytes -= size
+
+    def get(self, namespace: str, key: str, count_miss: bool = True) -> Any | None:
+        """Return a cached value, or None if it is missing or expired.
+
+        With ``count_miss=False`` a miss is not counted, for callers probing
+        several keys for one lookup (they call record_miss once instead).
+        """
+        stats = self._namespace_stats(namespace)
+        entry_key = (namespace, key)
+        entry = self._entries.get(entry_key)
+        if entry is None:
+            stats["misses"] += count_miss
+            return None
+        value, expires, _ = entry
+        if expires <= time.monotonic():
+            self._remove(entry_key)
+            stats["expirations"] += 1
+            stats["misses"] += count_miss
+            return None
+        self._entries.move_to_end(entry_key)
+        stats["hits"] += 1
+        return value
+
+    def record_miss(self, namespace: str) -> None:
+        self._namespace_stats(namespace)["misses"] += 1
+
+    def set(self, namespace: str, key: str, value: Any, ttl: Optional[int] = None) -> None:
+        """Store a value, evicting least recently used entries to stay in budget."""
+        size = estimate_size(value)
+        if size > self.max_bytes:
+            # Never let a single oversized value flush the whole cache
+            return
+        entry_key = (namespace, key)
+        if entry_key in self._entries:
+            self._remove(entry_key)
+        if ttl is None:
+            ttl = self.ttls.get(namespace, self.default_ttl)
+        self._entries[entry_key] = (value, time.monotonic() + ttl, size)
+        self.current_bytes += size
+
+        self._inserts += 1
+        if self._inserts % self.SWEEP_INTERVAL == 0:
+            self.purge_expired()
+
+        while self.current_bytes > self.max_bytes and self._entries:
+            evicted_key = next(iter(self._entries))
+            self._remove(evicted_key)
+            self._namespace_stats(evicted_key[0])["evictions"] += 1
+
+    def delete(self, namespace: str, key: str) -> None:
+        """Remove an entry if present."""
+        if (namespace, key) in self._entries:
+            self._remove((namespace, key))
+
+    def purge_expired(self) -> int:
+        """Drop every expired entry and return how many were removed."""
+        now = time.monotonic()
+        expired = [k for k, (_, expires, _) in self._entries.items() if expires <= now]
+        for entry_key in expired:
+            self._remove(entry_key)
+            self._namespace_stats(entry_key[0])["expirations"] += 1
+        return len(expired)
+
+    def clear(self) -> None:
+        """Remove all entries (counters are kept)."""
+        self._entries.clear()
+        self.current_bytes = 0
+
+    def stats(self) -> dict[str, Any]:
+        """Return size and per-namespace hit/miss/eviction counters."""
+        entries: dict[str, int] = {}
+        for namespace, _ in self._entries:
+            entries[namespace] = entries.get(namespace, 0) + 1
+        return {
+            "max_bytes": self.max_bytes,
+            "current_bytes": self.current_bytes,
+            "entries": len(self._entries),
+            "namespaces": {
+                namespace: {**counters, "entries": entries.get(namespace, 0)}
+                for namespace, counters in self._stats.items()
+            },
+        }
+
+class LRUDict(OrderedDict):
+    """Dict holding at most ``max_items`` entries, dropping the least recently used.
+
+    get() and assignment count as use. With ``weight`` the summed weight of
+    the values is also kept within ``max_weight``; call evict() after a
+    stored value grows. ``on_evict`` receives each dropped value (e.g. to
+    close it). The most recently used entry is never dropped.
+    """
+
+    def __init__(self, max_items: int, weight: Optional[Callable[[Any], int]] = None,
+                 max_weight: int = 0, on_evict: Optional[Callable[[Any], None]] = None):
+        super().__init__()
+        self.max_items = max_items
+        self.weight = weight
+        self.max_weight = max_weight
+        self.on_evict = on_evict
+        self.evictions = 0
+
+    def get(self, key: Any, default: Any = None) -> Any:
+        if key not in self:
+            return default
+        self.move_to_end(key)
+        return self[key]
+
+    def __setitem__(self, key: Any, value: Any) -> None:
+        super().__setitem__(key, value)
+        self.move_to_end(key)
+        self.evict()
+
+    def over_budget(self) -> bool:
+        if len(self) > self.max_items:
+            return True
+        return self.weight is not None and sum(self.weight(value) for value in self.values()) > self.max_weight
+
+    def evict(self) -> None:
+        """Drop least recently used entries until the store is within its limits."""
+        while len(self) > 1 and self.over_budget():
+            _, value = self.popitem(last=False)
+            self.evictions += 1
+            if self.on_evict is not None:
+                self.on_evict(value)
+
+class DiskCache:
+    """SQLite-backed cache tier that survives server restarts.
+
+    Each row keeps the raw response body (zlib-compressed), the parsed data
+    as JSON and the ``ETag``/``Last-Modified`` validators, so a stale entry
+    can be revalidated with a conditional request. Freshness is based on
+    wall-clock time because monotonic clocks reset with the process. All
+    methods are blocking; use the ``disk_cache_*`` helpers from async code.
+
+    At most ``max_rows`` entries are kept; each write deletes the least
+    recently fetched (or revalidated) rows beyond that.
+
+    Several server processes can share one database (WAL mode lets readers
+    proceed while one writes). A backend configured with
+    READTHEDOCS_CACHE_BACKEND replaces this class and must provide the same
+    methods and ``stats`` counters.
+    """
+
+    def __init__(self, directory: str, max_rows: int = DISK_CACHE_MAX_ROWS):
+        self.path = os.path.join(directory, "readthedocs-cache.sqlite3")
+        self.max_rows = max_rows
+        self._conn: Optional["sqlite3.Connection"] = None
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "revalidated": 0, "stale_served": 0, "writes": 0, "evictions": 0}
+
+    def _connect(self) -> "sqlite3.Connection":
+        if self._conn is None:
+            import sqlite3
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS entries (
+                    namespace TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    body BLOB,
+                    data TEXT NOT NULL,
+                    etag TEXT,
+                    last_modified TEXT,
+                    fetched_at REAL NOT NULL,
+                    PRIMARY KEY (namespace, key)
+                )"""
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS entries_fetched_at ON entries (fetched_at)")
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def get(self, namespace: str, key: str) -> Optional[dict[str, Any]]:
+        """Return the stored entry (without the raw body), or None."""
+        with self._lock:
+            row = self._connect().execute(
+                "SELECT data, etag, last_modified, fetched_at FROM entries WHERE namespace = ? AND key = ?",
+                (namespace, key),
+            ).fetchone()
+        if row is None:
+            self.stats["misses"] += 1
+            return None
+        data, etag, last_modified, fetched_at = row
+        ttl = CACHE_TTLS.get(namespace, CACHE_TTL)
+        return {
+            "data": json.loads(data),
+            "etag": etag,
+            "last_modified": last_modified,
+            "fetched_at": fetched_at,
+            "fresh": fetched_at + ttl > time.time(),
+        }
+
+    def get_body(self, namespace: str, key: str) -> Optional[bytes]:
+        """Return the raw response body stored for an entry."""
+        with self._lock:
+            row = self._connect().execute(
+                "SELECT body FROM entries WHERE namespace = ? AND key = ?", (namespace, key)
+            ).fetchone()
+        if row is None or row[0] is None:
+            return None
+        return zlib.decompress(row[0])
+
+    def put(self, namespace: str, key: str, body: Optional[bytes], data: Any,
+            etag: Optional[str] = None, last_modified: Optional[str] = None) -> None:
+        """Insert or replace an entry, deleting the oldest ones beyond max_rows."""
+        compressed = zlib.compress(body) if body is not None else None
+        with self._lock:
+            conn = self._connect()
+            conn.execute(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (namespace, key, compressed, json.dumps(data), etag, last_modified, time.time()),
+            )
+            excess = conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0] - self.max_rows if self.max_rows else 0
+            if excess > 0:
+                conn.execute(
+                    "DELETE FROM entries WHERE rowid IN (SELECT rowid FROM entries ORDER BY fetched_at, rowid LIMIT ?)",
+                    (excess,),
+                )
+                self.stats["evictions"] += excess
+            conn.commit()
+        self.stats["writes"] += 1
+
+    def touch(self, namespace: str, key: str, etag: Optional[str] = None,
+              last_modified: Optional[str] = None) -> None:
+        """Mark an entry fresh again after a 304 response, updating validators."""
+        with self._lock:
+            conn = self._connect()
+            conn.execute(
+                """UPDATE entries SET fetched_at = ?,
+                       etag = COALESCE(?, etag),
+                       last_modified = COALESCE(?, last_modified)
+                   WHERE namespace = ? AND key = ?""",
+                (time.time(), etag, last_modified, namespace, key),
+            )
+            conn.commit()
+
+    def summary(self) -> dict[str, Any]:
+        """Return row counts per namespace and the database file size."""
+        with self._lock:
+            rows = self._connect().execute(
+                "SELECT namespace, COUNT(*) FROM entries GROUP BY namespace"
+            ).fetchall()
+        size = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+        return {"path": self.path, "bytes": size, "entries": dict(rows), **self.stats}
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+# Shared in-memory cache for API responses, page text, TOCs and searches
+cache = ResponseCache(CACHE_MAX_BYTES, CACHE_TTLS)
+
+def open_disk_cache() -> Optional[DiskCache]:
+    """Create the persistent tier: a custom backend if configured, else SQLite in DISK_CACHE_DIR."""
+    if CACHE_BACKEND:
+        module_name, _, factory = CACHE_BACKEND.partition(":")
+        return getattr(importlib.import_module(module_name), factory or "create_cache")(DISK_CACHE_DIR)
+    return DiskCache(DISK_CACHE_DIR) if DISK_CACHE_DIR else None
+
+# Persistent second tier behind the in-memory cache (None when disabled)
+disk_cache = open_disk_cache()
+
+async def disk_cache_get(namespace: str, key: str) -> Optional[dict[str, Any]]:
+    """Look up an entry in the disk tier without blocking the event loop."""
+    if disk_cache is None:
+        return None
+    try:
+        return await asyncio.to_thread(disk_cache.get, namespace, key)
+    except Exception as e:
+        logger.warning("Error reading disk cache: %s", e)
+        return None
+
+async def disk_cache_put(namespace: str, key: str, response: httpx.Response, data: Any,
+                         body: Optional[bytes] = None) -> None:
+    """Persist a response body, its parsed data and validators to the disk tier.
+
+    ``body`` replaces ``response.content`` for streamed responses; pass None
+    for those to store only the parsed data.
+    """
+    if disk_cache is None:
+        return
+    if body is None:
+        try:
+            body = response.content
+        except httpx.ResponseNotRead:
+            pass
+    try:
+        await asyncio.to_thread(
+            disk_cache.put, namespace, key, body, data,
+            response.headers.get("ETag"), response.headers.get("Last-Modified"),
+        )
+    except Exception as e:
+        logger.warning("Error writing disk cache: %s", e)
+
+async def disk_cache_touch(namespace: str, key: str, response: httpx.Response) -> None:
+    """Refresh a disk entry after the server answered 304 Not Modified."""
+    if disk_cache is None:
+        return
+    try:
+        await asyncio.to_thread(
+            disk_cache.touch, namespace, key,
+            response.headers.get("ETag"), response.headers.get("Last-Modified"),
+        )
+    except Exception as e:
+        logger.warning("Error updating disk cache: %s", e)
+
+def validator_headers(entry: Optional[dict[str, Any]]) -> dict[str, str]:
+    """Build conditional request headers from a stored disk entry."""
+    headers = {}
+    if entry:
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+    return headers
+
+# Worker pool for HTML parsing, created on first use
+extract_executor: Optional[Executor] = None
+
+# Shared HTTP clients, one connection pool per upstream host
+http_clients: dict[str, httpx.AsyncClient] = {}
+pool_stats: dict[str, dict[str, int]] = {}
+
+# Upstream fetches currently in flight, for coalescing identical requests
+inflight_requests: dict[str, asyncio.Future] = {}
+coalescing_stats = {"upstream_fetches": 0, "coalesced": 0}
+
+T = TypeVar("T")
+
+# For debugging
+logger.info("Python version: %s", sys.version)
+logger.info("Using API token: %s", 'Yes' if API_TOKEN else 'No')
+logger.info("HTTP/2 enabled: %s", 'Yes' if HTTP2_ENABLED else 'No')
+logger.info("HTML parser: %s (%s pool, %s workers)", HTML_PARSER, EXTRACT_POOL, EXTRACT_WORKERS)
+
+class LatencyHistogram:
+    """Latency distribution over fixed bucket bounds (seconds), as exported to Prometheus.
+
+    Percentiles are estimated by interpolating within the bucket that
+    contains them, which is accurate to the bucket width.
+    """
+
+    BOUNDS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+    def __init__(self):
+        self.counts = [0] * (len(self.BOUNDS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds: float) -> None:
+        self.counts[bisect.bisect_left(self.BOUNDS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def quantile(self, q: float) -> float:
+        """Estimate the q-th quantile (0 < q <= 1) in seconds."""
+        rank = q * self.count
+        cumulative = 0
+        lower = 0.0
+        for i, n in enumerate(self.counts):
+            upper = min(self.BOUNDS[i], self.max) if i < len(self.BOUNDS) else self.max
+            if n and cumulative + n >= rank:
+                return lower + (upper - lower) * (rank - cumulative) / n
+            cumulative += n
+            lower = upper
+        return self.max
+
+# Phases of a tool call, in the order they happen
+PHASES = ("queue", "connect", "download", "parse", "format")
+
+# Tool call counters and latencies, upstream phase timings and bytes received per host
+server_started = time.time()
+tool_stats: dict[str, dict[str, int]] = {}
+tool_latency: dict[str, LatencyHistogram] = {}
+phase_latency: dict[str, LatencyHistogram] = {phase: LatencyHistogram() for phase in PHASES}
+bytes_received: dict[str, int] = {}
+
+# Name of the tool being run, so tools called by other tools are not counted twice
+current_tool: ContextVar[Optional[str]] = ContextVar("current_tool", default=None)
+
+# Bounds the tool calls running at once (created on first use, in the serving loop)
+call_slots: Optional[asyncio.Semaphore] = None
+
+def record_phase(phase: str, seconds: float) -> None:
+    phase_latency[phase].observe(seconds)
+
+@contextmanager
+def timed_phase(phase: str) -> Iterator[dict[str, float]]:
+    """Time a block (or, as a decorator, a function) as one observation of a phase.
+
+    Yields a dict whose ``seconds`` entry holds the duration afterwards.
+    """
+    timer = {"seconds": 0.0}
+    start = time.perf_counter()
+    try:
+        yield timer
+    finally:
+        timer["seconds"] = time.perf_counter() - start
+        record_phase(phase, timer["seconds"])
+
+def add_body_time(response: httpx.Response, seconds: float) -> None:
+    """Count time spent reading a streamed body towards the response's download phase."""
+    timing = response.request.extensions.get("timing")
+    if timing is not None:
+        timing["body"] += seconds
+
+def record_download(response: httpx.Response) -> None:
+    """Record a finished response's download time and the bytes it transferred."""
+    timing = response.request.extensions.get("timing")
+    if timing is not None:
+        record_phase("download", timing["wait"] + timing["body"])
+    host = response.request.url.host
+    bytes_received[host] = bytes_received.get(host, 0) + response.num_bytes_downloaded
+
+def instrumented(func: Callable[..., Awaitable[T]]) -> Callable[..., Awaitable[T]]:
+    """Count calls, errors and characters returned for a tool, record its latency and bound concurrent calls."""
+    name = func.__name__
+
+    @functools.wraps(func)
+    async def wrapper(*args: Any, **kwargs: Any) -> T:
+        if current_tool.get() is not None:
+            return await func(*args, **kwargs)
+        stats = tool_stats.setdefault(name, {"calls": 0, "errors": 0, "in_flight": 0, "chars": 0})
+        histogram = tool_latency.setdefault(name, LatencyHistogram())
+        global call_slots
+        if call_slots is None:
+            call_slots = asyncio.Semaphore(max(MAX_CONCURRENT_CALLS, 1))
+        context_token = current_tool.set(name)
+        stats["calls"] += 1
+        stats["in_flight"] += 1
+        start = time.perf_counter()
+        try:
+            if call_slots.locked():
+                # Time spent waiting for a free slot counts as queueing
+                with timed_phase("queue"):
+                    await call_slots.acquire()
+            else:
+                await call_slots.acquire()
+            try:
+                result = await func(*args, **kwargs)
+            finally:
+                call_slots.release()
+        except BaseException:
+            stats["errors"] += 1
+            raise
+        finally:
+            histogram.observe(time.perf_counter() - start)
+            stats["in_flight"] -= 1
+            current_tool.reset(context_token)
+        if isinstance(result, str):
+            stats["chars"] += len(result)
+            if result.startswith("Error"):
+                stats["errors"] += 1
+        return result
+
+    return wrapper
+
+def normalize_url(url: str) -> str:
+    """Canonicalize a URL so equivalent spellings share one cache/flight key.
+
+    Lowercases the scheme and host, drops default ports and fragments, and
+    sorts query parameters.
+    """
+    parsed = httpx.URL(url)
+    port = parsed.port
+    if (parsed.scheme, port) in (("http", 80), ("https", 443)):
+        port = None
+    query = sorted(httpx.QueryParams(parsed.query).multi_items())
+    normalized = parsed.copy_with(
+        scheme=parsed.scheme.lower(),
+        host=parsed.host.lower(),
+        port=port,
+        fragment=None,
+        query=str(httpx.QueryParams(query)).encode() or None,
+    )
+    return str(normalized)
+
+async def single_flight(key: str, fetch: Callable[[], Awaitable[T]]) -> T:
+    """Run ``fetch`` once for concurrent callers sharing the same key.
+
+    The first caller starts the fetch as a task; callers arriving while it
+    is still running await the same task instead of issuing their own
+    upstream request. The task is shielded, so a cancelled caller does not
+    cancel the fetch for everyone else.
+    """
+    task = inflight_requests.get(key)
+    if task is None:
+        task = asyncio.ensure_future(fetch())
+        inflight_requests[key] = task
+        coalescing_stats["upstream_fetches"] += 1
+        
+        def forget(done: asyncio.Future) -> None:
+            if inflight_requests.get(key) is done:
+                del inflight_requests[key]
+        
+        task.add_done_callback(forget)
+    else:
+        coalescing_stats["coalesced"] += 1
+    return await asyncio.shield(task)
+
+def get_http_client(host: str) -> httpx.AsyncClient:
+    """Return the server-lifetime client for a host, creating it on first use."""
+    client = http_clients.get(host)
+    if client is None or client.is_closed:
+        limits = httpx.Limits(
+            max_connections=HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+            keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+        )
+        client = httpx.AsyncClient(
+            follow_redirects=True,
+            http2=HTTP2_ENABLED,
+            limits=limits,
+            timeout=HTTP_TIMEOUT,
+            headers={"User-Agent": USER_AGENT},
+        )
+        http_clients[host] = client
+    return client
+
+def get_pool_stats(host: str) -> dict[str, int]:
+    """Return the (mutable) connection counters for a host."""
+    if host not in pool_stats:
+        pool_stats[host] = {
+            "requests": 0,
+            "connections_opened": 0,
+            "tls_handshakes": 0,
+            "http2_responses": 0,
+            "http1_responses": 0,
+            "errors": 0,
+        }
+    return pool_stats[host]
+
+class TokenBucket:
+    """Token bucket rate limiter whose rate adapts to upstream throttling.
+
+    Callers reserve a token up front (the balance may go negative) and sleep
+    off the deficit, so waiters are served in arrival order without a lock.
+    A 429 halves the rate; each success then adds back a small fraction of
+    the configured rate (AIMD). ``pause`` blocks the bucket until a time,
+    for honoring Retry-After.
+    """
+
+    def __init__(self, rate: float, burst: int):
+        self.max_rate = rate
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.waiting = 0
+        self.stats = {"throttled": 0, "max_queue_depth": 0, "slowdowns": 0}
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self) -> None:
+        """Wait until a request may be sent."""
+        if self.rate <= 0:
+            return
+        now = time.monotonic()
+        self._refill(now)
+        self.tokens -= 1
+        delay = max(-self.tokens / self.rate, self.paused_until - now, 0.0)
+        if delay > 0:
+            self.stats["throttled"] += 1
+            self.waiting += 1
+            self.stats["max_queue_depth"] = max(self.stats["max_queue_depth"], self.waiting)
+            try:
+                await asyncio.sleep(delay)
+            finally:
+                self.waiting -= 1
+
+    def pause(self, seconds: float) -> None:
+        """Hold every request back for ``seconds`` (Retry-After)."""
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    def slow_down(self) -> None:
+        """Halve the rate after being throttled."""
+        self.stats["slowdowns"] += 1
+        self.rate = max(self.rate / 2, self.max_rate / 32)
+
+    def speed_up(self) -> None:
+        """Recover part of the configured rate after a success."""
+        self.rate = min(self.max_rate, self.rate + self.max_rate / 20)
+
+class CircuitBreaker:
+    """Fail fast after repeated upstream failures, then probe with one request.
+
+    States: 'closed' (normal), 'open' (reject until the cooldown ends) and
+    'half-open' (one trial request decides whether to close or reopen). A
+    trial that has not reported back within the cooldown counts as failed,
+    so the next request becomes the new trial.
+    """
+
+    def __init__(self, threshold: int, cooldown: float):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trial_started = 0.0
+        self.stats = {"opened": 0, "rejected": 0}
+
+    def allow(self) -> bool:
+        """Whether a request may be sent now."""
+        if self.threshold <= 0 or self.state == "closed":
+            return True
+        now = time.monotonic()
+        if (self.state == "open" and now - self.opened_at >= self.cooldown
+                or self.state == "half-open" and now - self.trial_started >= self.cooldown):
+            self.state = "half-open"
+            self.trial_started = now
+            return True
+        self.stats["rejected"] += 1
+        return False
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.state = "closed"
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self.state == "half-open" or (self.state == "closed" and self.threshold > 0
+                                         and self.failures >= self.threshold):
+            if self.state != "open":
+                self.stats["opened"] += 1
+            self.state = "open"
+            self.opened_at = time.monotonic()
+
+class UpstreamUnavailable(httpx.TransportError):
+    """Raised without sending a request while a host's circuit breaker is open."""
+
+# Rate limiters and breakers, created on first use
+host_buckets: dict[str, TokenBucket] = {}
+token_buckets: dict[str, TokenBucket] = {}
+circuit_breakers: dict[str, CircuitBreaker] = {}
+retry_stats = {"retries": 0, "retry_after": 0, "gave_up": 0}
+
+def get_host_bucket(host: str) -> TokenBucket:
+    if host not in host_buckets:
+        host_buckets[host] = TokenBucket(RATE_LIMIT_HOST, RATE_LIMIT_BURST)
+    return host_buckets[host]
+
+def get_token_bucket(authorization: str) -> TokenBucket:
+    # Key by digest so the raw token is not kept around as a dict key
+    key = hashlib.sha256(authorization.encode()).hexdigest()[:16]
+    if key not in token_buckets:
+        token_buckets[key] = TokenBucket(RATE_LIMIT_TOKEN, RATE_LIMIT_BURST)
+    return token_buckets[key]
+
+def get_circuit_breaker(host: str) -> CircuitBreaker:
+    if host not in circuit_breakers:
+        circuit_breakers[host] = CircuitBreaker(CIRCUIT_THRESHOLD, CIRCUIT_COOLDOWN)
+    return circuit_breakers[host]
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Seconds to wait from a Retry-After header (delta-seconds or HTTP date)."""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(when.timestamp() - time.time(), 0.0)
+
+def backoff_delay(attempt: int) -> float:
+    """Full-jitter exponential backoff for the given retry attempt (0-based)."""
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * (2 ** attempt)))
+
+async def http_get(url: str, stream: bool = False, **kwargs: Any) -> httpx.Response:
+    """Send a GET request through the pooled client for the URL's host.
+
+    Requests wait for the host's token bucket (and the API token's, when an
+    Authorization header is sent). Transport errors, 429 and 502/503/504
+    are retried with jittered exponential backoff, honoring Retry-After;
+    the final response is returned as-is for the caller to check. While the
+    host's circuit breaker is open, UpstreamUnavailable is raised without
+    sending anything. With ``stream`` the body is not read; the caller
+    must close the response.
+    """
+    host = httpx.URL(url).host
+    bucket = get_host_bucket(host)
+    authorization = (kwargs.get("headers") or {}).get("Authorization")
+    user_bucket = get_token_bucket(authorization) if authorization else None
+    breaker = get_circuit_breaker(host)
+    
+    attempt = 0
+    while True:
+        if not breaker.allow():
+            raise UpstreamUnavailable(f"{host} is failing; not retrying for {breaker.cooldown:.0f}s")
+        queued = time.perf_counter()
+        await bucket.acquire()
+        if user_bucket is not None:
+            await user_bucket.acquire()
+        record_phase("queue", time.perf_counter() - queued)
+        
+        # Anything but a response (an error, a redirect loop, cancellation) counts as a failure,
+        # so a half-open breaker always hears back from its trial request
+        response = None
+        try:
+            response = await send_get(host, url, stream, **kwargs)
+        except httpx.TransportError:
+            if attempt >= HTTP_RETRIES:
+                retry_stats["gave_up"] += 1
+                raise
+            delay = backoff_delay(attempt)
+        finally:
+            if response is None:
+                breaker.record_failure()
+        if response is not None:
+            if response.status_code not in RETRY_STATUSES:
+                breaker.record_success()
+                bucket.speed_up()
+                return response
+            
+            retry_after = parse_retry_after(response.headers.get("Retry-After"))
+            if response.status_code == 429:
+                # Throttled: the host is up, but we are sending too fast
+                breaker.record_success()
+                (user_bucket or bucket).slow_down()
+            else:
+                breaker.record_failure()
+            if retry_after is not None:
+                retry_stats["retry_after"] += 1
+                # Hold back every request to this host, not just this one
+                bucket.pause(retry_after)
+            if attempt >= HTTP_RETRIES or (retry_after is not None and retry_after > BACKOFF_MAX):
+                retry_stats["gave_up"] += 1
+                return response
+            if stream:
+                await response.aclose()
+            delay = max(retry_after or 0.0, backoff_delay(attempt))
+        
+        attempt += 1
+        retry_stats["retries"] += 1
+        logger.warning("Retrying %s in %.2fs (attempt %s of %s)", url, delay, attempt, HTTP_RETRIES)
+        await asyncio.sleep(delay)
+
+async def send_get(host: str, url: str, stream: bool = False, **kwargs: Any) -> httpx.Response:
+    """Send one GET on the host's pooled client, counting connections opened.
+
+    A request that does not open a new TCP connection was served from a
+    kept-alive (or multiplexed HTTP/2) connection, which is what the
+    ``connections_opened`` counter lets us confirm. Connection setup and
+    the wait for the response are timed in the request's ``timing``
+    extension; streamed bodies add their read time there (see
+    record_download).
+    """
+    client = get_http_client(host)
+    stats = get_pool_stats(host)
+    timing = {"connect": 0.0, "wait": 0.0, "body": 0.0}
+    connect_started = None
+
+    async def trace(event_name: str, info: dict[str, Any]) -> None:
+        nonlocal connect_started
+        if event_name == "connection.connect_tcp.started":
+            connect_started = time.perf_counter()
+        elif event_name == "connection.connect_tcp.complete":
+            stats["connections_opened"] += 1
+        elif event_name == "connection.start_tls.complete":
+            stats["tls_handshakes"] += 1
+        elif event_name.endswith(".send_request_headers.started") and connect_started is not None:
+            # TCP connect plus TLS handshake, up to the first byte of the request
+            timing["connect"] += time.perf_counter() - connect_started
+            connect_started = None
+
+    stats["requests"] += 1
+    start = time.perf_counter()
+    try:
+        request = client.build_request("GET", url, extensions={"trace": trace, "timing": timing}, **kwargs)
+        response = await client.send(request, stream=stream)
+    except Exception:
+        stats["errors"] += 1
+        raise
+    timing["wait"] = time.perf_counter() - start - timing["connect"]
+    if timing["connect"]:
+        record_phase("connect", timing["connect"])
+    if not stream:
+        record_download(response)
+    if response.http_version == "HTTP/2":
+        stats["http2_responses"] += 1
+    else:
+        stats["http1_responses"] += 1
+    return response
+
+async def close_http_clients() -> None:
+    """Close every pooled client; new ones are created lazily if needed again."""
+    clients = list(http_clients.values())
+    http_clients.clear()
+    for client in clients:
+        try:
+            await client.aclose()
+        except Exception as e:
+            logger.warning("Error closing HTTP client: %s", e)
+
+def selector_to_css(tag: str, attrs: dict[str, str]) -> str:
+    """Translate a (tag, attrs) selector into the equivalent CSS selector."""
+    css = tag
+    for name, value in attrs.items():
+        if name == 'class':
+            css += f".{value}"
+        elif name == 'id':
+            css += f"#{value}"
+        else:
+            css += f'[{name}="{value}"]'
+    return css
+
+def clean_text(text: str) -> str:
+    """Strip every line and drop blank ones."""
+    return '\n'.join(line.strip() for line in text.split('\n') if line.strip())
+
+def selector_matches(tag: "Tag", name: str, attrs: dict[str, str]) -> bool:
+    """Check a tag against a (name, attrs) selector with BeautifulSoup.find semantics."""
+    if tag.name != name:
+        return False
+    for attr, value in attrs.items():
+        actual = tag.attrs.get(attr)
+        if actual is None:
+            return False
+        if isinstance(actual, list):
+            if value not in actual and value != ' '.join(actual):
+                return False
+        elif actual != value:
+            return False
+    return True
+
+def walk_content(root: "Tag") -> tuple[list[str], dict[str, Any]]:
+    """Walk a parsed document once, collecting its text and element spans.
+
+    Returns the stripped, non-empty visible strings of the document in
+    order, and spans for the elements extraction cares about. A span is
+    ``[first_string, end_string, text_chars, link_chars]``: the element's
+    slice of the strings, ``len(get_text(strip=True))`` and how much of
+    that text sits inside links. Spans are recorded for the first match of
+    each content selector, the first ``<body>`` and ``<title>``, the
+    nav/header/footer elements inside the body, every heading and every
+    API entry (``<dt id=...>``), so choosing the main content and indexing
+    its sections afterwards needs no further tree traversal. The ``root``
+    span covers everything walked.
+
+    The walk ends as soon as the element matching the first content
+    selector closes with prose in it (see extract_from_spans, which picks
+    it whatever follows); spans still open then end there.
+    """
+    from bs4 import CData, NavigableString, Tag
+    
+    # String types that count as visible text (no comments, scripts or styles)
+    main_string_types = (NavigableString, CData)
+    strings: list[str] = []
+    text_chars = 0
+    link_chars = 0
+    link_depth = 0
+    
+    candidates: list[Optional[list[int]]] = [None] * len(CONTENT_SELECTORS)
+    body: Optional[list[int]] = None
+    body_tag: Optional["Tag"] = None
+    title: Optional[list[int]] = None
+    excluded: list[list[int]] = []
+    headings: list[tuple[list[int], int, Optional[str]]] = []
+    entries: list[tuple[list[int], str]] = []
+    open_spans: dict[int, list[int]] = {}
+    
+    selectors_by_name: dict[str, list[tuple[int, dict[str, str]]]] = {}
+    for index, (name, attrs) in enumerate(CONTENT_SELECTORS):
+        selectors_by_name.setdefault(name, []).append((index, attrs))
+    
+    stack = [(root, iter(root.contents))]
+    while stack:
+        node, children = stack[-1]
+        child = next(children, None)
+        if child is None:
+            # Leaving an element: close its span, if we are tracking one
+            stack.pop()
+            if node.name == 'a':
+                link_depth -= 1
+            if node is body_tag:
+                body_tag = None
+            span = open_spans.pop(id(node), None)
+            if span is not None:
+                span[1] = len(strings)
+                span[2] = text_chars - span[2]
+                span[3] = link_chars - span[3]
+                if span is candidates[0] and span[2] > 100 and span[3] / span[2] <= MAX_LINK_DENSITY:
+                    break
+            continue
+        
+        if isinstance(child, Tag):
+            name = child.name
+            span = None
+            for index, attrs in selectors_by_name.get(name, ()):
+                if candidates[index] is None and selector_matches(child, name, attrs):
+                    span = span or [len(strings), 0, text_chars, link_chars]
+                    candidates[index] = span
+            if name in HEADING_LEVELS:
+                span = span or [len(strings), 0, text_chars, link_chars]
+                headings.append((span, HEADING_LEVELS[name], heading_anchor(child)))
+            elif name == 'dt' and child.get('id'):
+                span = span or [len(strings), 0, text_chars, link_chars]
+                entries.append((span, child['id']))
+            elif name == 'body' and body is None:
+                span = span or [len(strings), 0, text_chars, link_chars]
+                body = span
+                body_tag = child
+            elif body_tag is not None and name in ('nav', 'header', 'footer'):
+                span = span or [len(strings), 0, text_chars, link_chars]
+                excluded.append(span)
+            elif name == 'title' and title is None:
+                span = span or [len(strings), 0, text_chars, link_chars]
+                title = span
+            if span is not None:
+                open_spans[id(child)] = span
+            if name == 'a':
+                link_depth += 1
+            stack.append((child, iter(child.contents)))
+        elif type(child) in main_string_types:
+            stripped = child.strip()
+            if stripped:
+                # Splitting into clean lines is left for the chosen span only
+                strings.append(stripped)
+                text_chars += len(stripped)
+                if link_depth:
+                    link_chars += len(stripped)
+    
+    for span in open_spans.values():
+        span[1] = len(strings)
+        span[2] = text_chars - span[2]
+        span[3] = link_chars - span[3]
+    return strings, {
+        "candidates": candidates,
+        "body": body,
+        "title": title,
+        "excluded": excluded,
+        "headings": headings,
+        "entries": entries,
+        "root": [0, len(strings), text_chars, link_chars],
+    }
+
+def heading_anchor(heading: "Tag") -> Optional[str]:
+    """Return the anchor id for a heading (its own id or its section's id)."""
+    if heading.get('id'):
+        return heading['id']
+    parent = heading.parent
+    if parent is not None and parent.name in ('section', 'div') and parent.get('id'):
+        return parent['id']
+    return None
+
+def heading_title(text: str) -> str:
+    """Clean a heading's text, dropping trailing permalink markers."""
+    return ' '.join(text.split()).rstrip(PERMALINK_MARKERS).strip()
+
+def build_page_document(strings: list[str], content: list[int], excluded: list[list[int]],
+                        spans: dict[str, Any]) -> dict[str, Any]:
+    """Build the cleaned text and section index for the chosen content span.
+
+    Headings and API entries are located by the index of their first string,
+    so mapping them to character offsets needs no searching in the text.
+    """
+    ranges = []
+    position = content[0]
+    for first, end, *_ in sorted(excluded):
+        if first > position:
+            ranges.append(range(position, min(first, content[1])))
+        position = max(position, end)
+    ranges.append(range(position, content[1]))
+    
+    parts: list[str] = []
+    bases: list[int] = []
+    for selected in ranges:
+        bases.append(len(parts))
+        parts.extend(clean_text(string) if '\n' in string else string for string in strings[selected.start:selected.stop])
+    text = '\n'.join(parts)
+    # starts[k] is the offset of parts[k] in text
+    starts = list(itertools.accumulate((len(part) + 1 for part in parts), initial=0))
+    
+    def offset_of(index: int) -> Optional[int]:
+        for base, selected in zip(bases, ranges):
+            if index in selected:
+                return starts[base + index - selected.start]
+        return None
+    
+    # Sections run from their heading to the next heading of the same or higher level
+    sections: list[dict[str, Any]] = []
+    open_sections: list[dict[str, Any]] = []
+    for span, level, anchor in spans["headings"]:
+        start = offset_of(span[0])
+        if start is None:
+            continue
+        title = heading_title(' '.join(strings[span[0]:span[1]]))
+        while open_sections and open_sections[-1]["level"] >= level:
+            open_sections.pop()["end"] = max(start - 1, 0)
+        path = [parent["title"] for parent in open_sections] + [title]
+        section = {"id": anchor, "title": title, "level": level, "path": " > ".join(path), "start": start, "end": len(text)}
+        sections.append(section)
+        open_sections.append(section)
+    
+    # API entries run until the next entry or heading
+    entry_starts = [(offset_of(span[0]), anchor) for span, anchor in spans["entries"]]
+    entry_starts = [(start, anchor) for start, anchor in entry_starts if start is not None]
+    boundaries = sorted({section["start"] for section in sections} | {start for start, _ in entry_starts})
+    anchors = {}
+    for start, anchor in entry_starts:
+        position = bisect.bisect_right(boundaries, start)
+        end = boundaries[position] - 1 if position < len(boundaries) else len(text)
+        anchors[anchor] = [start, end]
+    
+    if spans["title"] is not None:
+        page_title = ' '.join(strings[spans["title"][0]:spans["title"][1]])
+    else:
+        page_title = sections[0]["title"] if sections else ""
+    
+    page = {"title": page_title, "text": text, "sections": sections, "anchors": anchors}
+    
+    # Source documents of a single-page build run until the next one starts
+    document_starts = [(offset_of(span[0]), name) for span, name in spans.get("documents", ())]
+    document_starts = [(start, name) for start, name in document_starts if start is not None]
+    if document_starts:
+        ends = [start - 1 for start, _ in document_starts[1:]] + [len(text)]
+        page["documents"] = {name: [start, max(end, start)] for (start, name), end in zip(document_starts, ends)}
+    return page
+
+def extract_page(html: str, parser: str = "html.parser") -> Optional[dict[str, Any]]:
+    """Extract the main text and section index of a documentation page.
+
+    Returns a dict with the page ``title``, the cleaned ``text``, its
+    ``sections`` (heading hierarchy with anchor ids, ``path`` and character
+    ``start``/``end`` offsets into the text) and ``anchors`` (offsets of API
+    entries such as ``module.Class.method``), or None if the page has no
+    usable content.
+
+    This is a pure function of its arguments so it can run in a thread or
+    process pool. ``parser`` selects the backend: a BeautifulSoup tree
+    builder ('html.parser' or 'lxml') or 'selectolax'.
+    """
+    if parser == "selectolax":
+        return extract_page_selectolax(html)
+    
+    from bs4 import BeautifulSoup
+    return extract_page_from_soup(BeautifulSoup(html, parser))
+
+def extract_page_from_soup(soup: "BeautifulSoup") -> Optional[dict[str, Any]]:
+    """Run the single-pass extraction on an already parsed page.
+
+    The tree is walked once (see walk_content), stopping early when the
+    first content selector matches prose, then the content is chosen from
+    the recorded spans (see extract_from_spans).
+    """
+    strings, spans = walk_content(soup)
+    return extract_from_spans(strings, spans)
+
+def extract_from_spans(strings: list[str], spans: dict[str, Any]) -> Optional[dict[str, Any]]:
+    """Choose the main content from walked strings and spans and build the page.
+
+    The first content selector whose element has more than 100 characters
+    of text wins, except that navigation-like candidates (link density
+    above MAX_LINK_DENSITY) are passed over when a later selector matches
+    real prose. Shared by walk_content and the streaming extractor, which
+    record the same strings and spans.
+    """
+    # Pick the main content block from the per-selector scores
+    content = None
+    link_heavy = None
+    for (tag, attrs), span in zip(CONTENT_SELECTORS, spans["candidates"]):
+        if span is None or span[2] <= 100:  # Ensure there's substantial content
+            continue
+        if span[3] / span[2] <= MAX_LINK_DENSITY:
+            logger.debug("Found content using selector: %s, %s", tag, attrs)
+            content = span
+            break
+        if link_heavy is None:
+            link_heavy = span
+    
+    if content is None and link_heavy is not None:
+        # Only link lists matched (e.g. an index page); that is still the content
+        content = link_heavy
+    
+    if content is not None:
+        return build_page_document(strings, content, [], spans)
+    
+    # If we still didn't find content, try the document body
+    logger.debug("Standard content selectors failed. Trying body content...")
+    if spans["body"] is not None:
+        # Leave out navigation, header and footer elements
+        return build_page_document(strings, spans["body"], spans["excluded"], spans)
+    
+    logger.debug("Could not find suitable content in the page")
+    return None
+
+def extract_main_content(html: str, parser: str = "html.parser") -> Optional[str]:
+    """Extract only the cleaned main text of a documentation page."""
+    page = extract_page(html, parser)
+    return page["text"] if page else None
+
+def extract_page_selectolax(html: str) -> Optional[dict[str, Any]]:
+    """selectolax implementation of extract_page (same selector rules).
+
+    Lexbor builds the tree; walking it feeds the same start/end/data events
+    the streaming parsers produce into a StreamingExtractor, so content
+    selection, sections and API anchors come from the shared span logic.
+    """
+    from selectolax.lexbor import LexborHTMLParser
+    
+    tree = LexborHTMLParser(html)
+    extractor = StreamingExtractor()
+    node = tree.root
+    # Elements whose end event is still due
+    open_nodes = []
+    while node is not None:
+        if node.is_element_node:
+            extractor.start(node.tag, {name: value or '' for name, value in node.attributes.items()})
+            if node.child is not None:
+                open_nodes.append(node)
+                node = node.child
+                continue
+            extractor.end(node.tag)
+        elif node.is_text_node:
+            extractor.data(node.text_content or '')
+        while node.next is None and open_nodes:
+            node = open_nodes.pop()
+            extractor.end(node.tag)
+        node = node.next if open_nodes else None
+    
+    strings, spans = extractor.close()
+    return extract_from_spans(strings, spans)
+
+class StreamingExtractor:
+    """Incremental counterpart of walk_content for pages that arrive in chunks.
+
+    Receives parser events (start, end, data) and records the same visible
+    strings and spans as walk_content, without keeping the HTML or a tree.
+    With a ``section`` it stops once that section is complete (at the next
+    heading of the same or a higher level, or the next API entry for an
+    entry anchor); ``done`` then tells the caller to stop downloading.
+    """
+
+    SKIPPED_TAGS = frozenset(('script', 'style', 'template'))
+
+    def __init__(self, section: Optional[str] = None):
+        self.strings: list[str] = []
+        self.text_chars = 0
+        self.link_chars = 0
+        self.link_depth = 0
+        self.skip_depth = 0
+        self.pending: list[str] = []
+        # Open elements: (name, span or None, id)
+        self.stack: list[tuple[str, Optional[list[int]], Optional[str]]] = []
+        self.body_depth: Optional[int] = None
+        self.spans: dict[str, Any] = {
+            "candidates": [None] * len(CONTENT_SELECTORS),
+            "body": None,
+            "title": None,
+            "excluded": [],
+            "headings": [],
+            "entries": [],
+            "documents": [],
+        }
+        self.selectors_by_name: dict[str, list[tuple[int, dict[str, str]]]] = {}
+        for index, (name, attrs) in enumerate(CONTENT_SELECTORS):
+            self.selectors_by_name.setdefault(name, []).append((index, attrs))
+        
+        self.target = section.strip().lstrip('#') if section else None
+        self.target_path = [part.strip().lower() for part in self.target.split('>')] if self.target else []
+        self.outline: list[tuple[int, str]] = []
+        self.matched_level: Optional[int] = None
+        self.done = False
+
+    @staticmethod
+    def attrs_match(attrs: dict[str, str], wanted: dict[str, str]) -> bool:
+        for attr, value in wanted.items():
+            actual = attrs.get(attr)
+            if actual is None:
+                return False
+            if attr == 'class':
+                if value not in actual.split() and value != ' '.join(actual.split()):
+                    return False
+            elif actual != value:
+                return False
+        return True
+
+    def flush(self) -> None:
+        """Turn buffered character data into one string, as a parser tree would."""
+        if not self.pending:
+            return
+        stripped = ''.join(self.pending).strip()
+        self.pending = []
+        if stripped and not self.skip_depth:
+            self.strings.append(stripped)
+            self.text_chars += len(stripped)
+            if self.link_depth:
+                self.link_chars += len(stripped)
+
+    def new_span(self) -> list[int]:
+        return [len(self.strings), 0, self.text_chars, self.link_chars]
+
+    def start(self, name: str, attrs: dict[str, str]) -> None:
+        if self.done:
+            return
+        self.flush()
+        span = None
+        for index, wanted in self.selectors_by_name.get(name, ()):
+            if self.spans["candidates"][index] is None and self.attrs_match(attrs, wanted):
+                span = span or self.new_span()
+                self.spans["candidates"][index] = span
+        if name in HEADING_LEVELS:
+            level = HEADING_LEVELS[name]
+            if self.matched_level is not None and level <= self.matched_level or self.matched_level == 0:
+                self.stop()
+                return
+            anchor = attrs.get('id')
+            if anchor is None and self.stack and self.stack[-1][0] in ('section', 'div'):
+                anchor = self.stack[-1][2]
+            span = span or self.new_span()
+            self.spans["headings"].append((span, level, anchor))
+        elif name == 'dt' and attrs.get('id'):
+            if self.matched_level == 0:
+                self.stop()
+                return
+            span = span or self.new_span()
+            self.spans["entries"].append((span, attrs['id']))
+            if self.target is not None and attrs['id'] == self.target and self.matched_level is None:
+                self.matched_level = 0
+        elif name == 'body' and self.spans["body"] is None:
+            span = span or self.new_span()
+            self.spans["body"] = span
+            self.body_depth = len(self.stack)
+        elif self.body_depth is not None and name in ('nav', 'header', 'footer'):
+            span = span or self.new_span()
+            self.spans["excluded"].append(span)
+        elif name == 'title' and self.spans["title"] is None:
+            span = span or self.new_span()
+            self.spans["title"] = span
+        elif attrs.get('id', '').startswith('document-'):
+            # Single-page (singlehtml) builds mark where each source document starts
+            span = span or self.new_span()
+            self.spans["documents"].append((span, attrs['id'][len('document-'):]))
+        if name == 'a':
+            self.link_depth += 1
+        if name in self.SKIPPED_TAGS:
+            self.skip_depth += 1
+        self.stack.append((name, span, attrs.get('id')))
+
+    def end(self, name: str) -> None:
+        if self.done:
+            return
+        # Tolerate unbalanced markup: close up to the matching open element
+        if not any(open_name == name for open_name, _, _ in self.stack):
+            return
+        self.flush()
+        while self.stack:
+            open_name, span, _ = self.stack.pop()
+            self.close_element(open_name, span)
+            if open_name == name:
+                break
+
+    def close_element(self, name: str, span: Optional[list[int]]) -> None:
+        if name == 'a':
+            self.link_depth -= 1
+        if name in self.SKIPPED_TAGS:
+            self.skip_depth -= 1
+        if self.body_depth is not None and len(self.stack) <= self.body_depth:
+            self.body_depth = None
+        if span is not None:
+            span[1] = len(self.strings)
+            span[2] = self.text_chars - span[2]
+            span[3] = self.link_chars - span[3]
+            if name in HEADING_LEVELS:
+                self.heading_closed(HEADING_LEVELS[name], span)
+
+    def heading_closed(self, level: int, span: list[int]) -> None:
+        """Track the heading outline and check it against the wanted section."""
+        title = heading_title(' '.join(self.strings[span[0]:span[1]]))
+        while self.outline and self.outline[-1][0] >= level:
+            self.outline.pop()
+        self.outline.append((level, title))
+        if self.target is None or self.matched_level is not None:
+            return
+        anchor = self.spans["headings"][-1][2] if self.spans["headings"] else None
+        path = [part.lower() for _, part in self.outline]
+        if anchor == self.target or path[-len(self.target_path):] == self.target_path:
+            self.matched_level = level
+
+    def data(self, text: str) -> None:
+        if not self.done:
+            self.pending.append(text)
+
+    def stop(self) -> None:
+        """Stop consuming input; open spans are closed where the input stopped."""
+        self.done = True
+
+    def close(self) -> tuple[list[str], dict[str, Any]]:
+        """Finish the document and return (strings, spans) like walk_content."""
+        if not self.done:
+            self.flush()
+        self.done = True
+        while self.stack:
+            name, span, _ = self.stack.pop()
+            self.close_element(name, span)
+        return self.strings, self.spans
+
+class StdlibStreamParser(HTMLParser):
+    """Feeds html.parser events to a StreamingExtractor."""
+
+    VOID_TAGS = frozenset((
+        'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input',
+        'link', 'meta', 'param', 'source', 'track', 'wbr',
+    ))
+
+    def __init__(self, target: StreamingExtractor):
+        super().__init__(convert_charrefs=True)
+        self.target = target
+
+    def handle_starttag(self, tag: str, attrs: list[tuple[str, Optional[str]]]) -> None:
+        self.target.start(tag, {name: value or '' for name, value in attrs})
+        if tag in self.VOID_TAGS:
+            self.target.end(tag)
+
+    def handle_startendtag(self, tag: str, attrs: list[tuple[str, Optional[str]]]) -> None:
+        self.target.start(tag, {name: value or '' for name, value in attrs})
+        self.target.end(tag)
+
+    def handle_endtag(self, tag: str) -> None:
+        if tag not in self.VOID_TAGS:
+            self.target.end(tag)
+
+    def handle_data(self, data: str) -> None:
+        self.target.data(data)
+
+class StreamingPageParser:
+    """Incremental page extraction: feed HTML text chunks, then call close().
+
+    Uses lxml's event-driven HTML parser when available (it repairs markup
+    like a tree builder would) and html.parser otherwise.
+    """
+
+    def __init__(self, section: Optional[str] = None):
+        self.extractor = StreamingExtractor(section)
+        self.parser: Any
+        if HTML_PARSER == "lxml" or (HTML_PARSER != "html.parser" and importlib.util.find_spec("lxml")):
+            from lxml import etree
+            self.parser = etree.HTMLParser(target=self.extractor)
+        else:
+            self.parser = StdlibStreamParser(self.extractor)
+
+    @property
+    def done(self) -> bool:
+        return self.extractor.done
+
+    def feed(self, chunk: str) -> None:
+        if not self.extractor.done:
+            self.parser.feed(chunk)
+
+    def close(self) -> Optional[dict[str, Any]]:
+        if not self.extractor.done:
+            try:
+                self.parser.close()
+            except Exception:
+                # lxml raises on close when it saw no document; keep what we have
+                pass
+        strings, spans = self.extractor.close()
+        return extract_from_spans(strings, spans)
+
+def extract_toc_links(html: str, parser: str = "html.parser") -> Optional[list[tuple[int, str, str]]]:
+    """Extract (indent level, text, href) for every link in the page's TOC.
+
+    Returns None when no table of contents (or fallback list) is found.
+    """
+    if parser == "selectolax":
+        return extract_toc_links_selectolax(html)
+    
+    from bs4 import BeautifulSoup, Tag
+    soup = BeautifulSoup(html, parser)
+    
+    # Look for the table of contents - try different selectors for different themes
+    toc = None
+    for tag, attrs in TOC_SELECTORS:
+        toc = soup.find(tag, attrs)
+        if toc:
+            break
+    
+    if not toc:
+        # If we can't find a dedicated TOC section, look for any list of links
+        logger.debug("No standard TOC found. Looking for alternative link collections.")
+        toc = soup.find('ul')
+    
+    if not toc:
+        return None
+    
+    # One pass over the TOC, counting enclosing list items on the way down
+    toc_links = []
+    pending = [(toc, len(toc.find_parents('li')))]
+    while pending:
+        node, li_depth = pending.pop()
+        if node.name == 'li':
+            li_depth += 1
+        elif node.name == 'a':
+            text = node.get_text(strip=True)
+            href = node.get('href')
+            if text and href:
+                # Indent by the number of list items enclosing the link's own <li>
+                toc_links.append((max(li_depth - 1, 0), text, href))
+        pending.extend((child, li_depth) for child in reversed(node.contents) if isinstance(child, Tag))
+    logger.debug("Found %s links in TOC", len(toc_links))
+    
+    return toc_links
+
+def extract_toc_links_selectolax(html: str) -> Optional[list[tuple[int, str, str]]]:
+    """selectolax implementation of extract_toc_links."""
+    from selectolax.lexbor import LexborHTMLParser
+    
+    tree = LexborHTMLParser(html)
+    toc = None
+    for tag, attrs in TOC_SELECTORS:
+        toc = tree.css_first(selector_to_css(tag, attrs))
+        if toc:
+            break
+    
+    if not toc:
+        logger.debug("No standard TOC found. Looking for alternative link collections.")
+        toc = tree.css_first('ul')
+    
+    if not toc:
+        return None
+    
+    links = toc.css('a')
+    logger.debug("Found %s links in TOC", len(links))
+    
+    toc_links = []
+    for link in links:
+        text = link.text(strip=True)
+        href = link.attributes.get('href')
+        
+        if text and href:
+            # Indent by the number of list items enclosing the link's own <li>
+            li_ancestors = 0
+            parent = link.parent
+            while parent is not None:
+                if parent.tag == 'li':
+                    li_ancestors += 1
+                parent = parent.parent
+            toc_links.append((max(li_ancestors - 1, 0), text, href))
+    
+    return toc_links
+
+def get_extract_executor() -> Executor:
+    """Return the HTML extraction worker pool, creating it on first use."""
+    global extract_executor
+    if extract_executor is None:
+        if EXTRACT_POOL == "process":
+            import multiprocessing
+            from concurrent.futures import ProcessPoolExecutor
+            
+            # 'spawn' avoids forking a process that already runs threads
+            extract_executor = ProcessPoolExecutor(
+                max_workers=EXTRACT_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        else:
+            extract_executor = ThreadPoolExecutor(
+                max_workers=EXTRACT_WORKERS,
+                thread_name_prefix="readthedocs-extract",
+            )
+    return extract_executor
+
+async def run_extraction(func: Callable[..., T], *args: Any) -> T:
+    """Run an extraction function in the worker pool so parsing never blocks the event loop."""
+    with timed_phase("parse"):
+        if EXTRACT_POOL == "inline":
+            return func(*args)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(get_extract_executor(), func, *args)
+
+def shutdown_extract_executor() -> None:
+    """Stop the extraction worker pool; a new one is created lazily if needed."""
+    global extract_executor
+    if extract_executor is not None:
+        extract_executor.shutdown(wait=False, cancel_futures=True)
+        extract_executor = None
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9_]+")
+
+def tokenize(text: str) -> list[str]:
+    """Split text into lowercase search terms (dotted names become their parts)."""
+    return TOKEN_PATTERN.findall(text.lower())
+
+def build_index_documents(page: dict[str, Any]) -> list[dict[str, Any]]:
+    """Turn a page into search documents with term counts.
+
+    Every section and every API entry becomes a document covering its text
+    up to the next heading or entry; text before the first one is anchored
+    to the page itself. This is pure so it can run in the extraction pool.
+    """
+    text = page["text"]
+    starts = [(section["start"], section["id"], section["title"]) for section in page["sections"]]
+    starts += [(start, anchor, anchor) for anchor, (start, _) in page.get("anchors", {}).items()]
+    starts.sort(key=lambda item: item[0])
+    if not starts or starts[0][0] > 0:
+        starts.insert(0, (0, None, page.get("title") or ""))
+    
+    documents = []
+    for index, (start, anchor, title) in enumerate(starts):
+        end = starts[index + 1][0] if index + 1 < len(starts) else len(text)
+        body = text[start:end]
+        counts = Counter(tokenize(body))
+        for term in tokenize(title):
+            counts[term] += TITLE_WEIGHT
+        if not counts:
+            continue
+        documents.append({
+            "anchor": anchor,
+            "title": title,
+            "excerpt": body[:EXCERPT_CHARS],
+            "counts": counts,
+            "length": sum(counts.values()),
+        })
+    return documents
+
+class SearchIndex:
+    """In-process BM25 index over the sections of one project's pages.
+
+    Documents are sections; each keeps its page URL, anchor, title and a
+    short excerpt so results can be formatted like the remote search API.
+    Re-indexing a page replaces its previous documents.
+    """
+
+    def __init__(self):
+        self.documents: dict[int, dict[str, Any]] = {}
+        self.postings: dict[str, dict[int, int]] = {}
+        self.documents_by_url: dict[str, list[int]] = {}
+        self.version_counts: Counter[str] = Counter()
+        self.total_length = 0
+        self._next_id = 0
+
+    def remove_page(self, url: str) -> None:
+        """Drop every document indexed for a page."""
+        for doc_id in self.documents_by_url.pop(url, []):
+            document = self.documents.pop(doc_id)
+            self.total_length -= document["length"]
+            self.version_counts[document["version"]] -= 1
+            if not self.version_counts[document["version"]]:
+                del self.version_counts[document["version"]]
+            for term in document["terms"]:
+                postings = self.postings[term]
+                del postings[doc_id]
+                if not postings:
+                    del self.postings[term]
+
+    def add_page(self, url: str, version: str, documents: list[dict[str, Any]]) -> None:
+        """Index a page's section documents (see build_index_documents)."""
+        self.remove_page(url)
+        doc_ids = []
+        for document in documents:
+            doc_id = self._next_id
+            self._next_id += 1
+            counts = document["counts"]
+            for term, count in counts.items():
+                self.postings.setdefault(term, {})[doc_id] = count
+            self.documents[doc_id] = {
+                "url": url,
+                "version": version,
+                "anchor": document["anchor"],
+                "title": document["title"],
+                "excerpt": document["excerpt"],
+                "length": document["length"],
+                "terms": tuple(counts),
+            }
+            self.total_length += document["length"]
+            doc_ids.append(doc_id)
+        self.version_counts[version] += len(doc_ids)
+        self.documents_by_url[url] = doc_ids
+
+    def has_version(self, version: Optional[str]) -> bool:
+        """Whether any document exists (for the given version, if any)."""
+        if version is None:
+            return bool(self.documents)
+        return version in self.version_counts
+
+    def search(self, query: str, version: Optional[str] = None, limit: int = 10) -> list[tuple[float, dict[str, Any]]]:
+        """Return up to ``limit`` (score, document) pairs ranked by BM25."""
+        if not self.documents:
+            return []
+        count = len(self.documents)
+        average_length = self.total_length / count
+        scores: dict[int, float] = {}
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+            for doc_id, frequency in postings.items():
+                length = self.documents[doc_id]["length"]
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * length / average_length)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * frequency * (BM25_K1 + 1) / (frequency + norm)
+        
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        results = []
+        for doc_id, score in ranked:
+            document = self.documents[doc_id]
+            if version is not None and document["version"] != version:
+                continue
+            results.append((score, document))
+            if len(results) >= limit:
+                break
+        return results
+
+# Local search indexes, one per project slug
+search_indexes: LRUDict = LRUDict(LOCAL_SEARCH_MAX_PROJECTS, lambda index: len(index.documents), LOCAL_SEARCH_MAX_DOCUMENTS)
+
+# Keep references to fire-and-forget tasks so they are not garbage collected
+background_tasks: set[asyncio.Task] = set()
+
+def run_in_background(coroutine: Awaitable[Any]) -> asyncio.Task:
+    """Schedule a coroutine without awaiting it."""
+    task = asyncio.ensure_future(coroutine)
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+    return task
+
+def parse_docs_url(url: str) -> Optional[tuple[str, str, str]]:
+    """Split a *.readthedocs.io URL into (project, version, path).
+
+    Handles both the '/<language>/<version>/' and the '/<version>/' layouts;
+    returns None for other hosts.
+    """
+    parsed = httpx.URL(url)
+    if not parsed.host.endswith(".readthedocs.io"):
+        return None
+    project = parsed.host[:-len(".readthedocs.io")]
+    parts = parsed.path.lstrip('/').split('/')
+    if len(parts) >= 2 and re.fullmatch(r"[a-z]{2}(-[a-z]{2,4})?", parts[0]):
+        parts = parts[1:]
+    if not parts or not parts[0]:
+        return None
+    return project, parts[0], '/'.join(parts[1:])
+
+async def index_page(url: str, page: dict[str, Any]) -> None:
+    """Add a fetched page to its project's local search index."""
+    location = parse_docs_url(url)
+    if location is None:
+        return
+    project, version, _ = location
+    try:
+        documents = await run_extraction(build_index_documents, page)
+    except Exception as e:
+        logger.warning("Error indexing %s: %s", url, e)
+        return
+    link = page.get("url") or url
+    index = search_indexes.get(project)
+    if index is None:
+        index = search_indexes[project] = SearchIndex()
+    index.add_page(link, version, documents)
+    search_indexes.evict()
+
+class MappedFile(mmap.mmap):
+    """Read-only memory map usable as a zipfile file object (mmap lacks seekable() before 3.13)."""
+
+    def seekable(self) -> bool:
+        return True
+
+class DocArchive:
+    """A project version's documentation served from an HTML zip archive.
+
+    The archive is memory-mapped and read through zipfile's central
+    directory. ``load`` extracts every page up front: Read the Docs htmlzip
+    downloads are single-page (singlehtml) builds, which are parsed
+    incrementally and split into their source documents at the
+    ``document-<name>`` markers; multi-page archives (a zipped ``html`` or
+    ``dirhtml`` build) have each HTML file extracted. Pages are keyed by
+    their path relative to the version root, e.g. 'tutorial/index.html'.
+    """
+
+    # Generated pages and directories that are not documentation content
+    SKIPPED_PAGES = ("search.html", "genindex.html", "py-modindex.html")
+
+    def __init__(self, project: str, version: str, path: str, language: str = "en"):
+        self.project = project
+        self.version = version
+        self.path = path
+        self.base_url = f"https://{project}.readthedocs.io/{language}/{version}/"
+        self.pages: dict[str, dict[str, Any]] = {}
+        self.toc: list[tuple[int, str, str]] = []
+        self.toc_model: Optional[dict[str, Any]] = None
+        self.single_page = False
+        self.loaded_at = 0.0
+        self.load_seconds = 0.0
+        self._file = open(path, "rb")
+        try:
+            self._map = MappedFile(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            self.zip = zipfile.ZipFile(self._map)
+        except Exception:
+            self._file.close()
+            raise
+        
+        # Builds are usually zipped inside a top-level '<project>-<version>/' directory
+        names = self.zip.namelist()
+        indexes = [name for name in names if name == "index.html" or name.endswith("/index.html")]
+        root_index = min(indexes, key=lambda name: name.count('/'), default="index.html")
+        self.root = root_index[:-len("index.html")]
+        self.members = {name[len(self.root):]: name for name in names if name.startswith(self.root) and not name.endswith('/')}
+
+    def read(self, member: str) -> Optional[bytes]:
+        """Return an archive member by its path relative to the version root."""
+        name = self.members.get(member)
+        return self.zip.read(name) if name is not None else None
+
+    def parse_member(self, member: str) -> Optional[dict[str, Any]]:
+        """Extract one HTML member, streaming it through the incremental parser."""
+        parser = StreamingPageParser()
+        with self.zip.open(self.members[member]) as raw:
+            reader = io.TextIOWrapper(raw, encoding="utf-8", errors="replace")
+            while not parser.done:
+                chunk = reader.read(STREAM_FEED_CHARS)
+                if not chunk:
+                    break
+                parser.feed(chunk)
+        return parser.close()
+
+    def load(self) -> None:
+        """Extract all pages and build the table of contents tree (CPU bound; run in a thread)."""
+        started = time.perf_counter()
+        index = self.parse_member("index.html") if "index.html" in self.members else None
+        if index and index.get("documents"):
+            self.single_page = True
+            self.split_documents(index)
+        else:
+            for member in sorted(self.members):
+                if not member.endswith(".html") or member.startswith("_") or "/_" in member:
+                    continue
+                if member.rsplit('/', 1)[-1] in self.SKIPPED_PAGES:
+                    continue
+                page = index if member == "index.html" else self.parse_member(member)
+                if page and page["text"]:
+                    page["url"] = self.base_url + member
+                    self.pages[member] = page
+            html = self.read("index.html")
+            links = extract_toc_links(html.decode("utf-8", "replace"), HTML_PARSER) if html else None
+            self.toc = links or self.search_index_toc() or [
+                (0, page["title"], member) for member, page in self.pages.items()
+            ]
+        self.toc_model = {"url": self.base_url, "base_url": self.base_url, "links": self.toc,
+                          "tree": build_toc_tree(self.base_url, self.base_url, self.toc)}
+        self.loaded_at = time.time()
+        self.load_seconds = time.perf_counter() - started
+
+    def split_documents(self, page: dict[str, Any]) -> None:
+        """Cut a single-page build into one page per source document."""
+        text = page["text"]
+        documents = dict(page["documents"])
+        first_start = min(start for start, _ in documents.values())
+        if first_start > 0:
+            # The root document is everything before the first embedded one
+            documents = {"index": [0, max(first_start - 1, 0)], **documents}
+        
+        for name, (start, end) in documents.items():
+            sections = [
+                {**section, "start": section["start"] - start, "end": min(section["end"], end) - start}
+                for section in page["sections"] if start <= section["start"] < end
+            ]
+            anchors = {
+                anchor: [entry_start - start, min(entry_end, end) - start]
+                for anchor, (entry_start, entry_end) in page["anchors"].items() if start <= entry_start < end
+            }
+            member = f"{name}.html"
+            self.pages[member] = {
+                "title": sections[0]["title"] if sections else name,
+                "text": text[start:end],
+                "sections": sections,
+                "anchors": anchors,
+                "url": self.base_url + member,
+            }
+            
+            # The outline comes from the headings, so it does not depend on the theme
+            for index, section in enumerate(sections):
+                href = member if index == 0 or not section["id"] else f"{member}#{section['id']}"
+                self.toc.append((max(section["level"] - 1, 0), section["title"], href))
+
+    def search_index_toc(self) -> Optional[list[tuple[int, str, str]]]:
+        """A flat outline from Sphinx's searchindex.js (document order and titles)."""
+        data = self.read("searchindex.js")
+        if data is None:
+            return None
+        index = parse_sphinx_search_index(data.decode("utf-8", "replace"))
+        if not index or "docnames" not in index:
+            return None
+        titles = index.get("titles") or []
+        return [
+            (0, titles[number] if number < len(titles) else docname, f"{docname}.html")
+            for number, docname in enumerate(index["docnames"])
+            if f"{docname}.html" in self.pages
+        ]
+
+    def find_page(self, path: str) -> Optional[dict[str, Any]]:
+        """Look up a page the way the web server would resolve its URL."""
+        path = path.lstrip('/')
+        if path in ("", "index"):
+            path = "index.html"
+        candidates = [path]
+        if path.endswith('/'):
+            candidates.append(f"{path}index.html")
+        elif not path.endswith(".html"):
+            candidates += [f"{path}.html", f"{path}/index.html"]
+        for candidate in candidates:
+            if candidate in self.pages:
+                return self.pages[candidate]
+        return None
+
+    def close(self) -> None:
+        self.zip.close()
+        self._map.close()
+        self._file.close()
+
+def parse_sphinx_search_index(text: str) -> Optional[dict[str, Any]]:
+    """Decode a Sphinx searchindex.js file (``Search.setIndex({...})``)."""
+    start = text.find('(')
+    end = text.rfind(')')
+    if start < 0 or end <= start:
+        return None
+    try:
+        return json.loads(text[start + 1:end])
+    except ValueError:
+        return None
+
+# Loaded archives by (project, version)
+local_docs: LRUDict = LRUDict(MAX_LOADED_ARCHIVES, on_evict=lambda archive: archive.close())
+
+def check_slug(value: str) -> str:
+    """Return a project or version slug, raising ValueError unless it is a safe path component."""
+    if not SLUG_PATTERN.fullmatch(value) or '..' in value:
+        raise ValueError(f"invalid slug '{value}' (use letters, digits, '_', '.' and '-')")
+    return value
 
-# For debugging
-print(f"Python version: {sys.version}", file=sys.stderr)
-print(f"Using API token: {'Yes' if API_TOKEN else 'No'}", file=sys.stderr)
+def docs_project_dir(project: str) -> Optional[str]:
+    """The directory holding a project's archives, if a docs directory is set.
 
-async def make_readthedocs_request(url: str, token: Optional[str] = None) -> dict[str, Any] | None:
-    """Make a request to the Read the Docs API with proper error handling."""
-    # Check cache first
-    if url in cache and cache[url]["expires"] > asyncio.get_event_loop().time():
-        return cache[url]["data"]
+    Raises ValueError for an unsafe slug or a directory that resolves
+    outside DOCS_DIR (e.g. through a symlink).
+    """
+    if DOCS_DIR is None:
+        return None
+    root = os.path.realpath(DOCS_DIR)
+    directory = os.path.realpath(os.path.join(root, check_slug(project)))
+    if os.path.dirname(directory) != root:
+        raise ValueError(f"archives of '{project}' resolve outside the docs directory")
+    return directory
+
+def archive_path(project: str, version: str) -> Optional[str]:
+    """Where the archive for a project version is kept, if a docs directory is set.
+
+    Raises ValueError like docs_project_dir.
+    """
+    directory = docs_project_dir(project)
+    if directory is None:
+        return None
+    path = os.path.realpath(os.path.join(directory, f"{check_slug(version)}.zip"))
+    if os.path.dirname(path) != directory:
+        raise ValueError(f"archive of '{project}' ({version}) resolves outside the docs directory")
+    return path
+
+async def open_archive(project: str, version: str, path: str, language: str = "en") -> DocArchive:
+    """Open, load and register an archive, replacing any previous one."""
+    archive = await asyncio.to_thread(DocArchive, project, version, path, language)
+    try:
+        await asyncio.to_thread(archive.load)
+    except Exception:
+        archive.close()
+        raise
+    previous = local_docs.pop((project, version), None)
+    if previous is not None:
+        previous.close()
+    local_docs[(project, version)] = archive
+    if LOCAL_SEARCH_ENABLED:
+        await asyncio.gather(*(index_page(page["url"], page) for page in archive.pages.values()))
+    logger.info("Loaded %s pages of %s (%s) from %s in %.2fs",
+                len(archive.pages), project, version, path, archive.load_seconds)
+    return archive
+
+async def get_local_docs(project: str, version: str) -> Optional[DocArchive]:
+    """Return the loaded archive for a project version, loading a stored one on first use.
+
+    A stored archive replaced since it was loaded (e.g. ingested by another
+    worker process) is loaded again.
+    """
+    try:
+        path = archive_path(project, version)
+    except ValueError:
+        return None
+    archive = local_docs.get((project, version))
+    if archive is not None:
+        if archive.path != path or not is_newer_archive(path, archive):
+            return archive
+    elif path is None or not os.path.exists(path):
+        return None
+    try:
+        return await single_flight(f"archive|{project}|{version}", lambda: open_archive(project, version, path))
+    except Exception as e:
+        logger.warning("Error loading archive %s: %s", path, e)
+        return archive
+
+def is_newer_archive(path: str, archive: DocArchive) -> bool:
+    """Whether the stored archive file changed after the loaded copy was read."""
+    try:
+        return os.path.getmtime(path) > archive.loaded_at
+    except OSError:
+        return False
+
+async def load_project_archives(project: str) -> None:
+    """Load every stored archive of a project (e.g. before a local search)."""
+    try:
+        directory = docs_project_dir(project)
+    except ValueError:
+        return
+    if directory is None or not os.path.isdir(directory):
+        return
+    for name in sorted(os.listdir(directory)):
+        if name.endswith(".zip"):
+            await get_local_docs(project, name[:-len(".zip")])
+
+def has_local_docs(project: str, version: Optional[str] = None) -> bool:
+    """Whether an archive is loaded or stored for the project (and version)."""
+    try:
+        if version is not None:
+            path = archive_path(project, version)
+            return (project, version) in local_docs or (path is not None and os.path.exists(path))
+        if any(key[0] == project for key in local_docs):
+            return True
+        directory = docs_project_dir(project)
+    except ValueError:
+        return False
+    return directory is not None and os.path.isdir(directory)
+
+# Scratch directory for downloaded archives when no docs directory is configured
+scratch_docs_dir: Optional[str] = None
+
+async def htmlzip_url(project: str, version: str, language: str, token: Optional[str]) -> str:
+    """The htmlzip download URL for a version, from the API or the usual location."""
+    details = await make_readthedocs_request(f"{READTHEDOCS_API_BASE}/projects/{project}/versions/{version}/", token)
+    url = ((details or {}).get("downloads") or {}).get("htmlzip")
+    if url:
+        return str(httpx.URL(READTHEDOCS_API_BASE).join(url))
+    return f"https://{project}.readthedocs.io/_/downloads/{language}/{version}/htmlzip/"
+
+async def download_archive(url: str, destination: str) -> None:
+    """Stream a download to a file, replacing the destination only once complete.
+
+    Raises ValueError when a redirect leaves the archive hosts or the
+    download exceeds ARCHIVE_MAX_BYTES; the partial file is removed.
+    """
+    os.makedirs(os.path.dirname(destination), exist_ok=True)
+    partial = f"{destination}.{os.getpid()}.part"
+    response = await http_get(url, stream=True)
+    try:
+        response.raise_for_status()
+        check_archive_url(str(response.url))
+        if int(response.headers.get("Content-Length") or 0) > ARCHIVE_MAX_BYTES:
+            raise ValueError(f"the archive is larger than {ARCHIVE_MAX_BYTES} bytes")
+        start = time.perf_counter()
+        received = 0
+        with open(partial, "wb") as output:
+            async for chunk in response.aiter_bytes():
+                received += len(chunk)
+                if received > ARCHIVE_MAX_BYTES:
+                    raise ValueError(f"the archive is larger than {ARCHIVE_MAX_BYTES} bytes")
+                output.write(chunk)
+        add_body_time(response, time.perf_counter() - start)
+    except BaseException:
+        if os.path.exists(partial):
+            os.remove(partial)
+        raise
+    finally:
+        await response.aclose()
+        record_download(response)
+    # Replacing (not overwriting) keeps a currently mapped older archive intact
+    os.replace(partial, destination)
+
+def copy_archive(source: str, destination: str) -> None:
+    os.makedirs(os.path.dirname(destination), exist_ok=True)
+    partial = f"{destination}.{os.getpid()}.part"
+    shutil.copyfile(source, partial)
+    os.replace(partial, destination)
+
+def close_local_docs() -> None:
+    for archive in local_docs.values():
+        archive.close()
+    local_docs.clear()
+
+# One Sphinx inventory line: name, domain:role, priority, URI, display name
+INVENTORY_LINE = re.compile(r"(.+?)\s+(\S+)\s+(-?\d+)\s+?(\S*)\s+(.*)")
+
+class SymbolIndex:
+    """Symbols of one project version from its Sphinx ``objects.inv``.
+
+    Entries are stored compactly: page paths and roles are interned into
+    shared tables and referenced by index, and the anchor is omitted when
+    it equals the symbol name (the common ``#$`` case). Lookups by exact
+    name, by name ignoring case and by the last dotted component are
+    single dict hits.
+    """
+
+    # Roles that name documents and labels rather than API objects; API objects win name clashes
+    GENERIC_ROLES = ("std:doc", "std:label", "std:term")
+
+    def __init__(self, project: str, version: str):
+        self.project = project
+        self.version = version
+        self.loaded_at = time.time()  # Wall-clock time, so it can be persisted
+        self.pages: list[str] = []
+        self.roles: list[str] = []
+        self.entries: dict[str, tuple[int, Optional[str], int, Optional[str]]] = {}
+        self.by_lower: dict[str, str] = {}
+        self.by_short_name: dict[str, list[str]] = {}
+        self._page_ids: dict[str, int] = {}
+        self._role_ids: dict[str, int] = {}
+
+    def _intern(self, value: str, table: list[str], ids: dict[str, int]) -> int:
+        index = ids.get(value)
+        if index is None:
+            index = ids[value] = len(table)
+            table.append(sys.intern(value))
+        return index
+
+    def load(self, data: bytes) -> None:
+        """Decode an objects.inv file (version 2: four header lines, then zlib)."""
+        header, _, rest = data.partition(b"\n")
+        if not header.startswith(b"# Sphinx inventory version 2"):
+            raise ValueError("unsupported objects.inv format")
+        for _ in range(3):
+            _, _, rest = rest.partition(b"\n")
+        for line in zlib.decompress(rest).decode("utf-8", "replace").splitlines():
+            match = INVENTORY_LINE.match(line.rstrip())
+            if match is None:
+                continue
+            name, role, _, uri, display = match.groups()
+            if uri.endswith('$'):
+                uri = uri[:-1] + name
+            page, _, anchor = uri.partition('#')
+            if not page and anchor.startswith("document-"):
+                # Single-page builds point into one page as '#document-<docname>#<anchor>'
+                docname, _, anchor = anchor[len("document-"):].partition('#')
+                page = f"{docname}.html"
+            existing = self.entries.get(name)
+            if existing is not None and role in self.GENERIC_ROLES:
+                continue
+            self.entries[name] = (
+                self._intern(page, self.pages, self._page_ids),
+                None if anchor == name else (sys.intern(anchor) if anchor else ""),
+                self._intern(role, self.roles, self._role_ids),
+                None if display in ("-", name) else display,
+            )
+            if existing is not None:
+                continue
+            self.by_lower.setdefault(name.lower(), name)
+            short_name = name.rsplit('.', 1)[-1].lower()
+            if short_name != name.lower():
+                self.by_short_name.setdefault(short_name, []).append(name)
+
+    def snapshot(self) -> dict[str, Any]:
+        """The decoded tables as JSON data, for the warm-start snapshot."""
+        return {
+            "project": self.project,
+            "version": self.version,
+            "loaded_at": self.loaded_at,
+            "pages": self.pages,
+            "roles": self.roles,
+            "entries": self.entries,
+            "by_lower": self.by_lower,
+            "by_short_name": self.by_short_name,
+        }
+
+    def restore(self, data: dict[str, Any]) -> None:
+        """Load tables saved by snapshot() instead of decoding objects.inv again."""
+        self.loaded_at = data["loaded_at"]
+        self.pages = [sys.intern(page) for page in data["pages"]]
+        self.roles = [sys.intern(role) for role in data["roles"]]
+        self.entries = {name: tuple(entry) for name, entry in data["entries"].items()}
+        self.by_lower = data["by_lower"]
+        self.by_short_name = data["by_short_name"]
+        self._page_ids = {page: index for index, page in enumerate(self.pages)}
+        self._role_ids = {role: index for index, role in enumerate(self.roles)}
+
+    def get(self, name: str) -> Optional[dict[str, Any]]:
+        """Resolve an exact symbol name to its page, anchor, role and title."""
+        entry = self.entries.get(name)
+        if entry is None:
+            return None
+        page, anchor, role, display = entry
+        return {
+            "name": name,
+            "page": self.pages[page],
+            "anchor": name if anchor is None else anchor,
+            "role": self.roles[role],
+            "title": display or name,
+        }
+
+    def lookup(self, symbol: str) -> tuple[Optional[dict[str, Any]], list[str]]:
+        """Find a symbol by exact name, then ignoring case, then by its last component.
+
+        Returns the match (or None) and, when the name is ambiguous or
+        unknown, candidate names to suggest.
+        """
+        symbol = symbol.strip()
+        match = self.get(symbol) or self.get(self.by_lower.get(symbol.lower(), ""))
+        if match:
+            return match, []
+        candidates = self.by_short_name.get(symbol.rsplit('.', 1)[-1].lower(), [])
+        suffix = "." + symbol.lower()
+        narrowed = [name for name in candidates if name.lower().endswith(suffix)]
+        if len(narrowed) == 1:
+            return self.get(narrowed[0]), []
+        return None, (narrowed or candidates)[:10]
+
+# Symbol indexes by (project, version), and when a lookup last found none
+symbol_indexes: LRUDict = LRUDict(MAX_SYMBOL_INDEXES)
+missing_inventories: LRUDict = LRUDict(1024)
+
+async def load_inventory(project: str, version: str) -> Optional[SymbolIndex]:
+    """Fetch and decode a project's objects.inv: from an ingested archive, the disk tier or upstream."""
+    index = SymbolIndex(project, version)
+    archive = await get_local_docs(project, version)
+    if archive is not None:
+        data = archive.read("objects.inv")
+        if data is not None:
+            await asyncio.to_thread(index.load, data)
+            return index
     
+    known = page_url_shapes.get(project, {"prefix": "en/"})["prefix"]
+    for prefix in dict.fromkeys([known, "en/", ""]):
+        url = f"https://{project}.readthedocs.io/{prefix}{version}/objects.inv"
+        entry = await disk_cache_get("inventory", url)
+        data = None
+        if entry and entry["fresh"]:
+            disk_cache.stats["hits"] += 1
+            data = await asyncio.to_thread(disk_cache.get_body, "inventory", url)
+        if data is None:
+            try:
+                logger.debug("Fetching symbol inventory from: %s", url)
+                response = await http_get(url, headers=validator_headers(entry))
+                if response.status_code == 304 and entry:
+                    disk_cache.stats["revalidated"] += 1
+                    await disk_cache_touch("inventory", url, response)
+                    data = await asyncio.to_thread(disk_cache.get_body, "inventory", url)
+                elif response.status_code == 200:
+                    data = response.content
+                    await disk_cache_put("inventory", url, response, None)
+            except Exception as e:
+                logger.warning("Error fetching symbol inventory: %s", e)
+                if entry:
+                    disk_cache.stats["stale_served"] += 1
+                    data = await asyncio.to_thread(disk_cache.get_body, "inventory", url)
+        if data:
+            try:
+                await asyncio.to_thread(index.load, data)
+            except (ValueError, zlib.error) as e:
+                logger.warning("Could not decode %s: %s", url, e)
+                continue
+            return index
+    return None
+
+async def get_symbol_index(project: str, version: str) -> Optional[SymbolIndex]:
+    """Return the symbol index for a project version, loading it once per inventory TTL.
+
+    An index older than the TTL is still returned while a fresh copy loads
+    in the background.
+    """
+    await wait_for_warm_start()
+    key = (project, version)
+    index = symbol_indexes.get(key)
+    if index is not None:
+        if time.time() - index.loaded_at >= CACHE_TTLS["inventory"]:
+            run_in_background(refresh_symbol_index(project, version))
+        return index
+    # Projects without an inventory (e.g. MkDocs) are not asked again until the TTL passes
+    if time.monotonic() - missing_inventories.get(key, -math.inf) < CACHE_TTLS["inventory"]:
+        return None
+    return await refresh_symbol_index(project, version)
+
+async def refresh_symbol_index(project: str, version: str) -> Optional[SymbolIndex]:
+    """Load a project version's inventory and store the index, or note that it has none.
+
+    A stored index is kept when reloading it fails.
+    """
+    key = (project, version)
+    index = await single_flight(f"inventory|{project}|{version}", lambda: load_inventory(project, version))
+    if index is not None:
+        symbol_indexes[key] = index
+        missing_inventories.pop(key, None)
+    elif key not in symbol_indexes:
+        missing_inventories[key] = time.monotonic()
+    return index
+
+# Set by http_app: the ASGI app's lifespan then holds process resources, not each MCP session
+app_owns_resources = False
+
+@asynccontextmanager
+async def process_resources() -> AsyncIterator[None]:
+    """Start the metrics endpoint and the warm-start restore; save the snapshot and release resources on shutdown.
+
+    Pooled connections, parser workers, archives and the disk cache are
+    closed on the way out. Nothing else is built on the way in: HTTP clients, the parser pool and the parser
+    modules are created on first use, so a new session is answered at once.
+    """
+    global warm_start_task
+    await start_metrics_server()
+    if disk_cache is not None and WARM_START:
+        warm_start_task = run_in_background(load_warm_start())
+    try:
+        yield
+    finally:
+        await save_warm_start()
+        await stop_metrics_server()
+        await close_http_clients()
+        shutdown_extract_executor()
+        close_local_docs()
+        if disk_cache is not None:
+            disk_cache.close()
+
+@asynccontextmanager
+async def server_lifespan(server: FastMCP) -> AsyncIterator[None]:
+    """Hold process resources for a stdio session.
+
+    The HTTP transports run this for every session (or, when stateless,
+    every request), so there the app lifespan holds them once instead.
+    """
+    if app_owns_resources:
+        yield
+        return
+    async with process_resources():
+        yield
+
+# Initialize FastMCP server; its own logging follows READTHEDOCS_LOG_LEVEL, so stdio
+# sessions do not write a stderr line for every request
+mcp = FastMCP("readthedocs", lifespan=server_lifespan, log_level=LOG_LEVEL)
+
+def token_fingerprint(token: Optional[str]) -> str:
+    """Short, non-reversible key for an API token (used in cache and coalescing keys)."""
+    return hashlib.sha256(token.encode()).hexdigest()[:16] if token else "anonymous"
+
+async def make_readthedocs_request(url: str, token: Optional[str] = None) -> dict[str, Any] | None:
+    """Make a request to the Read the Docs API with proper error handling.
+
+    Responses are cached per token, so what one token may see is never
+    served to callers with another token or none.
+    """
     # Use the provided token, or fall back to the global token
     token_to_use = token or API_TOKEN
+    key = f"{token_fingerprint(token_to_use)}|{url}"
+    
+    # Check cache first
+    cached = cache.get("api", key)
+    if cached is not None:
+        return cached
     
+    # Identical concurrent requests (same URL and credentials) share one fetch
+    flight_key = f"api|{token_fingerprint(token_to_use)}|{normalize_url(url)}"
+    return await single_flight(flight_key, lambda: load_readthedocs_json(url, token_to_use, key))
+
+async def load_readthedocs_json(url: str, token_to_use: Optional[str], key: str) -> dict[str, Any] | None:
+    """Load an API response from the disk tier or upstream and cache it under ``key``."""
     headers = {
-        "User-Agent": USER_AGENT,
         "Accept": "application/json"
     }
     
     # Add authentication if token provided
     if token_to_use:
         headers["Authorization"] = f"Token {token_to_use}"
-        print(f"Using token for request to: {url}", file=sys.stderr)
+        logger.debug("Using token for request to: %s", url)
     
-    async with httpx.AsyncClient(follow_redirects=True) as client:
+    # Fall back to the persistent tier, revalidating stale entries
+    entry = await disk_cache_get("api", key)
+    if entry and entry["fresh"]:
+        disk_cache.stats["hits"] += 1
+        cache.set("api", key, entry["data"])
+        return entry["data"]
+    headers.update(validator_headers(entry))
+    
+    try:
+        response = await http_get(url, headers=headers)
+        if response.status_code == 304 and entry:
+            disk_cache.stats["revalidated"] += 1
+            await disk_cache_touch("api", key, response)
+            cache.set("api", key, entry["data"])
+            return entry["data"]
+        
+        response.raise_for_status()
+        data = response.json()
+        
+        # Cache the result
+        cache.set("api", key, data)
+        await disk_cache_put("api", key, response, data)
+        
+        return data
+    except Exception as e:
+        logger.warning("Error requesting %s: %s", url, e)
+        if entry:
+            # Serve the stale copy rather than failing outright
+            disk_cache.stats["stale_served"] += 1
+            return entry["data"]
+        return None
+
+class MetadataListing:
+    """Every record of one paginated API v3 listing, refreshed with ETags.
+
+    The first page is loaded on the request path and the remaining ``next``
+    pages are walked in the background. Each page keeps its own
+    ``ETag``/``Last-Modified`` validators, so a refresh re-walks the listing
+    with conditional requests and only downloads the pages that changed.
+    A stale listing keeps being served while it is refreshed.
+    """
+
+    def __init__(self, key: str, url: str, headers: dict[str, str]):
+        self.key = key
+        self.url = url
+        self.headers = headers
+        self.pages: list[dict[str, Any]] = []
+        self.count: Optional[int] = None
+        self.complete = False
+        self.fetched_at = -math.inf  # Wall-clock time, so it can be persisted
+        self.error: Optional[str] = None
+        self.task: Optional[asyncio.Task] = None
+        self.stats = {"pages_fetched": 0, "not_modified": 0, "refreshes": 0}
+
+    @property
+    def records(self) -> list[dict[str, Any]]:
+        return [record for page in self.pages for record in page["results"]]
+
+    @property
+    def fresh(self) -> bool:
+        return self.complete and self.fetched_at + CACHE_TTLS["metadata"] > time.time()
+
+    @property
+    def loading(self) -> bool:
+        return self.task is not None and not self.task.done()
+
+    async def fetch_page(self, index: int, url: str) -> Optional[str]:
+        """Load or revalidate the page at ``index`` and return the next page's URL."""
+        previous = self.pages[index] if index < len(self.pages) and self.pages[index]["url"] == url else None
+        response = await http_get(url, headers={**self.headers, **validator_headers(previous)})
+        if response.status_code == 304 and previous:
+            self.stats["not_modified"] += 1
+            return previous["next"]
+        response.raise_for_status()
+        data = response.json()
+        self.stats["pages_fetched"] += 1
+        self.count = data.get("count", self.count)
+        self.pages[index:index + 1] = [{
+            "url": url,
+            "next": data.get("next"),
+            "results": data.get("results") or [],
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+        }]
+        return data.get("next")
+
+    async def walk(self, start: int = 0) -> None:
+        """Follow ``next`` links from page ``start`` to the end of the listing."""
+        url = self.pages[start - 1]["next"] if start else self.url
+        index = start
         try:
-            response = await client.get(url, headers=headers, timeout=10.0)
-            response.raise_for_status()
-            data = response.json()
-            
-            # Cache the result
-            cache[url] = {
-                "data": data,
-                "expires": asyncio.get_event_loop().time() + CACHE_TTL
-            }
-            
-            return data
+            while url and index < METADATA_MAX_PAGES:
+                url = await self.fetch_page(index, url)
+                index += 1
         except Exception as e:
-            print(f"Error requesting {url}: {str(e)}", file=sys.stderr)
-            return None
+            self.error = str(e)
+            logger.warning("Error walking %s: %s", self.url, e)
+            return
+        # Drop pages past the end in case the listing shrank
+        del self.pages[index:]
+        self.complete = True
+        self.fetched_at = time.time()
+        self.error = None
+        await self.save()
+
+    def refresh(self) -> None:
+        """Revalidate the whole listing in the background."""
+        if not self.loading:
+            self.stats["refreshes"] += 1
+            self.task = run_in_background(self.walk())
+
+    def restore(self, entry: dict[str, Any]) -> None:
+        """Load pages saved to the disk tier by an earlier run."""
+        self.pages = entry["data"]["pages"]
+        self.count = entry["data"]["count"]
+        self.complete = True
+        self.fetched_at = entry["fetched_at"]
+
+    async def save(self) -> None:
+        if disk_cache is None:
+            return
+        try:
+            await asyncio.to_thread(
+                disk_cache.put, "metadata", self.key, None, {"pages": self.pages, "count": self.count}
+            )
+        except Exception as e:
+            logger.warning("Error writing disk cache: %s", e)
+
+# Cached API v3 listings by token fingerprint and URL
+metadata_listings: LRUDict = LRUDict(METADATA_MAX_LISTINGS)
+
+def listing_headers(token_to_use: Optional[str]) -> dict[str, str]:
+    headers = {"Accept": "application/json"}
+    if token_to_use:
+        headers["Authorization"] = f"Token {token_to_use}"
+    return headers
+
+async def open_listing(key: str, url: str, token_to_use: Optional[str]) -> MetadataListing:
+    """Create a listing from the disk tier, or load its first page and walk the rest in the background."""
+    listing = MetadataListing(key, url, listing_headers(token_to_use))
+    
+    entry = await disk_cache_get("metadata", key)
+    if entry:
+        disk_cache.stats["hits"] += 1
+        listing.restore(entry)
+        if not entry["fresh"]:
+            listing.refresh()
+        metadata_listings[key] = listing
+        return listing
+    
+    logger.debug("Loading listing: %s", url)
+    try:
+        next_url = await listing.fetch_page(0, url)
+    except Exception as e:
+        # Not remembered, so the next call tries again
+        listing.error = str(e)
+        logger.warning("Error requesting %s: %s", url, e)
+        return listing
+    if next_url:
+        listing.task = run_in_background(listing.walk(1))
+    else:
+        listing.complete = True
+        listing.fetched_at = time.time()
+        await listing.save()
+    metadata_listings[key] = listing
+    return listing
+
+async def get_listing(url: str, token: Optional[str] = None) -> MetadataListing:
+    """Return every record of a paginated API v3 collection, as far as it is loaded.
+
+    Listings are fetched once and then served from memory; stale ones are
+    returned as they are while an ETag revalidation runs in the background.
+    """
+    await wait_for_warm_start()
+    token_to_use = token or API_TOKEN
+    key = f"{token_fingerprint(token_to_use)}|{url}"
+    listing = metadata_listings.get(key)
+    if listing is None:
+        return await single_flight(f"metadata|{key}", lambda: open_listing(key, url, token_to_use))
+    if not listing.fresh and not listing.loading:
+        listing.refresh()
+    return listing
+
+def listing_note(listing: MetadataListing, noun: str) -> str:
+    """Explain a listing that is still loading or could not be refreshed."""
+    note = ""
+    if not listing.complete:
+        total = f" of {listing.count}" if listing.count is not None else ""
+        note += f"(Loaded {len(listing.records)}{total} {noun} so far; the rest are loading in the background.)\n"
+    elif listing.error:
+        note += f"(Could not refresh the listing, showing cached {noun}: {listing.error})\n"
+    return note
+
+# Background task restoring the warm-start snapshot, and what it restored
+warm_start_task: Optional[asyncio.Task] = None
+restored_signature: Optional[tuple] = None
+
+def take_snapshot() -> dict[str, Any]:
+    """Collect complete listings and the symbol indexes that are still within their TTL.
+
+    Only listings fetched with the server's own token (or none) are kept,
+    since a restored listing has to be refreshed with that token; listings
+    for per-call tokens stay in the disk tier under their own keys.
+    """
+    shared = f"{token_fingerprint(API_TOKEN)}|"
+    expired = time.time() - CACHE_TTLS["inventory"]
+    return {
+        "listings": [
+            {"key": listing.key, "url": listing.url, "pages": listing.pages, "count": listing.count,
+             "fetched_at": listing.fetched_at}
+            for listing in metadata_listings.values()
+            if listing.complete and listing.key.startswith(shared)
+        ],
+        "symbols": [index.snapshot() for index in symbol_indexes.values() if index.loaded_at > expired],
+    }
+
+def snapshot_signature(snapshot: dict[str, Any]) -> tuple:
+    """Identify a snapshot's contents by when each listing and index was loaded."""
+    return (
+        sorted((listing["key"], listing["fetched_at"]) for listing in snapshot["listings"]),
+        sorted((index["project"], index["version"], index["loaded_at"]) for index in snapshot["symbols"]),
+    )
+
+async def save_warm_start() -> None:
+    """Write the snapshot to the disk tier on shutdown, unless nothing changed since it was restored."""
+    if disk_cache is None or not WARM_START:
+        return
+    # A restore still running would leave its entries out of the snapshot
+    await wait_for_warm_start()
+    snapshot = take_snapshot()
+    if not snapshot["listings"] and not snapshot["symbols"]:
+        return
+    if snapshot_signature(snapshot) == restored_signature:
+        return
+    try:
+        await asyncio.to_thread(disk_cache.put, "snapshot", "warm-start", None, snapshot)
+    except Exception as e:
+        logger.warning("Error writing warm-start snapshot: %s", e)
+
+async def load_warm_start() -> None:
+    """Restore listings and symbol indexes from the last snapshot, keeping any loaded since."""
+    global restored_signature
+    entry = await disk_cache_get("snapshot", "warm-start")
+    if entry is None:
+        return
+    try:
+        headers = listing_headers(API_TOKEN)
+        for saved in entry["data"]["listings"]:
+            if saved["key"] not in metadata_listings:
+                listing = MetadataListing(saved["key"], saved["url"], headers)
+                listing.restore({"data": saved, "fetched_at": saved["fetched_at"]})
+                metadata_listings[saved["key"]] = listing
+        expired = time.time() - CACHE_TTLS["inventory"]
+        for saved in entry["data"]["symbols"]:
+            key = (saved["project"], saved["version"])
+            if key not in symbol_indexes and saved["loaded_at"] > expired:
+                index = SymbolIndex(*key)
+                await asyncio.to_thread(index.restore, saved)
+                symbol_indexes[key] = index
+        restored_signature = snapshot_signature(entry["data"])
+    except (KeyError, TypeError, ValueError) as e:
+        logger.warning("Ignoring unreadable warm-start snapshot: %s", e)
+        return
+    logger.info("Warm start: restored %s listings and %s symbol indexes",
+                len(entry["data"]["listings"]), len(entry["data"]["symbols"]))
+
+async def wait_for_warm_start() -> None:
+    """Let a running restore finish, so a first call does not fetch what it is about to restore."""
+    if warm_start_task is not None and not warm_start_task.done():
+        await asyncio.shield(warm_start_task)
+
+VERSION_NUMBER = re.compile(r"v?(\d+(?:\.(?:\d+|x))*)(?:[-.]?(dev|a|alpha|b|beta|c|rc|pre)\.?(\d*))?")
+# Pre-release labels in ascending order; a final release ranks above all of them
+PRE_RELEASE_RANKS = {"dev": 0, "a": 1, "alpha": 1, "b": 2, "beta": 2, "c": 3, "rc": 3, "pre": 3}
+
+def parse_version_number(slug: str) -> Optional[tuple[tuple[int, ...], int, int]]:
+    """Parse a version slug such as '2.1', 'v3.0.0rc1' or '4.x' for semver ordering.
+
+    Returns (release numbers, pre-release rank, pre-release number), or
+    None for slugs that are not version numbers (branch names).
+    """
+    match = VERSION_NUMBER.fullmatch(slug.lower())
+    if match is None:
+        return None
+    release, label, number = match.groups()
+    # A '4.x' maintenance branch sorts above every 4.* release
+    parts = tuple(10**9 if part == "x" else int(part) for part in release.split("."))
+    rank = PRE_RELEASE_RANKS[label] if label else len(PRE_RELEASE_RANKS)
+    return parts, rank, int(number or 0)
+
+def sort_versions(versions: list[dict[str, Any]]) -> list[dict[str, Any]]:
+    """Order versions as latest, stable, version numbers (newest first), then other branches by name."""
+    aliases = [v for slug in ("latest", "stable") for v in versions if v["slug"] == slug]
+    numbered, named = [], []
+    for version in versions:
+        if version["slug"] in ("latest", "stable"):
+            continue
+        number = parse_version_number(version["slug"])
+        if number is not None:
+            numbered.append((number, version))
+        else:
+            named.append(version)
+    numbered.sort(key=lambda item: item[0], reverse=True)
+    named.sort(key=lambda version: version["slug"])
+    return aliases + [version for _, version in numbered] + named
+
+def resolve_version_aliases(versions: list[dict[str, Any]]) -> dict[str, str]:
+    """Find the concrete version that 'latest' and 'stable' point to.
+
+    Uses the alias records of API v3 when present, then a version with the
+    same identifier (branch name or tag commit). 'stable' falls back to the
+    newest active final release, 'latest' to its branch name.
+    """
+    resolved = {}
+    for alias in ("latest", "stable"):
+        record = next((v for v in versions if v["slug"] == alias), None)
+        if record is None:
+            continue
+        target = next(
+            (pointed["slug"] for pointed in record.get("aliases") or [] if pointed.get("slug") not in (None, alias)),
+            None,
+        )
+        identifier = record.get("identifier")
+        if target is None and identifier:
+            target = next(
+                (v["slug"] for v in versions
+                 if v["slug"] not in ("latest", "stable") and identifier in (v.get("identifier"), v.get("verbose_name"))),
+                None,
+            )
+        if target is None and alias == "stable":
+            releases = [
+                (number, v["slug"]) for v in versions if v.get("active")
+                for number in [parse_version_number(v["slug"])]
+                if number is not None and number[1] == len(PRE_RELEASE_RANKS)
+            ]
+            target = max(releases)[1] if releases else None
+        if target is None and alias == "latest":
+            target = identifier
+        if target:
+            resolved[alias] = target
+    return resolved
+
+async def fetch_page(url: str, section: Optional[str] = None, count_miss: bool = True) -> Optional[dict[str, Any]]:
+    """Fetch a documentation page as its cleaned text plus section index.
+
+    See extract_page for the structure. The parsed page is cached, so
+    later requests for other sections or slices of it cost no download.
+    When only ``section`` is needed, a large page may be read just up to
+    the end of that section (the result then has ``partial`` set).
+    ``count_miss`` is passed to the cache lookup (see ResponseCache.get).
+    """
+    # Check cache first
+    cached = cache.get("page", url, count_miss)
+    if cached is not None:
+        return cached
+    
+    # Concurrent requests for the same page share one download and parse
+    key = f"page|{normalize_url(url)}" + (f"#{section}" if section else "")
+    return await single_flight(key, lambda: load_page(url, section))
 
 async def fetch_page_content(url: str) -> Optional[str]:
     """Fetch the content of a documentation page."""
-    # Check cache first
-    if url in cache and cache[url]["expires"] > asyncio.get_event_loop().time():
-        return cache[url]["data"]
+    page = await fetch_page(url)
+    return page["text"] if page else None
+
+async def load_page(url: str, section: Optional[str] = None) -> Optional[dict[str, Any]]:
+    """Load a page from the disk tier or upstream, extract it and cache it."""
+    # Fall back to the persistent tier, revalidating stale entries
+    entry = await disk_cache_get("page", url)
+    if entry and not isinstance(entry["data"], dict):
+        # Written by an older version that stored only the text
+        entry = None
+    if entry and entry["fresh"]:
+        disk_cache.stats["hits"] += 1
+        cache.set("page", url, entry["data"])
+        remember_page(url, entry["data"])
+        return entry["data"]
     
-    async with httpx.AsyncClient(follow_redirects=True) as client:
+    try:
+        logger.debug("Fetching content from: %s", url)
+        response = await http_get(url, stream=True, headers=validator_headers(entry))
         try:
-            print(f"Fetching content from: {url}", file=sys.stderr)
-            response = await client.get(url, timeout=10.0)
-            response.raise_for_status()
-            
-            print(f"Successfully fetched content. Status: {response.status_code}", file=sys.stderr)
-            
-            # Parse the HTML to extract the main content
-            soup = BeautifulSoup(response.text, 'html.parser')
-            
-            # Try multiple selectors for different themes and page structures
-            content = None
-            
-            # Common content selectors in different themes
-            content_selectors = [
-                ('div', {'role': 'main'}),
-                ('div', {'class': 'document'}),
-                ('div', {'class': 'rst-content'}),
-                ('article', {'role': 'main'}),
-                ('main', {}),
-                ('div', {'class': 'section'}),
-                ('div', {'id': 'content'}),
-                ('div', {'class': 'content'}),
-            ]
+            if response.status_code == 304 and entry:
+                # Not modified: skip both the download and the re-parse
+                disk_cache.stats["revalidated"] += 1
+                await disk_cache_touch("page", url, response)
+                cache.set("page", url, entry["data"])
+                remember_page(url, entry["data"])
+                return entry["data"]
             
-            # Try each selector until we find content
-            for tag, attrs in content_selectors:
-                content = soup.find(tag, attrs)
-                if content and len(content.get_text(strip=True)) > 100:  # Ensure there's substantial content
-                    print(f"Found content using selector: {tag}, {attrs}", file=sys.stderr)
-                    break
+            response.raise_for_status()
             
-            # If we still didn't find content, try the document body with title
-            if not content or len(content.get_text(strip=True)) < 100:
-                print("Standard content selectors failed. Trying body content...", file=sys.stderr)
-                title = soup.find('title')
-                title_text = title.get_text(strip=True) if title else "Documentation"
-                
-                # Get the body content
-                body = soup.find('body')
-                if body:
-                    # Strip navigation, header, footer elements
-                    for nav in body.find_all(['nav', 'header', 'footer']):
-                        nav.decompose()
-                    
-                    content = body
+            logger.debug("Successfully fetched content. Status: %s", response.status_code)
+            page, body = await read_page(response, section)
+        finally:
+            await response.aclose()
+            record_download(response)
+        
+        if page and page["text"]:
+            page["url"] = str(response.url)
+            if page.get("partial"):
+                # Only part of the page was read, so it must not stand in for the whole
+                return page
             
-            if content:
-                # Extract and clean up the text
-                extracted_text = content.get_text(separator='\n')
-                
-                # Remove excessive whitespace
-                extracted_text = '\n'.join(line.strip() for line in extracted_text.split('\n') if line.strip())
-                
-                # Cache the result
-                cache[url] = {
-                    "data": extracted_text,
-                    "expires": asyncio.get_event_loop().time() + CACHE_TTL
-                }
-                
-                return extracted_text
+            # Cache the result
+            cache.set("page", url, page)
+            await disk_cache_put("page", url, response, page, body)
+            remember_page(url, page)
             
-            print(f"Could not find suitable content in the page", file=sys.stderr)
-            return None
-        except Exception as e:
-            print(f"Error fetching page: {e}", file=sys.stderr)
+            return page
+        
+        logger.debug("Could not find suitable content in the page")
+        return None
+    except Exception as e:
+        logger.warning("Error fetching page: %s", e)
+        if entry:
+            # Serve the stale copy rather than failing outright
+            disk_cache.stats["stale_served"] += 1
+            return entry["data"]
+        return None
+
+async def read_page(response: httpx.Response, section: Optional[str] = None) -> tuple[Optional[dict[str, Any]], Optional[bytes]]:
+    """Read and extract a streamed page response.
+
+    Returns the extracted page and the body to keep in the disk tier.
+    Pages up to STREAM_THRESHOLD characters are read whole and extracted in
+    the worker pool as usual. Larger pages are fed to a StreamingPageParser
+    chunk by chunk, so neither the full HTML nor a parse tree is held in
+    memory; reading stops once ``section`` is complete (the page is then
+    marked ``partial``) or STREAM_MAX_BYTES have been downloaded (marked
+    ``truncated``). The body of a streamed page is not kept.
+    """
+    chunks: list[str] = []
+    size = 0
+    start = time.perf_counter()
+    text_chunks = response.aiter_text()
+    async for chunk in text_chunks:
+        chunks.append(chunk)
+        size += len(chunk)
+        if size > STREAM_THRESHOLD:
+            break
+    else:
+        add_body_time(response, time.perf_counter() - start)
+        # Parse the HTML off the event loop to extract the main content
+        html = ''.join(chunks)
+        page = await run_extraction(extract_page, html, HTML_PARSER)
+        return page, html.encode()
+    
+    logger.debug("Large page (over %s characters), extracting while downloading", STREAM_THRESHOLD)
+    parser = StreamingPageParser(section)
+    partial = truncated = False
+    # Parsing happens between reads, so it is subtracted from the download time
+    parse_seconds = 0.0
+    async for chunk in text_chunks:
+        chunks.append(chunk)
+        size += len(chunk)
+        if size < STREAM_FEED_CHARS:
+            continue
+        with timed_phase("parse") as timer:
+            await asyncio.to_thread(parser.feed, ''.join(chunks))
+        parse_seconds += timer["seconds"]
+        chunks = []
+        size = 0
+        if parser.done:
+            partial = True
+            break
+        if response.num_bytes_downloaded > STREAM_MAX_BYTES:
+            truncated = True
+            break
+    add_body_time(response, time.perf_counter() - start - parse_seconds)
+    
+    with timed_phase("parse"):
+        if chunks:
+            # The download ended without a break; feed the remainder
+            await asyncio.to_thread(parser.feed, ''.join(chunks))
+            partial = parser.done
+        page = await asyncio.to_thread(parser.close)
+    if page is not None:
+        if partial:
+            page["partial"] = True
+        if truncated:
+            logger.info("Stopped reading after %s bytes", response.num_bytes_downloaded)
+            page["truncated"] = True
+    return page, None
+
+def remember_page(url: str, page: dict[str, Any]) -> None:
+    """Feed a freshly loaded page to the local search index in the background."""
+    if LOCAL_SEARCH_ENABLED:
+        run_in_background(index_page(url, page))
+
+def toc_page_key(url: str, base_url: str) -> Optional[str]:
+    """The page a URL names, as a path relative to the version root without 'index.html'.
+
+    Returns None for links that leave the documentation version.
+    """
+    url = url.split('#', 1)[0].split('?', 1)[0]
+    if not url.startswith(base_url):
+        return None
+    path = url[len(base_url):]
+    if path == "index.html" or path.endswith("/index.html"):
+        path = path[:-len("index.html")]
+    return path
+
+def build_toc_tree(page_url: str, base_url: str, links: list[tuple[int, str, str]]) -> dict[str, Any]:
+    """Link TOC entries into a tree in one pass over the flat (level, text, href) list.
+
+    ``page_url`` is the page the links were found on and ``base_url`` the
+    version root that page paths are relative to.
+
+    Entries keep their position in ``links``. Each gets its parent, children
+    and previous/next sibling (indexes, None at the ends) and the page it
+    points to (see toc_page_key). ``page_order`` holds the first entry of
+    each distinct page in reading order and ``page_positions`` maps a page
+    to its place there, which is what get_page navigation walks. A level
+    that skips ahead hangs the entry under the nearest shallower one.
+    """
+    page = httpx.URL(page_url)
+    parents: list[Optional[int]] = []
+    children: list[list[int]] = []
+    previous_siblings: list[Optional[int]] = []
+    next_siblings: list[Optional[int]] = [None] * len(links)
+    depths: list[int] = []
+    pages: list[Optional[str]] = []
+    page_order: list[int] = []
+    page_positions: dict[str, int] = {}
+    roots: list[int] = []
+    ancestors: list[int] = []
+    for index, (level, _, href) in enumerate(links):
+        while ancestors and links[ancestors[-1]][0] >= level:
+            ancestors.pop()
+        parent = ancestors[-1] if ancestors else None
+        siblings = children[parent] if parent is not None else roots
+        previous = siblings[-1] if siblings else None
+        if previous is not None:
+            next_siblings[previous] = index
+        siblings.append(index)
+        parents.append(parent)
+        previous_siblings.append(previous)
+        children.append([])
+        depths.append(len(ancestors))
+        ancestors.append(index)
+        
+        try:
+            path = toc_page_key(str(page.join(href)), base_url)
+        except httpx.InvalidURL:
+            path = None
+        pages.append(path)
+        if path is not None and path not in page_positions:
+            page_positions[path] = len(page_order)
+            page_order.append(index)
+    return {
+        "roots": roots,
+        "parents": parents,
+        "children": children,
+        "previous_siblings": previous_siblings,
+        "next_siblings": next_siblings,
+        "depths": depths,
+        "pages": pages,
+        "page_order": page_order,
+        "page_positions": page_positions,
+    }
+
+def find_toc_entry(toc: dict[str, Any], wanted: str) -> Optional[int]:
+    """Find a TOC entry by page path or href (with or without '#anchor'), or by title ignoring case."""
+    wanted = wanted.strip()
+    tree = toc["tree"]
+    base_url = toc["base_url"]
+    if '#' not in wanted:
+        position = tree["page_positions"].get(toc_page_key(base_url + wanted.lstrip('/'), base_url))
+        if position is not None:
+            return tree["page_order"][position]
+    lowered = wanted.lower()
+    for index, (_, text, href) in enumerate(toc["links"]):
+        if href == wanted or text.lower() == lowered:
+            return index
+    return None
+
+def toc_navigation(toc: dict[str, Any], page_url: str) -> Optional[dict[str, Optional[tuple[str, str]]]]:
+    """Previous, next and parent pages of a page, as (title, path) pairs, from the TOC tree.
+
+    The homepage is usually not listed in the sidebar; its next page is the
+    first TOC entry. Returns None when the page is not in the TOC.
+    """
+    tree = toc["tree"]
+    links = toc["links"]
+    page = toc_page_key(page_url, toc["base_url"])
+    if page is None:
+        return None
+    
+    def describe(entry: Optional[int]) -> Optional[tuple[str, str]]:
+        return (links[entry][1], tree["pages"][entry]) if entry is not None else None
+    
+    order = tree["page_order"]
+    position = tree["page_positions"].get(page)
+    if position is None:
+        if page != "" or not order:
             return None
+        return {"previous": None, "next": describe(order[0]), "parent": None}
+    
+    parent = tree["parents"][order[position]]
+    while parent is not None and tree["pages"][parent] in (None, page):
+        parent = tree["parents"][parent]
+    return {
+        "previous": describe(order[position - 1]) if position > 0 else None,
+        "next": describe(order[position + 1]) if position + 1 < len(order) else None,
+        "parent": describe(parent),
+    }
+
+async def fetch_toc(project: str, version: str) -> Optional[dict[str, Any]]:
+    """Fetch the table of contents of a project version, parsed once and cached.
+
+    Returns ``{"url": <final homepage URL>, "base_url": <version root>,
+    "links": [(level, text, href), ...], "tree": <build_toc_tree result>}``
+    or None if the page has no recognizable TOC. HTTP errors are raised.
+    """
+    archive = await get_local_docs(project, version)
+    if archive is not None:
+        return archive.toc_model
+    
+    # Get the homepage which usually contains the TOC
+    url = f"https://{project}.readthedocs.io/{version}/"
+    
+    cached = cache.get("toc", url)
+    if cached is not None:
+        return cached
+    return await single_flight(f"toc|{url}", lambda: load_toc(url))
+
+async def load_toc(url: str) -> Optional[dict[str, Any]]:
+    """Download a homepage, extract its TOC links and build the tree."""
+    logger.debug("Attempting to fetch TOC from: %s", url)
+    response = await http_get(url)
+    response.raise_for_status()
+    
+    logger.debug("Successfully fetched page. Status: %s", response.status_code)
+    toc_links = await run_extraction(extract_toc_links, response.text, HTML_PARSER)
+    if toc_links is None:
+        return None
+    
+    page_url = str(response.url)
+    # The homepage may redirect to a page below the version root
+    base_url = page_url.split('#', 1)[0].split('?', 1)[0]
+    docs = parse_docs_url(base_url)
+    if docs and docs[2] and base_url.endswith(docs[2]):
+        base_url = base_url[:-len(docs[2])]
+    else:
+        base_url = base_url[:base_url.rfind('/') + 1]
+    toc = {"url": page_url, "base_url": base_url, "links": toc_links,
+           "tree": build_toc_tree(page_url, base_url, toc_links)}
+    cache.set("toc", url, toc)
+    return toc
+
+# URL layout that worked last for each project (the 1024 most recently used):
+# language prefix and page suffix
+page_url_shapes: LRUDict = LRUDict(1024)
+
+LANGUAGE_PATTERN = re.compile(r"[a-z]{2}(-[a-z]{2,4})?")
+
+def page_url_candidates(project: str, version: str, path: str) -> list[tuple[dict[str, str], str]]:
+    """List (shape, URL) pairs a page may live at, the remembered shape first.
+
+    A shape is a language prefix ('en/' or '' for single-language projects)
+    and a suffix ('', '/' or '/index.html') tried for paths that do not
+    already name an HTML file or a directory.
+    """
+    known = page_url_shapes.get(project, {"prefix": "en/", "suffix": ""})
+    prefixes = [known["prefix"]] + [prefix for prefix in ("en/", "") if prefix != known["prefix"]]
+    suffixes = [""]
+    # Directory-style paths (dirhtml/MkDocs builds) may need a slash or index.html
+    if path and not path.endswith('/') and not re.search(r"\.html?$", path):
+        suffixes += ["/", "/index.html"]
+        if known["suffix"] in suffixes:
+            suffixes.remove(known["suffix"])
+            suffixes.insert(0, known["suffix"])
+    shapes = [{"prefix": prefix, "suffix": suffix} for suffix in suffixes for prefix in prefixes]
+    
+    candidates = []
+    seen = set()
+    for shape in shapes:
+        url = f"https://{project}.readthedocs.io/{shape['prefix']}{version}/{path}{shape['suffix']}"
+        if url not in seen:
+            seen.add(url)
+            candidates.append((shape, url))
+    return candidates
+
+def remember_url_shape(project: str, version: str, shape: dict[str, str], page: dict[str, Any]) -> None:
+    """Record the layout a page was found at, using the post-redirect URL."""
+    shape = dict(shape)
+    parts = httpx.URL(page.get("url") or "").path.lstrip('/').split('/')
+    if len(parts) >= 2 and parts[1] == version and LANGUAGE_PATTERN.fullmatch(parts[0]):
+        shape["prefix"] = f"{parts[0]}/"
+    elif parts and parts[0] == version:
+        shape["prefix"] = ""
+    page_url_shapes[project] = shape
+
+async def first_page(candidates: list[tuple[dict[str, str], str]],
+                     section: Optional[str] = None) -> Optional[tuple[dict[str, str], dict[str, Any]]]:
+    """Fetch candidate URLs concurrently and return the first that yields a page.
+
+    Losing fetches are not cancelled (they are shared through single_flight
+    and may serve other callers); their results simply land in the cache.
+    """
+    async def attempt(shape: dict[str, str], url: str) -> Optional[tuple[dict[str, str], dict[str, Any]]]:
+        page = await fetch_page(url, section, count_miss=False)
+        return (shape, page) if page else None
+    
+    pending = {asyncio.ensure_future(attempt(shape, url)) for shape, url in candidates}
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None and task.result() is not None:
+                    return task.result()
+        return None
+    finally:
+        for task in pending:
+            task.cancel()
+
+async def resolve_page(project: str, version: str, path: str,
+                       section: Optional[str] = None) -> Optional[dict[str, Any]]:
+    """Find and fetch a page, trying the project's known URL layout first.
+
+    With a remembered layout (or a cached page) this is a single request;
+    otherwise every candidate layout is requested at once and the first
+    success wins, instead of paying one round-trip per fallback.
+    """
+    archive = await get_local_docs(project, version)
+    if archive is not None:
+        page = archive.find_page(path)
+        if page is not None:
+            return page
+    
+    # Probing every layout is one cache lookup, so at most one miss is counted
+    candidates = page_url_candidates(project, version, path)
+    for shape, url in candidates:
+        page = cache.get("page", url, count_miss=False)
+        if page is not None:
+            return page
+    cache.record_miss("page")
+    
+    if project in page_url_shapes:
+        shape, url = candidates[0]
+        page = await fetch_page(url, section, count_miss=False)
+        if page:
+            remember_url_shape(project, version, shape, page)
+            return page
+        candidates = candidates[1:]
+    
+    logger.debug("Trying %s URL variations for %s/%s/%s", len(candidates), project, version, path)
+    found = await first_page(candidates, section)
+    if found is None:
+        return None
+    shape, page = found
+    remember_url_shape(project, version, shape, page)
+    return page
+
+async def log_missing_project(project: str, token: Optional[str]) -> None:
+    """Warn (off the request path) when the API does not know a project."""
+    project_details = await make_readthedocs_request(f"{READTHEDOCS_API_BASE}/projects/{project}/", token)
+    if not project_details:
+        logger.warning("Project '%s' not found via API. Will try to access directly.", project)
+
+# Prefetch jobs by id, most recent last
+prefetch_jobs: OrderedDict[str, dict[str, Any]] = OrderedDict()
+prefetch_job_ids = itertools.count(1)
+# Earliest monotonic time the next prefetch request may go to each host
+prefetch_next_slot: dict[str, float] = {}
+
+def prefetch_targets(toc: dict[str, Any], max_pages: int) -> list[str]:
+    """Resolve TOC links to unique same-host page URLs, in TOC order."""
+    base = httpx.URL(toc["url"])
+    targets = []
+    seen = {str(base.copy_with(fragment=None))}
+    for _, _, href in toc["links"]:
+        try:
+            target = base.join(href).copy_with(fragment=None, query=None)
+        except Exception:
+            continue
+        if target.host != base.host or target.scheme not in ("http", "https"):
+            continue
+        target = str(target)
+        if target in seen:
+            continue
+        seen.add(target)
+        targets.append(target)
+        if len(targets) >= max_pages:
+            break
+    return targets
+
+async def wait_for_host_slot(host: str) -> None:
+    """Space prefetch requests to a host by the politeness delay and rate limit."""
+    interval = max(PREFETCH_DELAY, 1.0 / PREFETCH_RATE if PREFETCH_RATE > 0 else 0.0)
+    now = time.monotonic()
+    slot = max(prefetch_next_slot.get(host, now), now)
+    # Reserve the slot before sleeping so concurrent workers queue up behind it
+    prefetch_next_slot[host] = slot + interval
+    if slot > now:
+        await asyncio.sleep(slot - now)
+
+def new_prefetch_job(project: str, version: str) -> dict[str, Any]:
+    """Register a prefetch job; old finished jobs are dropped beyond 20."""
+    job = {
+        "id": str(next(prefetch_job_ids)),
+        "project": project,
+        "version": version,
+        "status": "pending",
+        "total": 0,
+        "done": 0,
+        "failed": 0,
+        "started": time.time(),
+        "finished": None,
+        "error": None,
+        "task": None,
+    }
+    prefetch_jobs[job["id"]] = job
+    while len(prefetch_jobs) > 20:
+        oldest = next(iter(prefetch_jobs.values()))
+        if oldest["finished"] is None:
+            break
+        prefetch_jobs.popitem(last=False)
+    return job
+
+async def run_prefetch(job: dict[str, Any], max_pages: int, concurrency: int,
+                       progress: Optional[Callable[[dict[str, Any], str, bool], None]] = None) -> dict[str, Any]:
+    """Crawl the pages linked from a project's TOC into the caches and indexes.
+
+    Pages go through fetch_page, so each one lands in the memory and disk
+    caches, and its section index and search index entries are built as a
+    side effect. ``progress`` is called after every page with the job, the
+    page URL and whether it succeeded.
+    """
+    job["status"] = "running"
+    try:
+        toc = await fetch_toc(job["project"], job["version"])
+        if toc is None:
+            raise ValueError("no table of contents found")
+        
+        # The homepage itself is worth having too
+        targets = [toc["url"]] + prefetch_targets(toc, max(max_pages - 1, 0))
+        targets = targets[:max_pages]
+        job["total"] = len(targets)
+        
+        semaphore = asyncio.Semaphore(max(concurrency, 1))
+        
+        async def prefetch_one(url: str) -> None:
+            async with semaphore:
+                await wait_for_host_slot(httpx.URL(url).host)
+                page = await fetch_page(url)
+            if page:
+                job["done"] += 1
+            else:
+                job["failed"] += 1
+            if progress:
+                progress(job, url, page is not None)
+        
+        await asyncio.gather(*(prefetch_one(url) for url in targets))
+        job["status"] = "completed"
+    except asyncio.CancelledError:
+        job["status"] = "cancelled"
+        raise
+    except Exception as e:
+        logger.warning("Error prefetching %s: %s", job['project'], e)
+        job["status"] = "failed"
+        job["error"] = str(e)
+    finally:
+        job["finished"] = time.time()
+    return job
+
+def format_prefetch_job(job: dict[str, Any]) -> str:
+    """One-line summary of a prefetch job."""
+    elapsed = (job["finished"] or time.time()) - job["started"]
+    formatted_job = f"Job {job['id']}: {job['project']} ({job['version']}) - {job['status']}, "
+    formatted_job += f"{job['done']}/{job['total']} pages cached"
+    if job["failed"]:
+        formatted_job += f", {job['failed']} failed"
+    formatted_job += f", {elapsed:.1f}s"
+    if job["error"]:
+        formatted_job += f" ({job['error']})"
+    return formatted_job
+
+GET_PAGE_HINT = "To view the full content of a result, use the get_page tool with the appropriate project, version, and path parameters."
+
+def output_options(output_format: Optional[str] = None, max_tokens: Optional[int] = None,
+                   max_chars: Optional[int] = None, if_none_match: Optional[str] = None) -> dict[str, Any]:
+    """Check a tool's output arguments and combine them into ``{"format", "budget", "if_none_match"}``.
+
+    The budget is the smaller of max_chars and max_tokens (at CHARS_PER_TOKEN
+    characters per token), or None when neither is given. Raises ValueError
+    for an unknown format.
+    """
+    output_format = (output_format or OUTPUT_FORMAT).strip().lower()
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f"output_format must be one of {', '.join(OUTPUT_FORMATS)}, not '{output_format}'")
+    budgets = [budget for budget in (max_chars, max_tokens * CHARS_PER_TOKEN if max_tokens else None) if budget]
+    return {
+        "format": output_format,
+        "budget": max(min(budgets), MIN_BUDGET_CHARS) if budgets else None,
+        "if_none_match": (if_none_match or "").strip() or None,
+    }
+
+class ToolReply:
+    """A tool reply assembled from parts and rendered once in one of OUTPUT_FORMATS.
+
+    ``heading`` titles the reply and ``body`` holds free text such as page
+    content. ``fields`` are labelled facts (navigation links, version
+    aliases). ``items`` are records with a ``title`` and optional ``link``,
+    ``text``, ``fields`` and ``flags``; with ``tree`` set they are TOC
+    entries indented by ``level``. ``notes`` describe the data (what was
+    left out, how to continue) and ``hints`` are usage tips that the
+    compact and JSON formats leave out. Every part is rendered to a string
+    once and the strings are joined at the end.
+
+    A character budget is met by cutting the body, then dropping trailing
+    items, with a note saying so. A reply never exceeds its budget: when
+    even that is not enough the hints, hash, notes and fields are left out
+    and the heading is cut. The content hash covers the heading, body,
+    fields and items but not the notes, so it is the same in every format
+    and budget that shows the same content.
+    """
+
+    def __init__(self, heading: str, body: Optional[str] = None, tree: bool = False):
+        self.heading = heading
+        self.body = body
+        self.tree = tree
+        self.fields: dict[str, str] = {}
+        self.items: list[dict[str, Any]] = []
+        self.notes: list[str] = []
+        self.hints: list[str] = []
+
+    def content_hash(self) -> str:
+        """A short digest of the content, for clients to send back as if_none_match."""
+        content = json.dumps([self.heading, self.body, self.fields, self.items], ensure_ascii=False)
+        return hashlib.sha256(content.encode()).hexdigest()[:16]
+
+    def reply(self, output: dict[str, Any], hashed: bool = False) -> str:
+        """Render for output_options, or say "unchanged" when the caller's if_none_match still matches."""
+        content_hash = self.content_hash() if hashed else None
+        if content_hash is not None and output["if_none_match"] == content_hash:
+            if output["format"] == "json":
+                return json.dumps({"unchanged": True, "hash": content_hash})
+            return f"Unchanged since your last read (content hash {content_hash})."
+        return self.render(output["format"], output["budget"], content_hash)
+
+    def render(self, output_format: str, budget: Optional[int] = None, content_hash: Optional[str] = None) -> str:
+        """Render in a format, within ``budget`` characters."""
+        text = self._join(output_format, self.body, self.items, self.notes, content_hash)
+        if budget is None or len(text) <= budget:
+            return text
+        
+        # When the heading, fields and notes alone do not fit, drop the optional parts until the reply does:
+        # the usage hints, the hash, the notes from the last, the trim note, the fields, and finally the end of the heading
+        reply = copy.copy(self)
+        reply.notes = list(self.notes)
+        trim_note = True
+        text = reply._trim(output_format, budget, content_hash, trim_note)
+        while len(text) > budget:
+            if reply.hints:
+                reply.hints = []
+            elif content_hash:
+                content_hash = None
+            elif reply.notes:
+                reply.notes.pop()
+            elif trim_note:
+                trim_note = False
+            elif reply.fields:
+                reply.fields = {}
+            elif reply.heading:
+                reply.heading = reply.heading[:max(len(reply.heading) - (len(text) - budget), 0)]
+            else:
+                break
+            text = reply._trim(output_format, budget, content_hash, trim_note)
+        return text
+
+    def _trim(self, output_format: str, budget: int, content_hash: Optional[str], trim_note: bool) -> str:
+        """Cut the body, then drop trailing items, to fit the budget, with a note saying so."""
+        text = self._join(output_format, self.body, self.items, self.notes, content_hash)
+        if len(text) <= budget:
+            return text
+        
+        # Size the rest with a worst-case note, then give the body what is left and drop items that do not fit
+        total = len(self.items)
+        note = f"[Trimmed to {budget} characters" + (f": {total} of {total} entries shown.]" if total else ".]")
+        notes = self.notes + [note] if trim_note else list(self.notes)
+        fixed = len(self._join(output_format, "" if self.body else self.body, [], notes, content_hash))
+        item_sizes = [len(block) for block in self._items(output_format, self.items)]
+        body = self.body
+        if body:
+            body = body[:max(budget - fixed - sum(item_sizes), 0)]
+        shown = total
+        while shown and fixed + len(self._quoted(output_format, body)) + sum(item_sizes[:shown]) > budget:
+            shown -= 1
+        if trim_note:
+            notes[-1] = f"[Trimmed to {budget} characters" + (f": {shown} of {total} entries shown.]" if total else ".]")
+        text = self._join(output_format, body, self.items[:shown], notes, content_hash)
+        while body and len(text) > budget:
+            # Separators and JSON escapes are not in the estimate above; shave off the difference
+            body = body[:max(len(body) - (len(text) - budget), 0)]
+            text = self._join(output_format, body, self.items[:shown], notes, content_hash)
+        return text
+
+    def _quoted(self, output_format: str, body: Optional[str]) -> str:
+        if body is None:
+            return ""
+        return json.dumps(body, ensure_ascii=False) if output_format == "json" else body
+
+    def _items(self, output_format: str, items: list[dict[str, Any]]) -> list[str]:
+        """Render each item to its own string."""
+        if output_format == "json":
+            return [json.dumps(self._json_item(item), ensure_ascii=False) + ", " for item in items]
+        blocks = []
+        for number, item in enumerate(items, 1):
+            title = item["title"]
+            flags = "".join(f" ({flag})" for flag in item.get("flags", ()))
+            link = item.get("link")
+            if self.tree:
+                indent = '  ' * item.get("level", 0)
+                if output_format == "markdown":
+                    blocks.append(f"{indent}- [{title}]({link})\n" if link else f"{indent}- {title}\n")
+                elif output_format == "compact":
+                    blocks.append(f"{indent}{title} {link}\n" if link else f"{indent}{title}\n")
+                else:
+                    blocks.append(f"{indent}- {title}: {link}\n" if link else f"{indent}- {title}\n")
+                continue
+            values = list(item.get("fields", {}).items())
+            if link:
+                values.append(("Link", link))
+            text = item.get("text")
+            if output_format == "compact":
+                parts = [f"{number}. {title}{flags}"] + [value for _, value in values] + ([text] if text else [])
+                blocks.append(" | ".join(parts) + "\n")
+            elif output_format == "markdown":
+                lines = [f"{number}. **{title}**{flags}\n"] + [f"   - {label}: {value}\n" for label, value in values]
+                blocks.append("".join(lines + ([f"   {text}\n"] if text else [])) + "\n")
+            else:
+                lines = [f"{number}. {title}{flags}\n"] + [f"   {label}: {value}\n" for label, value in values]
+                blocks.append("".join(lines + ([f"   {text}\n"] if text else [])) + "\n")
+        return blocks
+
+    def _json_item(self, item: dict[str, Any]) -> dict[str, Any]:
+        if "fields" not in item:
+            return item
+        fields = {label.lower().replace(' ', '_'): value for label, value in item["fields"].items()}
+        return {**{key: value for key, value in item.items() if key != "fields"}, **fields}
+
+    def _join(self, output_format: str, body: Optional[str], items: list[dict[str, Any]], notes: list[str],
+              content_hash: Optional[str]) -> str:
+        """Render the whole reply from a body, items and notes."""
+        item_blocks = self._items(output_format, items)
+        if output_format == "json":
+            parts = ['{"heading": ', json.dumps(self.heading, ensure_ascii=False)]
+            if self.fields:
+                fields = {label.lower().replace(' ', '_'): value for label, value in self.fields.items()}
+                parts += [', "fields": ', json.dumps(fields, ensure_ascii=False)]
+            if body is not None:
+                parts += [', "body": ', self._quoted(output_format, body)]
+            if self.items:
+                parts += [', "items": [', "".join(item_blocks).removesuffix(", "), "]"]
+            if notes:
+                parts += [', "notes": ', json.dumps(notes, ensure_ascii=False)]
+            if content_hash:
+                parts += [', "hash": ', json.dumps(content_hash)]
+            return "".join(parts) + "}"
+        
+        if output_format == "compact":
+            parts = [f"{self.heading}\n"]
+            parts += [f"{label}: {value}\n" for label, value in self.fields.items()]
+            if body:
+                parts.append(f"{body}\n")
+            parts += item_blocks
+            parts += [f"{note}\n" for note in notes]
+            if content_hash:
+                parts.append(f"hash: {content_hash}\n")
+            return "".join(parts)
+        
+        markdown = output_format == "markdown"
+        parts = [f"## {self.heading}\n\n" if markdown else f"{self.heading}:\n\n"]
+        if self.fields:
+            parts += [f"- **{label}:** {value}\n" if markdown else f"{label}: {value}\n" for label, value in self.fields.items()]
+            parts.append("\n")
+        if body:
+            parts.append(f"{body}\n\n")
+        parts += item_blocks
+        if item_blocks and self.tree:
+            parts.append("\n")
+        for note in notes + self.hints:
+            parts.append(f"> {note}\n\n" if markdown else f"{note}\n\n")
+        if content_hash:
+            parts.append(f"> Content hash: `{content_hash}` (send it as `if_none_match` to skip an unchanged reply)\n"
+                         if markdown else f"[Content hash: {content_hash}; send it as if_none_match to skip an unchanged reply.]\n")
+        return "".join(parts).rstrip("\n") + "\n"
+
+def find_section(page: dict[str, Any], section: str) -> Optional[dict[str, Any]]:
+    """Find a section by anchor id, heading path or heading title.
+
+    Anchors may be given with or without the leading '#'. A heading path
+    such as 'Quickstart > Section 1' matches the end of a section's full
+    path; all title comparisons ignore case. API entry anchors (for
+    example 'requests.Session.send') resolve to a pseudo-section covering
+    that entry.
+    """
+    wanted = section.strip().lstrip('#')
+    for candidate in page["sections"]:
+        if candidate["id"] == wanted:
+            return candidate
+    if wanted in page.get("anchors", {}):
+        start, end = page["anchors"][wanted]
+        return {"id": wanted, "title": wanted, "level": 0, "path": wanted, "start": start, "end": end}
+    
+    wanted_path = [part.strip().lower() for part in wanted.split('>')]
+    for candidate in page["sections"]:
+        path = [part.strip().lower() for part in candidate["path"].split(' > ')]
+        if path[-len(wanted_path):] == wanted_path:
+            return candidate
+    return None
+
+def format_section_outline(page: dict[str, Any], limit: int = 50) -> str:
+    """List a page's sections with their anchors, indented by level."""
+    sections = page["sections"]
+    if not sections:
+        return ""
+    min_level = min(section["level"] for section in sections)
+    outline = "Sections on this page (pass one as `section`):\n"
+    for section in sections[:limit]:
+        anchor = f" (#{section['id']})" if section["id"] else ""
+        outline += f"{'  ' * (section['level'] - min_level)}- {section['title']}{anchor}\n"
+    if len(sections) > limit:
+        outline += f"... and {len(sections) - limit} more sections\n"
+    return outline
 
 @mcp.tool()
-async def search_docs(query: str, project: str, max_results: int = 10, token: Optional[str] = None) -> str:
+@instrumented
+async def search_docs(query: str, project: str, max_results: int = 10, token: Optional[str] = None,
+                      version: Optional[str] = None, source: str = "auto", output_format: Optional[str] = None,
+                      max_tokens: Optional[int] = None, max_chars: Optional[int] = None) -> str:
     """Search for content in a Read the Docs project documentation.
     
     Args:
@@ -150,7 +3681,32 @@ async def search_docs(query: str, project: str, max_results: int = 10, token: Op
         project: The project slug (e.g., 'python', 'django')
         max_results: Maximum number of results to return
         token: Optional API token for authentication
+        version: Optional version to restrict local index results to
+        source: 'auto' (local index when it has matches, else the Read the Docs API),
+            'local' (local index only) or 'remote' (Read the Docs API only)
+        output_format: 'text' (default), 'compact', 'markdown' or 'json'
+        max_tokens: Optional budget for the whole reply, in tokens (about 4 characters each)
+        max_chars: Optional budget for the whole reply, in characters
     """
+    try:
+        output = output_options(output_format, max_tokens, max_chars)
+    except ValueError as e:
+        return f"Error: {e}"
+    source = (source or "auto").strip().lower()
+    if source not in SEARCH_SOURCES:
+        return f"Error: source must be one of {', '.join(SEARCH_SOURCES)}, not '{source}'"
+    
+    if source != "remote" and LOCAL_SEARCH_ENABLED:
+        # Ingested archives are complete, so their index is authoritative
+        if has_local_docs(project, version):
+            await load_project_archives(project)
+            source = "local"
+        min_pages = 1 if source == "local" else LOCAL_SEARCH_MIN_PAGES
+        local_results = search_local_index(query, project, max_results, output, version, min_pages)
+        if local_results or source == "local":
+            logger.debug("Answered search for '%s' in %s from the local index", query, project)
+            return local_results or f"No search results found for '{query}' in {project} documentation (local index)."
+    
     # Use the official Read the Docs search API with proper endpoint
     search_url = f"{READTHEDOCS_API_BASE}/search/"
     
@@ -162,11 +3718,10 @@ async def search_docs(query: str, project: str, max_results: int = 10, token: Op
         "page_size": max_results
     }
     
-    print(f"Using Read the Docs search API: {search_url} with query: {formatted_query}", file=sys.stderr)
+    logger.debug("Using Read the Docs search API: %s with query: %s", search_url, formatted_query)
     
     # Prepare headers with authentication if token is provided
     headers = {
-        "User-Agent": USER_AGENT,
         "Accept": "application/json"
     }
     
@@ -174,370 +3729,1353 @@ async def search_docs(query: str, project: str, max_results: int = 10, token: Op
     if token_to_use:
         headers["Authorization"] = f"Token {token_to_use}"
     
-    async with httpx.AsyncClient(follow_redirects=True) as client:
-        try:
-            response = await client.get(search_url, params=params, headers=headers, timeout=10.0)
+    cache_key = f"{token_fingerprint(token_to_use)}|{formatted_query}|{max_results}"
+    
+    try:
+        search_data = cache.get("search", cache_key)
+        if search_data is None:
+            response = await http_get(search_url, params=params, headers=headers)
             response.raise_for_status()
             search_data = response.json()
+            cache.set("search", cache_key, search_data)
             
-            print(f"Search API response received, status: {response.status_code}", file=sys.stderr)
-            
-            if not search_data.get("results") or len(search_data["results"]) == 0:
-                return f"No search results found for '{query}' in {project} documentation."
-            
-            # Format the results
-            formatted_results = f"Search results for '{query}' in {project} documentation:\n\n"
-            
-            for i, result in enumerate(search_data["results"][:max_results], 1):
-                # Get basic information
-                title = result.get("title", "Untitled")
-                
-                # Build the full URL from domain and path
-                domain = result.get("domain", "")
-                path = result.get("path", "")
-                full_url = f"{domain}{path}" if domain and path else ""
-                
-                # Get project and version info
-                project_info = result.get("project", {})
-                project_slug = project_info.get("slug", project) if isinstance(project_info, dict) else project
-                
-                version_info = result.get("version", {})
-                version_slug = version_info.get("slug", "latest") if isinstance(version_info, dict) else "latest"
-                
-                # Extract content from blocks
-                blocks = result.get("blocks", [])
-                excerpt = ""
-                
-                for block in blocks:
-                    if block.get("type") == "section" and block.get("content"):
-                        excerpt = block.get("content")
-                        break
-                
-                # Ensure we have an URL
-                if not full_url and project_slug and version_slug:
-                    # If we have a section ID in the first block, use it
-                    section_id = ""
-                    if blocks and blocks[0].get("id"):
-                        section_id = f"#{blocks[0].get('id')}"
-                    
-                    # Get title as path component if available
-                    if blocks and blocks[0].get("name"):
-                        path_component = blocks[0].get("name")
-                    else:
-                        path_component = title.lower().replace(' ', '-').replace('(', '').replace(')', '')
-                    
-                    # Construct URL with proper language code (/en/)
-                    full_url = f"https://{project_slug}.readthedocs.io/en/{version_slug}/{path_component}.html{section_id}"
-                
-                # Format the result entry
-                formatted_results += f"{i}. {title}\n"
-                formatted_results += f"   Link: {full_url}\n"
-                if excerpt:
-                    formatted_results += f"   {excerpt}\n"
-                formatted_results += "\n"
-            
-            # Add pagination info if available
-            if "next" in search_data and search_data.get("count", 0) > max_results:
-                formatted_results += f"\nShowing {min(max_results, len(search_data['results']))} of {search_data.get('count', 0)} results. Use a more specific query to narrow down the results."
-            
-            # Add instruction for viewing content
-            formatted_results += "\nTo view the full content of a result, use the get_page tool with the appropriate project, version, and path parameters."
-            
-            return formatted_results
+            logger.debug("Search API response received, status: %s", response.status_code)
+        
+        if not search_data.get("results") or len(search_data["results"]) == 0:
+            return f"No search results found for '{query}' in {project} documentation."
+        
+        return format_search_results(query, project, search_data, max_results, output)
+        
+    except Exception as e:
+        logger.warning("Error using search API: %s", e, exc_info=True)
+        
+        return f"Error searching for '{query}' in {project} documentation: {str(e)}"
+
+@timed_phase("format")
+def format_search_results(query: str, project: str, search_data: dict[str, Any], max_results: int,
+                          output: dict[str, Any]) -> str:
+    """Format a Read the Docs search API response."""
+    response = ToolReply(f"Search results for '{query}' in {project} documentation")
+    
+    for result in search_data["results"][:max_results]:
+        # Get basic information
+        title = result.get("title", "Untitled")
+        
+        # Build the full URL from domain and path
+        domain = result.get("domain", "")
+        path = result.get("path", "")
+        full_url = f"{domain}{path}" if domain and path else ""
+        
+        # Get project and version info
+        project_info = result.get("project", {})
+        project_slug = project_info.get("slug", project) if isinstance(project_info, dict) else project
+        
+        version_info = result.get("version", {})
+        version_slug = version_info.get("slug", "latest") if isinstance(version_info, dict) else "latest"
+        
+        # Extract content from blocks
+        blocks = result.get("blocks", [])
+        excerpt = ""
+        
+        for block in blocks:
+            if block.get("type") == "section" and block.get("content"):
+                excerpt = block.get("content")
+                break
+        
+        # Ensure we have an URL
+        if not full_url and project_slug and version_slug:
+            # If we have a section ID in the first block, use it
+            section_id = ""
+            if blocks and blocks[0].get("id"):
+                section_id = f"#{blocks[0].get('id')}"
             
-        except Exception as e:
-            print(f"Error using search API: {str(e)}", file=sys.stderr)
-            traceback_str = traceback.format_exc()
-            print(f"Traceback: {traceback_str}", file=sys.stderr)
+            # Get title as path component if available
+            if blocks and blocks[0].get("name"):
+                path_component = blocks[0].get("name")
+            else:
+                path_component = title.lower().replace(' ', '-').replace('(', '').replace(')', '')
             
-            return f"Error searching for '{query}' in {project} documentation: {str(e)}"
+            # Construct URL with proper language code (/en/)
+            full_url = f"https://{project_slug}.readthedocs.io/en/{version_slug}/{path_component}.html{section_id}"
+        
+        item = {"title": title, "link": full_url}
+        if excerpt:
+            item["text"] = excerpt
+        response.items.append(item)
+    
+    # Add pagination info if available
+    if "next" in search_data and search_data.get("count", 0) > max_results:
+        response.notes.append(f"Showing {min(max_results, len(search_data['results']))} of {search_data.get('count', 0)} results. Use a more specific query to narrow down the results.")
+    
+    response.hints.append(GET_PAGE_HINT)
+    return response.reply(output)
+
+def search_excerpt(text: str, query: str, width: int = 200) -> str:
+    """Return a single-line window of text around the first query term."""
+    lowered = text.lower()
+    positions = [lowered.find(term) for term in tokenize(query)]
+    positions = [position for position in positions if position >= 0]
+    start = max(min(positions) - width // 4, 0) if positions else 0
+    excerpt = ' '.join(text[start:start + width].split())
+    return ("..." if start else "") + excerpt + ("..." if start + width < len(text) else "")
+
+def search_local_index(query: str, project: str, max_results: int, output: dict[str, Any],
+                       version: Optional[str] = None, min_pages: int = 1) -> Optional[str]:
+    """Search the local index and format results like the remote search.
+
+    Returns None when fewer than ``min_pages`` pages of the project are
+    indexed or nothing matches.
+    """
+    index = search_indexes.get(project)
+    if index is None or len(index.documents_by_url) < min_pages or not index.has_version(version):
+        return None
+    results = index.search(query, version, max_results)
+    if not results:
+        return None
+    return format_local_results(query, project, results, len(index.documents_by_url), output)
+
+@timed_phase("format")
+def format_local_results(query: str, project: str, results: list[tuple[float, dict[str, Any]]], indexed: int,
+                         output: dict[str, Any]) -> str:
+    """Format local index matches like the remote search."""
+    response = ToolReply(f"Search results for '{query}' in {project} documentation")
+    for _, document in results:
+        response.items.append({
+            "title": document["title"] or "Untitled",
+            "link": document["url"] + (f"#{document['anchor']}" if document["anchor"] else ""),
+            "text": search_excerpt(document["excerpt"], query),
+        })
+    response.notes.append(f"Results from the local index ({indexed} pages indexed). Use source='remote' to query Read the Docs instead.")
+    response.hints.append(GET_PAGE_HINT)
+    return response.reply(output)
 
 @mcp.tool()
-async def get_page(project: str, version: str, path: str, token: Optional[str] = None) -> str:
-    """Get a specific documentation page.
+@instrumented
+async def get_page(project: str, version: str, path: str, token: Optional[str] = None,
+                   section: Optional[str] = None, offset: int = 0, limit: int = 8000,
+                   navigation: bool = False, output_format: Optional[str] = None,
+                   max_tokens: Optional[int] = None, max_chars: Optional[int] = None,
+                   if_none_match: Optional[str] = None) -> str:
+    """Get a specific documentation page, or one section of it.
     
     Args:
         project: The project slug (e.g., 'python', 'django')
         version: The documentation version (e.g., 'latest', 'stable', '3.0')
-        path: The page path (e.g., 'tutorial/index.html')
+        path: The page path (e.g., 'tutorial/index.html'); a '#anchor' suffix selects that section
         token: Optional API token for authentication
+        section: Optional section to return: an anchor id (e.g. 'installation'),
+            a heading path (e.g. 'Tutorial > Installation') or a heading title
+        offset: Character offset to start from within the page or section (for pagination)
+        limit: Maximum number of characters of page text to return
+        navigation: Also list the previous, next and parent pages from the table of contents
+        output_format: 'text' (default), 'compact', 'markdown' or 'json'
+        max_tokens: Optional budget for the whole reply, in tokens (about 4 characters each)
+        max_chars: Optional budget for the whole reply, in characters
+        if_none_match: The content hash from an earlier reply; while the content is
+            unchanged, a one-line reply is returned instead
     """
-    # Try to validate the project exists
-    project_details = await make_readthedocs_request(f"{READTHEDOCS_API_BASE}/projects/{project}/", token)
-    if not project_details:
-        print(f"Project '{project}' not found via API. Will try to access directly.", file=sys.stderr)
+    try:
+        output = output_options(output_format, max_tokens, max_chars, if_none_match)
+    except ValueError as e:
+        return f"Error: {e}"
+    return await read_page_reply(project, version, path, token, section, offset, limit, navigation, output)
+
+async def read_page_reply(project: str, version: str, path: str, token: Optional[str], section: Optional[str],
+                          offset: int, limit: int, navigation: bool, output: dict[str, Any],
+                          fields: Optional[dict[str, str]] = None, page: Optional[dict[str, Any]] = None) -> str:
+    """Resolve a page (or section) and format the requested slice; shared by get_page and lookup_symbol.
+
+    A ``page`` the caller already resolved is used as it is.
+    """
+    # Validating the project is informational only, so it must not delay the page
+    if project not in page_url_shapes and not has_local_docs(project, version):
+        run_in_background(log_missing_project(project, token))
+    
+    # A fragment in the path (as in search result links) selects a section
+    if '#' in path:
+        path, fragment = path.split('#', 1)
+        section = section or fragment
     
     # Ensure path doesn't start with a slash
     if path.startswith('/'):
         path = path[1:]
     
-    # Build the URL for the documentation page with language code
-    url = f"https://{project}.readthedocs.io/en/{version}/{path}"
-    print(f"Attempting to fetch documentation at: {url}", file=sys.stderr)
-    
-    content = await fetch_page_content(url)
-    if not content:
-        # Try without the path or with index.html appended
-        if not path.endswith('/') and not path.endswith('index.html'):
-            # Try with trailing slash
-            print(f"First attempt failed. Trying with trailing slash...", file=sys.stderr)
-            alternate_url = f"https://{project}.readthedocs.io/en/{version}/{path}/"
-            content = await fetch_page_content(alternate_url)
-            
-            if not content:
-                # Try with index.html
-                print(f"Second attempt failed. Trying with index.html...", file=sys.stderr)
-                alternate_url = f"https://{project}.readthedocs.io/en/{version}/{path}/index.html"
-                content = await fetch_page_content(alternate_url)
-        
-        if not content:
-            return f"Unable to fetch the page at {url} or its variations. Please check if the project, version, and path are correct."
+    if page is None:
+        page = await resolve_page(project, version, path, section)
+    if not page:
+        url = f"https://{project}.readthedocs.io/en/{version}/{path}"
+        return f"Unable to fetch the page at {url} or its variations. Please check if the project, version, and path are correct."
+    
+    # Narrow down to the requested section, served from the cached parse
+    content = page["text"]
+    heading = f"Documentation for {project} ({version}) - {path}"
+    if section:
+        match = find_section(page, section)
+        if not match:
+            return f"Section '{section}' not found in {path}.\n\n{format_section_outline(page)}"
+        content = content[match["start"]:match["end"]].strip()
+        heading += f" - {match['path']}"
+    
+    fields = dict(fields or {})
+    if navigation:
+        fields.update(await page_navigation(project, version, page))
+    return format_page_slice(page, heading, content, section, offset, limit, output, fields)
+
+async def page_navigation(project: str, version: str, page: dict[str, Any]) -> dict[str, str]:
+    """Previous/next/parent pages from the cached TOC tree, as reply fields."""
+    try:
+        toc = await fetch_toc(project, version)
+    except Exception as e:
+        logger.warning("Error fetching table of contents: %s", e)
+        toc = None
+    links = toc_navigation(toc, page.get("url") or "") if toc else None
+    if links is None:
+        return {"Navigation": "this page is not in the table of contents"}
+    
+    return {
+        label: f"{links[key][0]} ({links[key][1] or 'index.html'})"
+        for label, key in (("Previous", "previous"), ("Next", "next"), ("Up", "parent"))
+        if links[key]
+    }
+
+@timed_phase("format")
+def format_page_slice(page: dict[str, Any], heading: str, content: str, section: Optional[str],
+                      offset: int, limit: int, output: dict[str, Any], fields: Optional[dict[str, str]] = None) -> str:
+    """Return the requested slice of a page or section and say how to get the rest.
+
+    When the reply would exceed the output budget, the section outline is
+    left out and then the slice is shortened, so that the continuation
+    offset stays exact.
+    """
+    offset = max(offset, 0)
+    limit = max(limit, 1)
+    total = len(content)
+    
+    def build(limit: int, outline: bool) -> ToolReply:
+        response = ToolReply(heading, content[offset:offset + limit])
+        response.fields.update(fields or {})
+        shown = len(response.body)
+        if offset + limit < total:
+            more = "." if section else ", or pass section to read one part of the page."
+            response.notes.append(f"[Showing characters {offset}-{offset + shown} of {total}. "
+                                  f"Call get_page with offset={offset + limit} to continue{more}]")
+            if outline and not section:
+                response.notes.append(format_section_outline(page).rstrip("\n"))
+        elif offset:
+            response.notes.append(f"[Showing characters {offset}-{offset + shown} of {total}.]")
+        if page.get("truncated") and not section:
+            response.notes.append(f"[The page is larger than the download limit ({STREAM_MAX_BYTES} bytes); later parts are not included.]")
+        return response
+    
+    def overage(response: ToolReply) -> int:
+        return len(response.render(output["format"], content_hash="0" * 16)) - output["budget"]
+    
+    response = build(limit, True)
+    if output["budget"] is not None and overage(response) > 0:
+        response = build(limit, False)
+        if overage(response) > 0:
+            # The continuation note and JSON escapes change with the slice, so search for the longest that fits
+            low, high = 1, len(response.body) - 1
+            response = build(1, False)
+            while low <= high:
+                middle = (low + high) // 2
+                candidate = build(middle, False)
+                if overage(candidate) <= 0:
+                    response, low = candidate, middle + 1
+                else:
+                    high = middle - 1
+    return response.reply(output, hashed=True)
+
+async def run_batch(items: List[dict], required: tuple[str, ...],
+                    call: Callable[[dict], Awaitable[str]]) -> list[str]:
+    """Run ``call`` for each item concurrently, returning results in item order.
+
+    At most BATCH_CONCURRENCY items run at once. An item that is missing a
+    required key or raises produces an error string in its slot instead of
+    failing the whole batch.
+    """
+    semaphore = asyncio.Semaphore(max(BATCH_CONCURRENCY, 1))
+    
+    async def run_one(item: Any) -> str:
+        if not isinstance(item, dict):
+            return f"Error: expected an object with {', '.join(required)}, got {item!r}"
+        missing = [key for key in required if not item.get(key)]
+        if missing:
+            return f"Error: missing {', '.join(missing)}"
+        async with semaphore:
+            try:
+                return await call(item)
+            except Exception as e:
+                logger.warning("Error in batch item %s: %s", item, e)
+                return f"Error: {str(e)}"
+    
+    return await asyncio.gather(*(run_one(item) for item in items))
+
+def batch_labels(items: List[dict], required: tuple[str, ...], label: Callable[[dict], str]) -> list[str]:
+    """Label each batch item; items run_batch rejects are labelled as invalid instead."""
+    return [
+        label(item) if isinstance(item, dict) and all(item.get(key) for key in required)
+        else f"invalid item {index}"
+        for index, item in enumerate(items, 1)
+    ]
+
+def format_batch(labels: list[str], results: list[str], output_format: str = "text",
+                 budget: Optional[int] = None, total: Optional[int] = None) -> str:
+    """Join batch results under numbered headers, or into a JSON array for the json format.
+
+    Item replies that are not JSON (errors, for example) are embedded as
+    strings. ``total`` counts the items requested when only the leading
+    ones were run. Over ``budget``, trailing results are dropped, and a
+    closing note says how many items were left out.
+    """
+    total = max(total or 0, len(results))
+    
+    def join(shown: int) -> str:
+        note = None
+        if shown < total:
+            note = (f"[{total - shown} of {total} items left out to stay within {budget} characters; "
+                    f"request them in another call.]")
+        if output_format == "json":
+            entries = [
+                f'{{"label": {json.dumps(label, ensure_ascii=False)}, "result": '
+                f'{result if result.startswith("{") else json.dumps(result, ensure_ascii=False)}}}'
+                for label, result in zip(labels[:shown], results[:shown])
+            ]
+            if note:
+                entries.append(json.dumps({"note": note}))
+            return "[" + ", ".join(entries) + "]"
+        blocks = [
+            f"=== [{index}/{total}] {label} ===\n{result}"
+            for index, (label, result) in enumerate(zip(labels[:shown], results[:shown]), 1)
+        ]
+        return "\n\n".join(blocks + ([note] if note else []))
+    
+    shown = len(results)
+    text = join(shown)
+    while budget is not None and len(text) > budget and shown > 1:
+        shown -= 1
+        text = join(shown)
+    return text
+
+def plan_batch(labels: list[str], output: dict[str, Any], min_share: int = MIN_BUDGET_CHARS) -> tuple[int, Optional[int]]:
+    """How many leading items of a batch to run, and each one's character budget.
+
+    The reply budget left after the item headers is shared equally. When a
+    share would be under ``min_share``, only as many items are run as can
+    get that much; format_batch notes the rest as left out. The first item
+    always runs, so a budget below its shortest reply is still exceeded.
+    """
+    budget = output["budget"]
+    count = len(labels)
+    if budget is None:
+        return count, None
+    while True:
+        overhead = len(format_batch(labels[:count], [""] * count, output["format"], total=len(labels)))
+        share = (budget - overhead) // count
+        if share >= min_share or count == 1:
+            return count, max(share, 1)
+        count = max(min(count - 1, (budget - overhead) // min_share), 1)
+
+@mcp.tool()
+@instrumented
+async def get_pages(pages: List[dict], token: Optional[str] = None, limit: int = 8000,
+                    output_format: Optional[str] = None, max_tokens: Optional[int] = None,
+                    max_chars: Optional[int] = None) -> str:
+    """Get several documentation pages (or sections) in one call, fetched concurrently.
+    
+    Results are returned in the order requested; a page that fails shows its
+    error without affecting the others.
     
-    # Format the content to be more readable
-    # Truncate if too long
-    if len(content) > 8000:
-        content = content[:8000] + "...\n\n[Content truncated due to length. Use search_docs to find specific information.]"
+    Args:
+        pages: Objects with 'project', 'path' and optionally 'version' (default
+            'latest'), 'section', 'offset', 'navigation' and 'if_none_match', e.g.
+            [{"project": "requests", "version": "latest", "path": "user/quickstart.html"}]
+        token: Optional API token for authentication
+        limit: Maximum number of characters to return per page
+        output_format: 'text' (default), 'compact', 'markdown' or 'json'
+        max_tokens: Optional budget for the whole reply, in tokens, shared equally by the pages
+            (trailing pages are left out when a share would be too small)
+        max_chars: Optional budget for the whole reply, in characters, shared the same way
+    """
+    try:
+        output = output_options(output_format, max_tokens, max_chars)
+    except ValueError as e:
+        return f"Error: {e}"
+    if not pages:
+        return "No pages requested."
+    if len(pages) > BATCH_MAX_ITEMS:
+        return f"Too many pages requested ({len(pages)}); the limit is {BATCH_MAX_ITEMS} per call."
     
-    return f"Documentation for {project} ({version}) - {path}:\n\n{content}"
+    labels = batch_labels(pages, ("project", "path"),
+                          lambda item: f"{item['project']}/{item.get('version') or 'latest'}/{item['path']}")
+    count, item_budget = plan_batch(labels, output, MIN_PAGE_BUDGET_CHARS)
+    
+    async def fetch_one(item: dict) -> str:
+        return await get_page(item["project"], item.get("version") or "latest", item["path"], token,
+                              section=item.get("section"), offset=int(item.get("offset") or 0), limit=limit,
+                              navigation=bool(item.get("navigation")), output_format=output["format"],
+                              max_chars=item_budget, if_none_match=item.get("if_none_match"))
+    
+    results = await run_batch(pages[:count], ("project", "path"), fetch_one)
+    return format_batch(labels[:count], results, output["format"], output["budget"], len(pages))
 
 @mcp.tool()
-async def list_projects(query: Optional[str] = None, limit: int = 10, token: Optional[str] = None) -> str:
-    """List available documentation projects.
+@instrumented
+async def search_docs_multi(searches: List[dict], max_results: int = 5, token: Optional[str] = None,
+                            output_format: Optional[str] = None, max_tokens: Optional[int] = None,
+                            max_chars: Optional[int] = None) -> str:
+    """Run several searches in one call, concurrently, possibly across projects.
+    
+    Results are returned in the order requested; a search that fails shows
+    its error without affecting the others.
     
     Args:
-        query: Optional search term to filter projects
-        limit: Maximum number of projects to return
+        searches: Objects with 'project' and 'query', and optionally 'version'
+            and 'source' (see search_docs), e.g.
+            [{"project": "django", "query": "middleware"}, {"project": "flask", "query": "blueprints"}]
+        max_results: Maximum number of results per search
         token: Optional API token for authentication
+        output_format: 'text' (default), 'compact', 'markdown' or 'json'
+        max_tokens: Optional budget for the whole reply, in tokens, shared equally by the searches
+            (trailing searches are left out when a share would be too small)
+        max_chars: Optional budget for the whole reply, in characters, shared the same way
     """
-    url = f"{READTHEDOCS_API_BASE}/projects/"
-    params = []
+    try:
+        output = output_options(output_format, max_tokens, max_chars)
+    except ValueError as e:
+        return f"Error: {e}"
+    if not searches:
+        return "No searches requested."
+    if len(searches) > BATCH_MAX_ITEMS:
+        return f"Too many searches requested ({len(searches)}); the limit is {BATCH_MAX_ITEMS} per call."
     
-    if query:
-        params.append(f"q={query}")
-    if limit:
-        params.append(f"limit={limit}")
+    labels = batch_labels(searches, ("project", "query"), lambda item: f"{item['project']}: {item['query']}")
+    count, item_budget = plan_batch(labels, output)
     
-    if params:
-        url += "?" + "&".join(params)
+    async def search_one(item: dict) -> str:
+        return await search_docs(item["query"], item["project"], max_results, token,
+                                 version=item.get("version"), source=item.get("source") or "auto",
+                                 output_format=output["format"], max_chars=item_budget)
     
-    print(f"Requesting projects from URL: {url}", file=sys.stderr)
+    results = await run_batch(searches[:count], ("project", "query"), search_one)
+    return format_batch(labels[:count], results, output["format"], output["budget"], len(searches))
+
+@mcp.tool()
+@instrumented
+async def list_projects(query: Optional[str] = None, limit: int = 10, token: Optional[str] = None,
+                        output_format: Optional[str] = None, max_tokens: Optional[int] = None,
+                        max_chars: Optional[int] = None) -> str:
+    """List available documentation projects.
     
+    Args:
+        query: Optional search term to filter projects
+        limit: Maximum number of projects to return
+        token: Optional API token for authentication
+        output_format: 'text' (default), 'compact', 'markdown' or 'json'
+        max_tokens: Optional budget for the whole reply, in tokens (about 4 characters each)
+        max_chars: Optional budget for the whole reply, in characters
+    """
     try:
-        # First, try direct API request
-        response = await make_readthedocs_request(url, token)
+        output = output_options(output_format, max_tokens, max_chars)
+    except ValueError as e:
+        return f"Error: {e}"
+    try:
+        # The project listing is cached as a whole and filtered locally
+        listing = await get_listing(f"{READTHEDOCS_API_BASE}/projects/?limit={METADATA_PAGE_SIZE}", token)
+        projects = listing.records
+        if query:
+            needle = query.lower()
+            projects = [
+                project for project in projects
+                if needle in f"{project.get('slug', '')} {project.get('name', '')} {project.get('description') or ''}".lower()
+            ]
+            # Exact slug matches first, then slug prefixes, then everything else by name
+            projects.sort(key=lambda project: (
+                project.get("slug") != needle,
+                not project.get("slug", "").startswith(needle),
+                project.get("name", "").lower(),
+            ))
+        if projects:
+            return format_project_list(projects[:limit], output, listing_note(listing, "projects"))
         
-        if not response:
-            print(f"API request failed. Trying alternative approach...", file=sys.stderr)
-            # If direct API fails, try alternative approach - search the project directly
-            project_url = f"{READTHEDOCS_API_BASE}/projects/{query}/"
-            project_response = await make_readthedocs_request(project_url, token)
-            
-            if project_response:
-                # If project exists directly, create a fake "results" list with just this project
-                print(f"Found project directly: {query}", file=sys.stderr)
-                return format_project_list([project_response])
-            else:
-                # Try searching on the site directly
-                print(f"Trying to search readthedocs.org website for: {query}", file=sys.stderr)
-                async with httpx.AsyncClient(follow_redirects=True) as client:
-                    try:
-                        headers = {}
-                        if token or API_TOKEN:
-                            token_to_use = token or API_TOKEN
-                            headers["Authorization"] = f"Token {token_to_use}"
-                            
-                        search_url = f"https://readthedocs.org/search/?q={query}"
-                        search_response = await client.get(search_url, headers=headers, timeout=10.0)
-                        search_response.raise_for_status()
-                        
-                        soup = BeautifulSoup(search_response.text, 'html.parser')
-                        project_items = soup.select('.module-item')
-                        
-                        if project_items:
-                            print(f"Found {len(project_items)} projects on website search", file=sys.stderr)
-                            projects = []
-                            for item in project_items[:limit]:
-                                name_elem = item.select_one('h3 a')
-                                if name_elem:
-                                    name = name_elem.get_text(strip=True)
-                                    slug = name.lower().replace(' ', '-')
-                                    desc_elem = item.select_one('.module-item-desc')
-                                    description = desc_elem.get_text(strip=True) if desc_elem else ""
-                                    projects.append({
-                                        'name': name,
-                                        'slug': slug,
-                                        'description': description
-                                    })
-                            return format_project_list(projects)
-                    except Exception as e:
-                        print(f"Error in website search: {str(e)}", file=sys.stderr)
-        
-        # Handle normal API response
-        if response and "results" in response:
-            return format_project_list(response["results"])
-        else:
-            print(f"API response doesn't contain results. Response: {response}", file=sys.stderr)
-            return f"No projects found{' matching the query' if query else ''}."
+        if not query:
+            logger.debug("Project listing returned nothing: %s", listing.error or 'no results')
+            return "No projects found."
+        
+        logger.debug("No listed project matches. Trying alternative approach...")
+        # Try the query as a project slug
+        project_url = f"{READTHEDOCS_API_BASE}/projects/{query}/"
+        project_response = await make_readthedocs_request(project_url, token)
+        
+        if project_response:
+            # If project exists directly, create a fake "results" list with just this project
+            logger.debug("Found project directly: %s", query)
+            return format_project_list([project_response], output)
+        
+        projects = await search_projects_website(query, limit, token)
+        if projects:
+            return format_project_list(projects, output)
+        return f"No projects found matching the query."
     
     except Exception as e:
-        print(f"Error in list_projects: {str(e)}", file=sys.stderr)
+        logger.error("Error in list_projects: %s", e)
         return f"Error fetching projects: {str(e)}"
 
-def format_project_list(projects: List[dict]) -> str:
-    """Format a list of projects into a readable string."""
+async def search_projects_website(query: str, limit: int, token: Optional[str]) -> list[dict[str, Any]]:
+    """Search projects on the readthedocs.org website (last resort for list_projects)."""
+    logger.debug("Trying to search readthedocs.org website for: %s", query)
+    try:
+        headers = {}
+        if token or API_TOKEN:
+            token_to_use = token or API_TOKEN
+            headers["Authorization"] = f"Token {token_to_use}"
+            
+        search_response = await http_get("https://readthedocs.org/search/", params={"q": query}, headers=headers)
+        search_response.raise_for_status()
+        
+        from bs4 import BeautifulSoup
+        soup = BeautifulSoup(search_response.text, 'html.parser')
+        project_items = soup.select('.module-item')
+        logger.debug("Found %s projects on website search", len(project_items))
+        
+        projects = []
+        for item in project_items[:limit]:
+            name_elem = item.select_one('h3 a')
+            if name_elem:
+                name = name_elem.get_text(strip=True)
+                slug = name.lower().replace(' ', '-')
+                desc_elem = item.select_one('.module-item-desc')
+                description = desc_elem.get_text(strip=True) if desc_elem else ""
+                projects.append({
+                    'name': name,
+                    'slug': slug,
+                    'description': description
+                })
+        return projects
+    except Exception as e:
+        logger.warning("Error in website search: %s", e)
+        return []
+
+@timed_phase("format")
+def format_project_list(projects: List[dict], output: dict[str, Any], note: str = "") -> str:
+    """Format a list of projects, with an optional note about the listing."""
     if not projects:
         return "No projects found."
     
-    formatted_list = "Read the Docs projects:\n\n"
-    
-    for i, project in enumerate(projects, 1):
-        formatted_list += f"{i}. {project['name']}\n"
-        formatted_list += f"   Slug: {project['slug']}\n"
+    response = ToolReply("Read the Docs projects")
+    for project in projects:
+        fields = {"Slug": project['slug']}
         if 'description' in project and project['description']:
-            formatted_list += f"   Description: {project['description']}\n"
-        formatted_list += f"   URL: https://{project['slug']}.readthedocs.io\n\n"
-    
-    return formatted_list
+            fields["Description"] = project['description']
+        fields["URL"] = f"https://{project['slug']}.readthedocs.io"
+        response.items.append({"title": project['name'], "fields": fields})
+    if note:
+        response.notes.append(note.strip())
+    return response.reply(output)
 
 @mcp.tool()
-async def get_project_versions(project: str, active: bool = True, token: Optional[str] = None) -> str:
+@instrumented
+async def get_project_versions(project: str, active: bool = True, query: Optional[str] = None,
+                               limit: int = 50, token: Optional[str] = None, output_format: Optional[str] = None,
+                               max_tokens: Optional[int] = None, max_chars: Optional[int] = None) -> str:
     """Get available versions for a project.
     
+    Versions are listed as latest and stable (with the version each points
+    to), then version numbers newest first, then other branches.
+    
     Args:
         project: The project slug
         active: Whether to show only active versions (default: True)
+        query: Optional text the version name must contain, e.g. '3.' for all 3.x versions
+        limit: Maximum number of versions to return
         token: Optional API token for authentication
+        output_format: 'text' (default), 'compact', 'markdown' or 'json'
+        max_tokens: Optional budget for the whole reply, in tokens (about 4 characters each)
+        max_chars: Optional budget for the whole reply, in characters
     """
-    url = f"{READTHEDOCS_API_BASE}/projects/{project}/versions/"
-    if active:
-        url += "?active=true"
-    
-    response = await make_readthedocs_request(url, token)
-    if not response or "results" not in response:
+    try:
+        output = output_options(output_format, max_tokens, max_chars)
+    except ValueError as e:
+        return f"Error: {e}"
+    url = f"{READTHEDOCS_API_BASE}/projects/{project}/versions/?limit={METADATA_PAGE_SIZE}"
+    listing = await get_listing(url, token)
+    if not listing.pages:
         return f"Unable to fetch versions for project '{project}'."
     
-    versions = response["results"]
+    versions = listing.records
+    aliases = resolve_version_aliases(versions)
+    if active:
+        versions = [version for version in versions if version.get('active', False)]
+    if query:
+        versions = [version for version in versions if query.lower() in version['slug'].lower()]
     if not versions:
-        return f"No versions found for project '{project}'."
-    
-    formatted_versions = f"Available versions for {project}:\n\n"
+        return f"No versions found for project '{project}'.\n" + listing_note(listing, "versions")
     
-    for i, version in enumerate(versions, 1):
-        formatted_versions += f"{i}. {version['slug']}"
-        if version.get('active', False):
-            formatted_versions += " (active)"
-        formatted_versions += "\n"
+    return format_version_list(project, sort_versions(versions), aliases, limit, output,
+                               listing_note(listing, "versions"))
+
+@timed_phase("format")
+def format_version_list(project: str, versions: List[dict], aliases: dict[str, str], limit: int,
+                        output: dict[str, Any], note: str = "") -> str:
+    """Format sorted versions with their aliases, showing at most ``limit``."""
+    response = ToolReply(f"Available versions for {project}")
+    response.fields.update(aliases)
+    for version in versions[:limit]:
+        flags = [flag for flag in ('active', 'hidden') if version.get(flag, False)]
+        fields = {}
         if 'identifier' in version:
-            formatted_versions += f"   Identifier: {version['identifier']}\n"
-        formatted_versions += f"   URL: https://{project}.readthedocs.io/en/{version['slug']}/\n\n"
-    
-    return formatted_versions
+            fields["Identifier"] = version['identifier']
+        fields["URL"] = (version.get('urls') or {}).get('documentation') or f"https://{project}.readthedocs.io/en/{version['slug']}/"
+        response.items.append({"title": version['slug'], "flags": flags, "fields": fields})
+    if len(versions) > limit:
+        response.notes.append(f"({len(versions) - limit} more versions; narrow them down with query or raise limit)")
+    if note:
+        response.notes.append(note.strip())
+    return response.reply(output)
 
 @mcp.tool()
-async def get_toc(project: str, version: str = "latest", token: Optional[str] = None) -> str:
-    """Get the table of contents for a project.
+@instrumented
+async def get_toc(project: str, version: str = "latest", token: Optional[str] = None,
+                  depth: Optional[int] = None, subtree: Optional[str] = None,
+                  output_format: Optional[str] = None, max_tokens: Optional[int] = None,
+                  max_chars: Optional[int] = None, if_none_match: Optional[str] = None) -> str:
+    """Get the table of contents for a project, or one branch of it.
+    
+    The TOC is fetched and parsed once per project version; later calls,
+    whatever their depth or subtree, are answered from memory.
     
     Args:
         project: The project slug
         version: The documentation version
         token: Optional API token for authentication
+        depth: Optional number of levels to show (1 = top-level entries only)
+        subtree: Optional entry to show with its descendants, by page path
+            (e.g. 'user/quickstart.html'), link or title
+        output_format: 'text' (default), 'compact', 'markdown' or 'json'
+        max_tokens: Optional budget for the whole reply, in tokens (about 4 characters each)
+        max_chars: Optional budget for the whole reply, in characters
+        if_none_match: The content hash from an earlier reply; while the TOC is
+            unchanged, a one-line reply is returned instead
     """
-    # Try to validate project exists
-    project_details = await make_readthedocs_request(f"{READTHEDOCS_API_BASE}/projects/{project}/", token)
-    if not project_details:
-        print(f"Project '{project}' not found via API. Will try to access directly.", file=sys.stderr)
-        # Even if the API doesn't find it, the project might still exist on the site
+    try:
+        output = output_options(output_format, max_tokens, max_chars, if_none_match)
+    except ValueError as e:
+        return f"Error: {e}"
+    # Validating the project is informational only (not needed for an ingested archive)
+    if not has_local_docs(project, version):
+        run_in_background(log_missing_project(project, token))
     
-    # Get the homepage which usually contains the TOC
-    url = f"https://{project}.readthedocs.io/{version}/"
-    print(f"Attempting to fetch TOC from: {url}", file=sys.stderr)
+    try:
+        toc = await fetch_toc(project, version)
+        
+        if toc is None:
+            return f"Unable to find table of contents for {project} ({version}). The documentation may have a non-standard structure."
+        
+        root = None
+        if subtree:
+            root = find_toc_entry(toc, subtree)
+            if root is None:
+                return format_toc(project, version, toc, output, depth=1,
+                                  note=f"No entry '{subtree}' in the table of contents; the top-level entries are listed above.")
+        return format_toc(project, version, toc, output, depth, root)
+    except Exception as e:
+        logger.warning("Error fetching table of contents: %s", e)
+        return f"Error fetching table of contents: {str(e)}"
+
+@timed_phase("format")
+def format_toc(project: str, version: str, toc: dict[str, Any], output: dict[str, Any],
+               depth: Optional[int] = None, root: Optional[int] = None, note: str = "") -> str:
+    """Format TOC entries as a list indented by tree depth, from the roots or one entry down."""
+    tree = toc["tree"]
+    links = toc["links"]
+    heading = f"Table of Contents for {project} ({version})"
+    if root is not None:
+        heading = f"{heading} - {links[root][1]}"
+    response = ToolReply(heading, tree=True)
     
-    async with httpx.AsyncClient(follow_redirects=True) as client:
-        try:
-            response = await client.get(url, timeout=10.0)
-            response.raise_for_status()
-            
-            print(f"Successfully fetched page. Status: {response.status_code}", file=sys.stderr)
-            soup = BeautifulSoup(response.text, 'html.parser')
-            
-            # Look for the table of contents - try different selectors for different themes
-            toc = (soup.find('div', {'class': 'toctree-wrapper'}) or 
-                   soup.find('nav', {'class': 'toc'}) or
-                   soup.find('div', {'class': 'sphinxsidebarwrapper'}) or
-                   soup.find('div', {'class': 'sidebar-tree'}))
-            
-            if not toc:
-                # If we can't find a dedicated TOC section, look for any list of links
-                print(f"No standard TOC found. Looking for alternative link collections.", file=sys.stderr)
-                toc = soup.find('ul')
-            
-            if not toc:
-                return f"Unable to find table of contents for {project} ({version}). The documentation may have a non-standard structure."
-            
-            # Format the TOC
-            formatted_toc = f"Table of Contents for {project} ({version}):\n\n"
-            
-            links = toc.find_all('a')
-            print(f"Found {len(links)} links in TOC", file=sys.stderr)
-            
-            for link in links:
-                # Get the text and link
-                text = link.get_text(strip=True)
-                href = link.get('href')
-                
-                if text and href:
-                    # Calculate indentation based on CSS classes or parent elements
-                    indent_level = 0
-                    parent_li = link.find_parent('li')
-                    if parent_li:
-                        # Check if there are parent lists
-                        indent_level = len(parent_li.find_parents('li'))
-                    
-                    # Add to formatted TOC
-                    formatted_toc += f"{'  ' * indent_level}- {text}: {href}\n"
-            
-            return formatted_toc
-        except Exception as e:
-            print(f"Error fetching table of contents: {str(e)}", file=sys.stderr)
-            return f"Error fetching table of contents: {str(e)}"
+    if depth is not None:
+        depth = max(depth, 1)
+    hidden = False
+    pending = [(entry, 0) for entry in reversed([root] if root is not None else tree["roots"])]
+    while pending:
+        entry, level = pending.pop()
+        _, text, href = links[entry]
+        response.items.append({"title": text, "link": href, "level": level})
+        children = tree["children"][entry]
+        if depth is not None and level + 1 >= depth:
+            hidden = hidden or bool(children)
+            continue
+        pending.extend((child, level + 1) for child in reversed(children))
+    
+    if hidden:
+        response.notes.append("(Deeper entries are hidden; raise depth or pass one entry as subtree.)")
+    if note:
+        response.notes.append(note)
+    return response.reply(output, hashed=True)
+
+@mcp.tool()
+@instrumented
+async def prefetch_project(project: str, version: str = "latest", max_pages: int = PREFETCH_MAX_PAGES,
+                           concurrency: int = PREFETCH_CONCURRENCY) -> str:
+    """Start downloading a project's documentation in the background.
+    
+    Follows the links in the table of contents and warms the page cache,
+    section index and local search index, so later get_page and search_docs
+    calls are served locally. Returns a job id to use with prefetch_status
+    and cancel_prefetch.
+    
+    Args:
+        project: The project slug
+        version: The documentation version
+        max_pages: Maximum number of pages to fetch (at most the server's limit)
+        concurrency: Maximum number of pages fetched at the same time (at most the server's limit)
+    """
+    # Clients may ask for less than the server allows, not more
+    max_pages = min(max(max_pages, 1), PREFETCH_MAX_PAGES)
+    concurrency = min(max(concurrency, 1), PREFETCH_CONCURRENCY)
+    for job in prefetch_jobs.values():
+        if job["project"] == project and job["version"] == version and job["finished"] is None:
+            return f"Already prefetching {project} ({version}).\n{format_prefetch_job(job)}"
+    
+    job = new_prefetch_job(project, version)
+    job["task"] = run_in_background(run_prefetch(job, max_pages, concurrency))
+    return f"Started prefetching {project} ({version}).\n{format_prefetch_job(job)}"
+
+@mcp.tool()
+@instrumented
+async def prefetch_status(job_id: Optional[str] = None) -> str:
+    """Show the progress of prefetch jobs.
+    
+    Args:
+        job_id: Optional job id; all recent jobs are listed when omitted
+    """
+    if job_id is not None:
+        job = prefetch_jobs.get(job_id)
+        return format_prefetch_job(job) if job else f"No prefetch job with id {job_id}."
+    if not prefetch_jobs:
+        return "No prefetch jobs have been started."
+    return "\n".join(format_prefetch_job(job) for job in reversed(prefetch_jobs.values()))
+
+@mcp.tool()
+@instrumented
+async def cancel_prefetch(job_id: str) -> str:
+    """Cancel a running prefetch job. Pages already fetched stay cached.
+    
+    Args:
+        job_id: The id returned by prefetch_project
+    """
+    job = prefetch_jobs.get(job_id)
+    if job is None:
+        return f"No prefetch job with id {job_id}."
+    if job["finished"] is not None:
+        return f"Prefetch job {job_id} has already finished.\n{format_prefetch_job(job)}"
+    job["task"].cancel()
+    try:
+        await job["task"]
+    except asyncio.CancelledError:
+        pass
+    return f"Cancelled.\n{format_prefetch_job(job)}"
+
+@mcp.tool()
+@instrumented
+async def lookup_symbol(symbol: str, project: str, version: str = "latest", limit: int = 8000,
+                        output_format: Optional[str] = None, max_tokens: Optional[int] = None,
+                        max_chars: Optional[int] = None, if_none_match: Optional[str] = None) -> str:
+    """Get the documentation for an API symbol, e.g. 'requests.Session.send'.
+    
+    Resolves the name through the project's Sphinx objects.inv (loaded once
+    per project version) and returns exactly that entry's section of its
+    page, so no search is needed. Matching is exact first, then ignores
+    case, then accepts a unique trailing part such as 'Session.send'.
+    
+    Args:
+        symbol: The fully qualified (or uniquely trailing) symbol name
+        project: The project slug
+        version: The documentation version
+        limit: Maximum number of characters of documentation to return
+        output_format: 'text' (default), 'compact', 'markdown' or 'json'
+        max_tokens: Optional budget for the whole reply, in tokens (about 4 characters each)
+        max_chars: Optional budget for the whole reply, in characters
+        if_none_match: The content hash from an earlier reply; while the content is
+            unchanged, a one-line reply is returned instead
+    """
+    try:
+        output = output_options(output_format, max_tokens, max_chars, if_none_match)
+    except ValueError as e:
+        return f"Error: {e}"
+    index = await get_symbol_index(project, version)
+    if index is None:
+        return f"No symbol inventory (objects.inv) found for {project} ({version}). It is only published by Sphinx projects; try search_docs instead."
+    
+    match, suggestions = index.lookup(symbol)
+    if match is None:
+        if suggestions:
+            return f"'{symbol}' is ambiguous or unknown in {project} ({version}). Did you mean:\n" + "\n".join(f"- {name}" for name in suggestions)
+        return f"Symbol '{symbol}' not found in {project} ({version})."
+    
+    fields = {
+        "Symbol": f"{match['name']} ({match['role']})",
+        "Target": f"{match['page']}{'#' + match['anchor'] if match['anchor'] else ''}",
+    }
+    section = match["anchor"] or None
+    # Resolved once and handed on: a streamed partial page is not cached for a second lookup
+    page = await resolve_page(project, version, match["page"], section)
+    if page is None:
+        return f"Unable to fetch {match['page']}, which documents '{match['name']}' in {project} ({version})."
+    if section and find_section(page, section) is None:
+        # The anchor marks a point (e.g. a module target) rather than a section
+        section = None
+    return await read_page_reply(project, version, match["page"], None, section, 0, limit, False, output, fields, page)
+
+def check_archive_url(url: str) -> str:
+    """Return an archive URL, raising ValueError unless it is https on a Read the Docs host."""
+    parsed = httpx.URL(url)
+    if parsed.scheme != "https" or not any(parsed.host == host or parsed.host.endswith(f".{host}") for host in ARCHIVE_HOSTS):
+        raise ValueError(f"archives can only be downloaded over https from {', '.join(ARCHIVE_HOSTS)} (or their subdomains)")
+    return url
+
+async def ingest_archive(project: str, version: str = "latest", source: Optional[str] = None,
+                         language: str = "en", token: Optional[str] = None, local_files: bool = False) -> str:
+    """Fetch or copy a project version's archive, load it and summarize the result.
+
+    ``source`` may be a local file only with ``local_files`` (the ``ingest``
+    command); the MCP tool accepts Read the Docs download URLs alone, so a
+    client cannot make the server read arbitrary files or URLs.
+    """
+    global scratch_docs_dir
+    
+    started = time.perf_counter()
+    new_scratch_dir = None
+    archive = None
+    try:
+        check_slug(project)
+        check_slug(version)
+        destination = archive_path(project, version)
+        if destination is None:
+            if scratch_docs_dir is None:
+                scratch_docs_dir = new_scratch_dir = tempfile.mkdtemp(prefix="readthedocs-docs-")
+            destination = os.path.join(scratch_docs_dir, project, f"{version}.zip")
+        
+        if source and not source.startswith(("http://", "https://")):
+            if not local_files:
+                raise ValueError("source must be a Read the Docs download URL; "
+                                 "ingest local files with the 'readthedocs-mcp ingest' command")
+            source = os.path.abspath(os.path.expanduser(source))
+            if not os.path.isfile(source):
+                return f"Archive not found: {source}"
+            if archive_path(project, version) is None:
+                # Nowhere to keep a copy, so serve the file where it is
+                destination = source
+            elif source != os.path.abspath(destination):
+                await asyncio.to_thread(copy_archive, source, destination)
+        else:
+            # The API's download link is checked too, so it cannot point the server elsewhere
+            url = check_archive_url(source or await htmlzip_url(project, version, language, token))
+            logger.debug("Downloading documentation archive from: %s", url)
+            await download_archive(url, destination)
+        
+        archive = await open_archive(project, version, destination, language)
+    except Exception as e:
+        logger.warning("Error ingesting documentation: %s", e)
+        return f"Error ingesting documentation for {project} ({version}): {str(e)}"
+    finally:
+        # Remove a scratch directory made for an ingest that failed (or was cancelled),
+        # unless a concurrent ingest is writing to it
+        if archive is None and new_scratch_dir is not None:
+            if not any(files for _, _, files in os.walk(new_scratch_dir)):
+                shutil.rmtree(new_scratch_dir, ignore_errors=True)
+                scratch_docs_dir = None
+    
+    sections = sum(len(page["sections"]) for page in archive.pages.values())
+    anchors = sum(len(page["anchors"]) for page in archive.pages.values())
+    elapsed = time.perf_counter() - started
+    
+    result = f"Ingested {project} ({version}) from a {'single-page' if archive.single_page else 'multi-page'} build "
+    result += f"in {elapsed:.1f}s: {len(archive.pages)} pages, {sections} sections, {anchors} API entries.\n"
+    result += "get_page, get_toc and search_docs now serve this version locally."
+    if DOCS_DIR is None:
+        result += "\nSet READTHEDOCS_DOCS_DIR (or READTHEDOCS_CACHE_DIR) to keep archives across restarts."
+    return result
+
+@mcp.tool()
+@instrumented
+async def ingest_docs(project: str, version: str = "latest", source: Optional[str] = None,
+                      language: str = "en", token: Optional[str] = None) -> str:
+    """Download a project's documentation archive and serve it offline.
+    
+    After ingestion, get_page, get_toc and search_docs answer for this
+    project version from the local archive without any network requests.
+    
+    Args:
+        project: The project slug
+        version: The documentation version
+        source: Optional https URL of an htmlzip download on readthedocs.io,
+            readthedocs.org or readthedocs-hosted.com; defaults to the
+            version's htmlzip download on Read the Docs
+        language: The documentation language, used for page links
+        token: Optional API token for authentication
+    """
+    return await ingest_archive(project, version, source, language, token)
 
 @mcp.tool()
-async def get_project_details(project: str, token: Optional[str] = None) -> str:
+@instrumented
+async def get_project_details(project: str, token: Optional[str] = None, output_format: Optional[str] = None,
+                              max_tokens: Optional[int] = None, max_chars: Optional[int] = None) -> str:
     """Get detailed information about a project.
     
     Args:
         project: The project slug
         token: Optional API token for authentication
+        output_format: 'text' (default), 'compact', 'markdown' or 'json'
+        max_tokens: Optional budget for the whole reply, in tokens (about 4 characters each)
+        max_chars: Optional budget for the whole reply, in characters
     """
+    try:
+        output = output_options(output_format, max_tokens, max_chars)
+    except ValueError as e:
+        return f"Error: {e}"
     url = f"{READTHEDOCS_API_BASE}/projects/{project}/"
     
     response = await make_readthedocs_request(url, token)
     if not response:
         return f"Project '{project}' not found or is not accessible."
+    return format_project_details(project, response, output)
+
+@timed_phase("format")
+def format_project_details(project: str, details: dict[str, Any], output: dict[str, Any]) -> str:
+    """Format an API v3 project record."""
+    response = ToolReply(f"Project Details for {details.get('name', project)}")
+    response.fields.update({
+        "Slug": details.get('slug', 'N/A'),
+        "Description": details.get('description') or 'No description available',
+        "Homepage": details.get('homepage') or 'N/A',
+        "Language": (details.get('language') or {}).get('name', 'N/A'),
+        "Programming Language": (details.get('programming_language') or {}).get('name', 'N/A'),
+    })
+    if details.get('repository'):
+        response.fields["Repository URL"] = details['repository'].get('url', 'N/A')
+        response.fields["Repository Type"] = details['repository'].get('type', 'N/A')
+    response.fields["Documentation"] = f"https://{project}.readthedocs.io/"
+    return response.reply(output)
+
+@mcp.tool()
+@instrumented
+async def cache_stats(output_format: Optional[str] = None, max_tokens: Optional[int] = None,
+                      max_chars: Optional[int] = None) -> str:
+    """Get statistics for the in-memory and on-disk response caches.
+    
+    Args:
+        output_format: 'text' (default), 'compact', 'markdown' or 'json'
+        max_tokens: Optional budget for the whole reply, in tokens (about 4 characters each)
+        max_chars: Optional budget for the whole reply, in characters
+    """
+    try:
+        output = output_options(output_format, max_tokens, max_chars)
+    except ValueError as e:
+        return f"Error: {e}"
+    stats = cache.stats()
     
-    # Format project details
-    formatted_details = f"Project Details for {response.get('name', project)}:\n\n"
+    response = ToolReply("Response cache")
+    response.fields["Size"] = f"{stats['current_bytes']} of {stats['max_bytes']} bytes"
+    response.fields["Entries"] = str(stats['entries'])
     
-    # Basic information
-    formatted_details += f"Slug: {response.get('slug', 'N/A')}\n"
-    formatted_details += f"Description: {response.get('description', 'No description available')}\n"
-    formatted_details += f"Homepage: {response.get('homepage', 'N/A')}\n"
-    formatted_details += f"Language: {response.get('language', {}).get('name', 'N/A')}\n"
-    formatted_details += f"Programming Language: {response.get('programming_language', {}).get('name', 'N/A')}\n"
+    for namespace, counters in sorted(stats["namespaces"].items()):
+        lookups = counters["hits"] + counters["misses"]
+        hit_ratio = counters["hits"] / lookups if lookups else 0.0
+        response.items.append({"title": namespace, "fields": {
+            "TTL": f"{cache.ttls.get(namespace, cache.default_ttl)}s",
+            "Entries": str(counters['entries']),
+            "Hits": str(counters['hits']),
+            "Misses": str(counters['misses']),
+            "Hit ratio": f"{hit_ratio:.1%}",
+            "Evictions": str(counters['evictions']),
+            "Expirations": str(counters['expirations']),
+        }})
     
-    # Repository information
-    if 'repository' in response:
-        formatted_details += f"\nRepository:\n"
-        formatted_details += f"  URL: {response['repository'].get('url', 'N/A')}\n"
-        formatted_details += f"  Type: {response['repository'].get('type', 'N/A')}\n"
+    for project, index in sorted(search_indexes.items()):
+        response.items.append({"title": f"Local search index: {project}", "fields": {
+            "Pages": str(len(index.documents_by_url)),
+            "Sections": str(len(index.documents)),
+            "Terms": str(len(index.postings)),
+        }})
+    if search_indexes.evictions:
+        response.notes.append(f"Local search index projects dropped (least recently used): {search_indexes.evictions}")
     
-    # Documentation links
-    formatted_details += f"\nDocumentation:\n"
-    formatted_details += f"  URL: https://{project}.readthedocs.io/\n"
+    if metadata_listings:
+        listings = metadata_listings.values()
+        response.items.append({"title": "Metadata listings", "fields": {
+            "Listings": str(len(metadata_listings)),
+            "Records": str(sum(len(listing.records) for listing in listings)),
+            "Loading": str(sum(listing.loading for listing in listings)),
+            "API pages fetched": str(sum(listing.stats["pages_fetched"] for listing in listings)),
+            "Not modified": str(sum(listing.stats["not_modified"] for listing in listings)),
+            "Dropped": str(metadata_listings.evictions),
+        }})
     
-    return formatted_details
+    if disk_cache is not None:
+        disk = await asyncio.to_thread(disk_cache.summary)
+        fields = {"Path": disk['path'], "Bytes": str(disk['bytes'])}
+        fields.update({f"{namespace} entries": str(count) for namespace, count in sorted(disk["entries"].items())})
+        fields.update({
+            "Hits": str(disk['hits']),
+            "Misses": str(disk['misses']),
+            "Revalidated": str(disk['revalidated']),
+            "Stale served": str(disk['stale_served']),
+            "Writes": str(disk['writes']),
+            "Evicted": str(disk.get('evictions', 0)),
+        })
+        response.items.append({"title": "Disk cache", "fields": fields})
+    else:
+        response.notes.append("Disk cache: disabled (set READTHEDOCS_CACHE_DIR to enable)")
+    
+    return response.reply(output)
 
-if __name__ == "__main__":
+@mcp.tool()
+@instrumented
+async def connection_pool_stats() -> str:
+    """Get statistics for the shared HTTP connection pools.
+
+    Shows, per upstream host, how many responses were received and how many
+    new connections had to be opened; the difference was served by reused
+    keep-alive or multiplexed HTTP/2 connections.
+    """
+    if not pool_stats:
+        return "No upstream requests have been made yet."
+    
+    formatted_stats = f"HTTP connection pools (HTTP/2: {'enabled' if HTTP2_ENABLED else 'disabled'}, "
+    formatted_stats += f"max {HTTP_MAX_CONNECTIONS} connections / {HTTP_MAX_KEEPALIVE} keep-alive per host):\n\n"
+    
+    formatted_stats += f"Request coalescing: {coalescing_stats['upstream_fetches']} fetches started, "
+    formatted_stats += f"{coalescing_stats['coalesced']} identical requests coalesced, "
+    formatted_stats += f"{len(inflight_requests)} in flight\n\n"
+    
+    for host, stats in sorted(pool_stats.items()):
+        responses = stats["http2_responses"] + stats["http1_responses"]
+        reused = max(responses - stats["connections_opened"], 0)
+        formatted_stats += f"{host}\n"
+        formatted_stats += f"   Requests: {stats['requests']} (errors: {stats['errors']})\n"
+        formatted_stats += f"   Connections opened: {stats['connections_opened']} (TLS handshakes: {stats['tls_handshakes']})\n"
+        formatted_stats += f"   Requests on reused connections: {reused}\n"
+        formatted_stats += f"   Responses: HTTP/2 {stats['http2_responses']}, HTTP/1.1 {stats['http1_responses']}\n"
+        formatted_stats += f"   Pool open: {'Yes' if host in http_clients else 'No'}\n"
+        bucket = host_buckets.get(host)
+        if bucket is not None:
+            formatted_stats += f"   Rate limit: {bucket.rate:.1f}/{bucket.max_rate:.1f} req/s, "
+            formatted_stats += f"queue depth {bucket.waiting} (max {bucket.stats['max_queue_depth']}), "
+            formatted_stats += f"throttled {bucket.stats['throttled']}, slowdowns {bucket.stats['slowdowns']}\n"
+        breaker = circuit_breakers.get(host)
+        if breaker is not None:
+            formatted_stats += f"   Circuit breaker: {breaker.state} (opened {breaker.stats['opened']}, "
+            formatted_stats += f"rejected {breaker.stats['rejected']})\n"
+        formatted_stats += "\n"
+    
+    if token_buckets:
+        waiting = sum(bucket.waiting for bucket in token_buckets.values())
+        throttled = sum(bucket.stats["throttled"] for bucket in token_buckets.values())
+        formatted_stats += f"API token rate limits: {len(token_buckets)} tokens, queue depth {waiting}, throttled {throttled}\n"
+    formatted_stats += f"Retries: {retry_stats['retries']} (Retry-After honored {retry_stats['retry_after']}, "
+    formatted_stats += f"gave up {retry_stats['gave_up']})\n"
+    
+    return formatted_stats
+
+@mcp.tool()
+@instrumented
+async def server_stats() -> str:
+    """Get server-wide metrics: per-tool latency percentiles, time per phase, cache hit ratios and bytes transferred.
+
+    Phases are: queue (waiting for rate limits), connect (TCP and TLS
+    setup), download, parse (HTML extraction) and format (building the
+    response text).
+    """
+    uptime = time.time() - server_started
+    formatted_stats = f"Server statistics (uptime {uptime:.0f}s):\n\n"
+    
+    formatted_stats += "Tools:\n"
+    if not tool_stats:
+        formatted_stats += "   No tool calls yet.\n"
+    for name, stats in sorted(tool_stats.items()):
+        histogram = tool_latency[name]
+        formatted_stats += f"   {name}: {stats['calls']} calls, {stats['errors']} errors, {stats['in_flight']} in flight, "
+        formatted_stats += f"p50 {histogram.quantile(0.5) * 1000:.1f} ms, p95 {histogram.quantile(0.95) * 1000:.1f} ms, "
+        formatted_stats += f"p99 {histogram.quantile(0.99) * 1000:.1f} ms, {stats['chars']} chars returned\n"
+    
+    formatted_stats += "\nPhases:\n"
+    for phase in PHASES:
+        histogram = phase_latency[phase]
+        formatted_stats += f"   {phase}: {histogram.count} timed, total {histogram.total:.3f}s, "
+        formatted_stats += f"p50 {histogram.quantile(0.5) * 1000:.1f} ms, p95 {histogram.quantile(0.95) * 1000:.1f} ms\n"
+    
+    formatted_stats += "\nUpstream:\n"
+    if not pool_stats:
+        formatted_stats += "   No upstream requests yet.\n"
+    for host, stats in sorted(pool_stats.items()):
+        formatted_stats += f"   {host}: {stats['requests']} requests, {stats['errors']} errors, "
+        formatted_stats += f"{bytes_received.get(host, 0)} bytes received\n"
+    
+    formatted_stats += "\nCache hit ratios:\n"
+    for namespace, counters in sorted(cache.stats()["namespaces"].items()):
+        lookups = counters["hits"] + counters["misses"]
+        formatted_stats += f"   memory {namespace}: {counters['hits'] / lookups if lookups else 0.0:.1%} of {lookups} lookups\n"
+    if disk_cache is not None:
+        lookups = disk_cache.stats["hits"] + disk_cache.stats["revalidated"] + disk_cache.stats["misses"]
+        formatted_stats += f"   disk: {disk_cache.stats['hits'] / lookups if lookups else 0.0:.1%} fresh, "
+        formatted_stats += f"{disk_cache.stats['revalidated'] / lookups if lookups else 0.0:.1%} revalidated of {lookups} lookups\n"
+    formatted_stats += f"   request coalescing: {coalescing_stats['coalesced']} of "
+    formatted_stats += f"{coalescing_stats['upstream_fetches'] + coalescing_stats['coalesced']} fetches shared\n"
+    
+    if METRICS_PORT:
+        formatted_stats += f"\nPrometheus metrics: http://{METRICS_HOST}:{METRICS_PORT}/metrics\n"
+    return formatted_stats
+
+def metric_labels(**labels: str) -> str:
+    """Format Prometheus labels, escaping backslashes, quotes and newlines."""
+    escaped = []
+    for name, value in labels.items():
+        value = value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        escaped.append(f'{name}="{value}"')
+    return "{" + ",".join(escaped) + "}"
+
+def histogram_lines(name: str, histogram: LatencyHistogram, **labels: str) -> list[str]:
+    """Prometheus histogram samples: cumulative buckets, sum and count."""
+    lines = []
+    cumulative = 0
+    for bound, count in zip(LatencyHistogram.BOUNDS + (math.inf,), histogram.counts):
+        cumulative += count
+        le = "+Inf" if bound == math.inf else repr(bound)
+        lines.append(f"{name}_bucket{metric_labels(**labels, le=le)} {cumulative}")
+    lines.append(f"{name}_sum{metric_labels(**labels)} {histogram.total}")
+    lines.append(f"{name}_count{metric_labels(**labels)} {histogram.count}")
+    return lines
+
+def render_metrics() -> str:
+    """Render all counters in the Prometheus text exposition format (version 0.0.4)."""
+    lines = [
+        "# HELP readthedocs_tool_duration_seconds Tool call latency.",
+        "# TYPE readthedocs_tool_duration_seconds histogram",
+    ]
+    for name, histogram in sorted(tool_latency.items()):
+        lines += histogram_lines("readthedocs_tool_duration_seconds", histogram, tool=name)
+    for metric, key, description in (
+        ("readthedocs_tool_errors_total", "errors", "Tool calls that failed or returned an error."),
+        ("readthedocs_tool_output_chars_total", "chars", "Characters returned by tool calls."),
+    ):
+        lines += [f"# HELP {metric} {description}", f"# TYPE {metric} counter"]
+        lines += [f"{metric}{metric_labels(tool=name)} {stats[key]}" for name, stats in sorted(tool_stats.items())]
+    lines += ["# HELP readthedocs_tool_in_flight Tool calls currently running.", "# TYPE readthedocs_tool_in_flight gauge"]
+    lines += [f"readthedocs_tool_in_flight{metric_labels(tool=name)} {stats['in_flight']}" for name, stats in sorted(tool_stats.items())]
+    
+    lines += [
+        "# HELP readthedocs_phase_duration_seconds Time spent per phase: queue, connect, download, parse, format.",
+        "# TYPE readthedocs_phase_duration_seconds histogram",
+    ]
+    for phase in PHASES:
+        lines += histogram_lines("readthedocs_phase_duration_seconds", phase_latency[phase], phase=phase)
+    
+    lines += ["# HELP readthedocs_upstream_requests_total Requests sent upstream.", "# TYPE readthedocs_upstream_requests_total counter"]
+    lines += [f"readthedocs_upstream_requests_total{metric_labels(host=host)} {stats['requests']}" for host, stats in sorted(pool_stats.items())]
+    lines += ["# HELP readthedocs_upstream_received_bytes_total Response bytes received from upstream.",
+              "# TYPE readthedocs_upstream_received_bytes_total counter"]
+    lines += [f"readthedocs_upstream_received_bytes_total{metric_labels(host=host)} {count}" for host, count in sorted(bytes_received.items())]
+    
+    stats = cache.stats()
+    for metric, key in (("readthedocs_cache_hits_total", "hits"), ("readthedocs_cache_misses_total", "misses")):
+        lines += [f"# HELP {metric} In-memory cache lookups by outcome.", f"# TYPE {metric} counter"]
+        lines += [f"{metric}{metric_labels(namespace=namespace)} {counters[key]}" for namespace, counters in sorted(stats["namespaces"].items())]
+    lines += ["# HELP readthedocs_cache_bytes Estimated size of the in-memory cache.", "# TYPE readthedocs_cache_bytes gauge",
+              f"readthedocs_cache_bytes {stats['current_bytes']}"]
+    if disk_cache is not None:
+        lines += ["# HELP readthedocs_disk_cache_lookups_total Disk cache lookups by outcome.", "# TYPE readthedocs_disk_cache_lookups_total counter"]
+        for outcome in ("hits", "misses", "revalidated", "stale_served"):
+            lines.append(f"readthedocs_disk_cache_lookups_total{metric_labels(outcome=outcome)} {disk_cache.stats[outcome]}")
+    return "\n".join(lines) + "\n"
+
+# Prometheus endpoint, started with the server when METRICS_PORT is set
+metrics_server: Optional[asyncio.AbstractServer] = None
+
+async def serve_metrics_request(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    """Answer one HTTP request on the metrics port."""
+    try:
+        request_line = await asyncio.wait_for(reader.readline(), HTTP_TIMEOUT)
+        while (await asyncio.wait_for(reader.readline(), HTTP_TIMEOUT)).strip():
+            pass
+        parts = request_line.decode("latin-1").split()
+        if len(parts) >= 2 and parts[0] == "GET" and parts[1].split("?")[0] == "/metrics":
+            status, body = "200 OK", render_metrics().encode()
+        else:
+            status, body = "404 Not Found", b"Not found; metrics are served at /metrics\n"
+        writer.write(
+            f"HTTP/1.1 {status}\r\nContent-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+            f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body
+        )
+        await writer.drain()
+    except (asyncio.TimeoutError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+async def start_metrics_server() -> None:
+    global metrics_server
+    if METRICS_PORT and metrics_server is None:
+        try:
+            metrics_server = await asyncio.start_server(serve_metrics_request, METRICS_HOST, METRICS_PORT)
+        except OSError as e:
+            # With several workers only the first to bind the port serves it
+            logger.warning("Not serving metrics on port %s: %s", METRICS_PORT, e)
+            return
+        logger.info("Serving Prometheus metrics on http://%s:%s/metrics", METRICS_HOST, METRICS_PORT)
+
+async def stop_metrics_server() -> None:
+    global metrics_server
+    if metrics_server is not None:
+        metrics_server.close()
+        await metrics_server.wait_closed()
+        metrics_server = None
+
+@mcp.custom_route("/metrics", methods=["GET"])
+async def http_metrics(request: Request) -> Response:
+    """Prometheus metrics of the worker that answers, on the HTTP transports' own port."""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@mcp.custom_route("/healthz", methods=["GET"])
+async def http_health(request: Request) -> Response:
+    return PlainTextResponse("ok\n")
+
+def http_app() -> Starlette:
+    """Build the ASGI app for the HTTP transports; uvicorn calls this in every worker."""
+    global app_owns_resources
+    app_owns_resources = True
+    mcp.settings.stateless_http = STATELESS_HTTP
+    if ALLOWED_HOSTS:
+        mcp.settings.transport_security = TransportSecuritySettings(
+            enable_dns_rebinding_protection=True, allowed_hosts=ALLOWED_HOSTS, allowed_origins=[])
+    elif SERVER_HOST not in ("127.0.0.1", "localhost", "::1"):
+        # Listening beyond loopback is deliberate; clients use whatever name reaches the host
+        mcp.settings.transport_security = None
+    app = mcp.sse_app() if TRANSPORT == "sse" else mcp.streamable_http_app()
+    
+    sessions_lifespan = app.router.lifespan_context
+    
+    @asynccontextmanager
+    async def lifespan(app: Starlette) -> AsyncIterator[None]:
+        async with process_resources(), sessions_lifespan(app):
+            yield
+    
+    app.router.lifespan_context = lifespan
+    return app
+
+def run_http_server() -> None:
+    """Serve the HTTP transport with uvicorn, in SERVER_WORKERS processes."""
+    import uvicorn
+    
+    logger.info("Serving %s on http://%s:%s with %s worker(s)", TRANSPORT, SERVER_HOST, SERVER_PORT, SERVER_WORKERS)
+    if SERVER_WORKERS > 1 and disk_cache is None:
+        logger.warning("Workers do not share caches without READTHEDOCS_CACHE_DIR; each keeps its own in memory.")
+    uvicorn.run(
+        "readthedocs:http_app",
+        factory=True,
+        host=SERVER_HOST,
+        port=SERVER_PORT,
+        workers=SERVER_WORKERS,
+        limit_concurrency=SERVER_MAX_CONNECTIONS or None,
+        log_level=LOG_LEVEL.lower(),
+    )
+
+async def prefetch_cli(project: str, version: str, max_pages: int, concurrency: int) -> int:
+    """Run a prefetch job to completion, printing progress to stderr."""
+    def report(job: dict[str, Any], url: str, ok: bool) -> None:
+        print(f"[{job['done'] + job['failed']}/{job['total']}] {'ok    ' if ok else 'failed'} {url}", file=sys.stderr)
+    
+    job = new_prefetch_job(project, version)
+    try:
+        await run_prefetch(job, max_pages, concurrency, progress=report)
+        # Let queued search index updates finish before exiting
+        if background_tasks:
+            await asyncio.gather(*background_tasks, return_exceptions=True)
+    finally:
+        await close_http_clients()
+        shutdown_extract_executor()
+        if disk_cache is not None:
+            disk_cache.close()
+    print(format_prefetch_job(job), file=sys.stderr)
+    return 0 if job["status"] == "completed" else 1
+
+async def ingest_cli(project: str, version: str, source: Optional[str], language: str) -> int:
+    """Ingest an archive into the docs directory, printing the summary."""
+    try:
+        result = await ingest_archive(project, version, source, language, local_files=True)
+    finally:
+        await close_http_clients()
+        shutdown_extract_executor()
+        close_local_docs()
+        if disk_cache is not None:
+            disk_cache.close()
+    print(result, file=sys.stderr)
+    return 1 if result.startswith(("Error", "Archive not found")) else 0
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Command line entry point: run the MCP server, or prefetch or ingest a project."""
+    import argparse
+    global TRANSPORT, SERVER_HOST, SERVER_PORT, SERVER_WORKERS, MAX_CONCURRENT_CALLS, STATELESS_HTTP
+    
+    parser = argparse.ArgumentParser(prog="readthedocs-mcp", description="ReadTheDocs MCP server")
+    subcommands = parser.add_subparsers(dest="command")
+    serve = subcommands.add_parser("serve", help="Run the MCP server (default; over stdio unless --transport is given)")
+    serve.add_argument("--transport", choices=("stdio", "streamable-http", "sse"), default=TRANSPORT,
+                       help=f"Transport (default: {TRANSPORT})")
+    serve.add_argument("--host", default=SERVER_HOST, help=f"Address for the HTTP transports (default: {SERVER_HOST})")
+    serve.add_argument("--port", type=int, default=SERVER_PORT, help=f"Port for the HTTP transports (default: {SERVER_PORT})")
+    serve.add_argument("--workers", type=int, default=SERVER_WORKERS, help="Worker processes for the HTTP transports")
+    serve.add_argument("--max-concurrent-calls", type=int, default=MAX_CONCURRENT_CALLS,
+                       help="Tool calls run at once per process")
+    prefetch = subcommands.add_parser(
+        "prefetch", help="Download a project's documentation into the cache (requires READTHEDOCS_CACHE_DIR to persist)")
+    prefetch.add_argument("project", help="Project slug")
+    prefetch.add_argument("--version", default="latest", help="Documentation version (default: latest)")
+    prefetch.add_argument("--max-pages", type=int, default=PREFETCH_MAX_PAGES, help="Maximum number of pages to fetch")
+    prefetch.add_argument("--concurrency", type=int, default=PREFETCH_CONCURRENCY, help="Pages fetched at the same time")
+    ingest = subcommands.add_parser(
+        "ingest", help="Store a project's htmlzip archive for offline use (requires READTHEDOCS_DOCS_DIR or READTHEDOCS_CACHE_DIR)")
+    ingest.add_argument("project", help="Project slug")
+    ingest.add_argument("--version", default="latest", help="Documentation version (default: latest)")
+    ingest.add_argument("--source", help="Local .zip of an HTML build, or a URL (default: the Read the Docs htmlzip download)")
+    ingest.add_argument("--language", default="en", help="Documentation language (default: en)")
+    args = parser.parse_args(argv)
+    
+    if args.command == "ingest":
+        if DOCS_DIR is None:
+            print("Error: set READTHEDOCS_DOCS_DIR or READTHEDOCS_CACHE_DIR so the archive is kept.", file=sys.stderr)
+            return 2
+        return asyncio.run(ingest_cli(args.project, args.version, args.source, args.language))
+    
+    if args.command == "prefetch":
+        if disk_cache is None:
+            print("Warning: READTHEDOCS_CACHE_DIR is not set, fetched pages will not be kept.", file=sys.stderr)
+        return asyncio.run(prefetch_cli(args.project, args.version, args.max_pages, args.concurrency))
+    
+    if args.command == "serve":
+        TRANSPORT, SERVER_HOST, SERVER_PORT = args.transport, args.host, args.port
+        SERVER_WORKERS, MAX_CONCURRENT_CALLS = max(args.workers, 1), args.max_concurrent_calls
+        STATELESS_HTTP = STATELESS_HTTP or SERVER_WORKERS > 1
+        # Worker processes import this module afresh and read their settings from the environment
+        os.environ.update({
+            "READTHEDOCS_TRANSPORT": TRANSPORT,
+            "READTHEDOCS_HOST": SERVER_HOST,
+            "READTHEDOCS_PORT": str(SERVER_PORT),
+            "READTHEDOCS_WORKERS": str(SERVER_WORKERS),
+            "READTHEDOCS_MAX_CONCURRENT_CALLS": str(MAX_CONCURRENT_CALLS),
+        })
+    
+    if TRANSPORT == "sse" and SERVER_WORKERS > 1:
+        print("Error: the sse transport keeps sessions in one process; use streamable-http for several workers.", file=sys.stderr)
+        return 2
+    
     # Initialize and run the server
-    print("Starting ReadTheDocs MCP server...", file=sys.stderr)
-    mcp.run(transport='stdio') 
\ No newline at end of file
+    logger.info("Starting ReadTheDocs MCP server...")
+    if TRANSPORT == "stdio":
+        mcp.run(transport='stdio')
+    else:
+        run_http_server()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main()) 
\ No newline at end of file
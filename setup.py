@@ -8,7 +8,7 @@ setup(
     author_email="hulkworks@protonmail.com",
     py_modules=["readthedocs"],  # This tells setuptools to include readthedocs.py
     install_requires=[
-        "httpx>=0.27.0",
+        "httpx[http2]>=0.27.0",
         "beautifulsoup4>=4.12.0",
         "mcp[cli]>=1.2.0",
     ],
@@ -19,6 +19,13 @@ setup(
             "black>=24.0.0",
             "isort>=5.12.0",
         ],
+        "lxml": ["lxml>=5.0.0"],
+        "selectolax": ["selectolax>=0.3.21"],
+    },
+    entry_points={
+        "console_scripts": [
+            "readthedocs-mcp=readthedocs:main",
+        ],
     },
     python_requires=">=3.10",
 ) 
\ No newline at end of file
@@ -0,0 +1,72 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# readthedocs.py lives at the top level and the fixture pages under benchmarks/
+sys.path[:0] = [ROOT, os.path.join(ROOT, "benchmarks")]
+
+import readthedocs  # noqa: E402
+
+
+@pytest.fixture
+def rtd(monkeypatch):
+    """The readthedocs module with fresh caches, indexes, clients and limiters, and no disk tier.
+
+    Tests drive coroutines with asyncio.run; HTTP clients belong to one event
+    loop, so each test starts without any.
+    """
+    monkeypatch.setattr(readthedocs, "cache", readthedocs.ResponseCache(readthedocs.CACHE_MAX_BYTES, readthedocs.CACHE_TTLS))
+    monkeypatch.setattr(readthedocs, "disk_cache", None)
+    for name in ("http_clients", "pool_stats", "inflight_requests", "host_buckets", "token_buckets",
+                 "circuit_breakers", "prefetch_next_slot"):
+        monkeypatch.setattr(readthedocs, name, {})
+    monkeypatch.setattr(readthedocs, "background_tasks", set())
+    monkeypatch.setattr(readthedocs, "prefetch_jobs", readthedocs.OrderedDict())
+    monkeypatch.setattr(readthedocs, "retry_stats", dict.fromkeys(readthedocs.retry_stats, 0))
+    monkeypatch.setattr(readthedocs, "coalescing_stats", dict.fromkeys(readthedocs.coalescing_stats, 0))
+    for name in ("search_indexes", "local_docs", "symbol_indexes", "missing_inventories",
+                 "metadata_listings", "page_url_shapes"):
+        store = getattr(readthedocs, name)
+        monkeypatch.setattr(readthedocs, name, readthedocs.LRUDict(store.max_items, store.weight, store.max_weight, store.on_evict))
+    return readthedocs
+
+
+@pytest.fixture
+def clock(rtd, monkeypatch):
+    """A monotonic clock the test moves forward by hand: ``clock[0] += seconds``."""
+    now = [1000.0]
+    monkeypatch.setattr(rtd.time, "monotonic", lambda: now[0])
+    return now
+
+
+@pytest.fixture
+def disk(rtd, tmp_path, monkeypatch):
+    """A SQLite disk tier in a temporary directory, installed as the module's disk cache."""
+    disk_cache = rtd.DiskCache(str(tmp_path))
+    monkeypatch.setattr(rtd, "disk_cache", disk_cache)
+    yield disk_cache
+    disk_cache.close()
+
+
+@pytest.fixture(scope="session")
+def fake_server():
+    """One fake Read the Docs (benchmarks/fakertd.py) shared by the whole session."""
+    from fakertd import FakeReadTheDocs
+
+    fake = FakeReadTheDocs(latency=0).start()
+    yield fake
+    fake.stop()
+
+
+@pytest.fixture
+def fake_rtd(rtd, fake_server, monkeypatch):
+    """The fake Read the Docs, with every HTTP client routed to it and fresh request counters."""
+    from bench_tools import route_to_fake
+
+    # Registered first so the routing is undone after the test
+    monkeypatch.setattr(rtd, "get_http_client", rtd.get_http_client)
+    route_to_fake(rtd, fake_server.port)
+    fake_server.stats.update(requests=0, not_modified=0, not_found=0, bytes_sent=0, by_kind={})
+    return fake_server
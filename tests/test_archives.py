@@ -0,0 +1,121 @@
+"""Offline archives: where they are stored and where they may come from."""
+
+import asyncio
+import os
+
+import pytest
+
+
+@pytest.fixture
+def docs_dir(rtd, tmp_path, monkeypatch):
+    directory = tmp_path / "archives"
+    monkeypatch.setattr(rtd, "DOCS_DIR", str(directory))
+    return directory
+
+
+@pytest.mark.parametrize("slug", ["requests", "3.1.0", "v2_x-rc1", "Latest"])
+def test_check_slug_accepts_path_safe_slugs(rtd, slug):
+    assert rtd.check_slug(slug) == slug
+
+
+@pytest.mark.parametrize("slug", ["", "..", "../etc", "a/b", "a\\b", ".hidden", "-rf", "1..2", "/abs", "v1/../.."])
+def test_check_slug_rejects_anything_that_could_leave_its_directory(rtd, slug):
+    with pytest.raises(ValueError):
+        rtd.check_slug(slug)
+
+
+def test_archives_are_kept_inside_the_docs_directory(rtd, docs_dir):
+    assert rtd.archive_path("requests", "3.1.0") == os.path.join(os.path.realpath(docs_dir), "requests", "3.1.0.zip")
+    assert rtd.docs_project_dir("requests") == os.path.join(os.path.realpath(docs_dir), "requests")
+
+
+@pytest.mark.parametrize("project, version", [("../outside", "latest"), ("requests", "../../outside"),
+                                              ("..", "latest"), ("requests", "..")])
+def test_archive_paths_with_parent_references_are_rejected(rtd, docs_dir, project, version):
+    with pytest.raises(ValueError):
+        rtd.archive_path(project, version)
+    assert not rtd.has_local_docs(project, version)
+
+
+def test_archive_paths_through_a_symlink_out_of_the_docs_directory_are_rejected(rtd, docs_dir, tmp_path):
+    docs_dir.mkdir()
+    (tmp_path / "elsewhere").mkdir()
+    os.symlink(tmp_path / "elsewhere", docs_dir / "linked")
+    (docs_dir / "requests").mkdir()
+    os.symlink(tmp_path / "elsewhere" / "x.zip", docs_dir / "requests" / "latest.zip")
+
+    with pytest.raises(ValueError):
+        rtd.docs_project_dir("linked")
+    with pytest.raises(ValueError):
+        rtd.archive_path("requests", "latest")
+
+
+def test_without_a_docs_directory_archives_have_no_stored_path(rtd, monkeypatch):
+    monkeypatch.setattr(rtd, "DOCS_DIR", None)
+    assert rtd.archive_path("requests", "latest") is None
+
+
+@pytest.mark.parametrize("url", [
+    "https://requests.readthedocs.io/_/downloads/en/latest/htmlzip/",
+    "https://readthedocs.org/projects/requests/downloads/htmlzip/latest/",
+    "https://docs.example.readthedocs-hosted.com/_/downloads/en/latest/htmlzip/",
+])
+def test_archive_urls_on_read_the_docs_hosts_are_accepted(rtd, url):
+    assert rtd.check_archive_url(url) == url
+
+
+@pytest.mark.parametrize("url", [
+    "http://requests.readthedocs.io/_/downloads/en/latest/htmlzip/",
+    "https://example.org/docs.zip",
+    "https://readthedocs.io.example.org/docs.zip",
+    "https://notreadthedocs.io/docs.zip",
+    "file:///etc/passwd",
+])
+def test_other_archive_urls_are_rejected(rtd, url):
+    with pytest.raises(ValueError):
+        rtd.check_archive_url(url)
+
+
+def test_ingest_docs_downloads_and_serves_an_archive(rtd, fake_rtd, docs_dir):
+    reply = asyncio.run(rtd.ingest_docs("archivedemo", "latest"))
+    try:
+        assert reply.startswith("Ingested archivedemo (latest)")
+        assert (docs_dir / "archivedemo" / "latest.zip").is_file()
+        assert rtd.has_local_docs("archivedemo", "latest")
+    finally:
+        rtd.close_local_docs()
+
+
+def test_ingest_docs_rejects_slugs_that_leave_the_docs_directory(rtd, fake_rtd, docs_dir):
+    for project, version in (("../archivedemo", "latest"), ("archivedemo", "../../latest")):
+        assert asyncio.run(rtd.ingest_docs(project, version)).startswith("Error ingesting documentation")
+    assert fake_rtd.stats["requests"] == 0
+    assert not docs_dir.exists()
+
+
+def test_ingest_docs_checks_the_download_link_from_the_api(rtd, fake_rtd, docs_dir, monkeypatch):
+    async def htmlzip_url(project, version, language, token):
+        return "https://downloads.example.org/archivedemo.zip"
+
+    monkeypatch.setattr(rtd, "htmlzip_url", htmlzip_url)
+
+    reply = asyncio.run(rtd.ingest_docs("archivedemo", "latest"))
+
+    assert "can only be downloaded over https from" in reply
+    assert fake_rtd.stats["requests"] == 0
+
+
+def test_ingest_docs_stops_downloads_over_the_size_limit_and_cleans_up(rtd, fake_rtd, monkeypatch):
+    monkeypatch.setattr(rtd, "DOCS_DIR", None)
+    monkeypatch.setattr(rtd, "scratch_docs_dir", None)
+    monkeypatch.setattr(rtd, "ARCHIVE_MAX_BYTES", 1000)
+    created = []
+    mkdtemp = rtd.tempfile.mkdtemp
+    monkeypatch.setattr(rtd.tempfile, "mkdtemp", lambda **kwargs: created.append(mkdtemp(**kwargs)) or created[-1])
+
+    reply = asyncio.run(rtd.ingest_docs("archivedemo", "latest"))
+
+    assert "larger than 1000 bytes" in reply
+    assert len(created) == 1 and not os.path.exists(created[0])
+    assert rtd.scratch_docs_dir is None
+    assert not rtd.has_local_docs("archivedemo", "latest")
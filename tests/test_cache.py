@@ -0,0 +1,238 @@
+"""Response caching: the in-memory LRU, the disk tier and how API responses are keyed."""
+
+import asyncio
+
+import httpx
+
+API_URL = "https://readthedocs.org/api/v3/projects/private-project/"
+
+
+def test_response_cache_evicts_least_recently_used_entries_to_stay_in_budget(rtd):
+    size = rtd.estimate_size("x" * 100)
+    cache = rtd.ResponseCache(3 * size, {})
+    for key in "abc":
+        cache.set("page", key, "x" * 100)
+    assert cache.get("page", "a") is not None  # a is now the most recently used
+
+    cache.set("page", "d", "x" * 100)
+
+    assert cache.get("page", "b") is None
+    assert all(cache.get("page", key) is not None for key in "acd")
+    assert cache.current_bytes == 3 * size
+    assert cache.stats()["namespaces"]["page"]["evictions"] == 1
+
+
+def test_response_cache_skips_values_larger_than_the_whole_budget(rtd):
+    cache = rtd.ResponseCache(rtd.estimate_size("x" * 100), {})
+    cache.set("page", "small", "x" * 100)
+
+    cache.set("page", "huge", "x" * 1000)
+
+    assert cache.get("page", "huge") is None
+    assert cache.get("page", "small") is not None
+
+
+def test_response_cache_expires_entries_per_namespace(rtd, clock):
+    cache = rtd.ResponseCache(10**6, {"search": 10, "page": 100}, default_ttl=50)
+    cache.set("search", "q", ["result"])
+    cache.set("page", "p", "text")
+    cache.set("toc", "t", ["entry"])
+    cache.set("page", "short", "text", ttl=5)
+
+    clock[0] += 10
+    assert cache.get("search", "q") is None
+    assert cache.get("page", "short") is None
+    assert cache.get("toc", "t") == ["entry"]
+    assert cache.get("page", "p") == "text"
+
+    clock[0] += 40
+    assert cache.get("toc", "t") is None
+    assert cache.get("page", "p") == "text"
+
+    clock[0] += 50
+    assert cache.get("page", "p") is None
+    assert cache.current_bytes == 0
+
+
+def test_response_cache_sweeps_expired_entries(rtd, clock, monkeypatch):
+    cache = rtd.ResponseCache(10**6, {"search": 10, "page": 100})
+    for n in range(3):
+        cache.set("search", f"q{n}", ["result"])
+    cache.set("page", "p", "text")
+    clock[0] += 10
+
+    assert cache.purge_expired() == 3
+    assert cache.stats()["entries"] == 1
+    assert cache.stats()["namespaces"]["search"]["expirations"] == 3
+
+    # Expired entries nobody looks up again are also dropped every SWEEP_INTERVAL insertions
+    monkeypatch.setattr(rtd.ResponseCache, "SWEEP_INTERVAL", 3)
+    cache = rtd.ResponseCache(10**6, {"search": 10, "page": 100})
+    cache.set("search", "old", ["result"])
+    cache.set("page", "p", "text")
+    clock[0] += 10
+    assert cache.stats()["entries"] == 2
+    cache.set("page", "new", "text")
+    assert cache.stats()["entries"] == 2
+    assert cache.stats()["namespaces"]["search"]["expirations"] == 1
+
+
+def test_response_cache_counts_hits_and_misses_per_namespace(rtd):
+    cache = rtd.ResponseCache(10**6, {})
+    cache.set("page", "p", "text")
+    cache.get("page", "p")
+    cache.get("page", "p")
+    cache.get("page", "missing")
+    cache.get("search", "missing", count_miss=False)
+    cache.get("search", "other", count_miss=False)
+    cache.record_miss("search")
+
+    namespaces = cache.stats()["namespaces"]
+    assert namespaces["page"] == {"hits": 2, "misses": 1, "evictions": 0, "expirations": 0, "entries": 1}
+    assert namespaces["search"] == {"hits": 0, "misses": 1, "evictions": 0, "expirations": 0, "entries": 0}
+
+    cache.clear()
+    assert cache.stats()["entries"] == 0
+    assert cache.stats()["namespaces"]["page"]["hits"] == 2
+
+
+def private_api(monkeypatch, rtd, calls):
+    """Answer API requests like Read the Docs does for a private project: only with a token."""
+
+    async def http_get(url, stream=False, **kwargs):
+        calls.append(kwargs.get("headers", {}).get("Authorization"))
+        request = httpx.Request("GET", url)
+        if kwargs.get("headers", {}).get("Authorization") == "Token secret":
+            return httpx.Response(200, json={"slug": "private-project"}, request=request)
+        return httpx.Response(404, json={"detail": "Not found."}, request=request)
+
+    monkeypatch.setattr(rtd, "http_get", http_get)
+
+
+def test_api_responses_fetched_with_a_token_are_not_served_to_other_callers(rtd, monkeypatch):
+    calls = []
+    private_api(monkeypatch, rtd, calls)
+
+    async def main():
+        private = await rtd.make_readthedocs_request(API_URL, token="secret")
+        anonymous = await rtd.make_readthedocs_request(API_URL)
+        again = await rtd.make_readthedocs_request(API_URL, token="secret")
+        return private, anonymous, again
+
+    private, anonymous, again = asyncio.run(main())
+    assert private == again == {"slug": "private-project"}
+    assert anonymous is None
+    assert calls == ["Token secret", None]
+
+
+def test_api_responses_on_disk_are_kept_per_token(rtd, disk, monkeypatch):
+    calls = []
+    private_api(monkeypatch, rtd, calls)
+    asyncio.run(rtd.make_readthedocs_request(API_URL, token="secret"))
+    # A new process: empty memory cache, same disk tier
+    monkeypatch.setattr(rtd, "cache", rtd.ResponseCache(rtd.CACHE_MAX_BYTES, rtd.CACHE_TTLS))
+
+    assert asyncio.run(rtd.make_readthedocs_request(API_URL)) is None
+    assert asyncio.run(rtd.make_readthedocs_request(API_URL, token="secret")) == {"slug": "private-project"}
+    assert calls == ["Token secret", None]
+
+
+def test_search_results_are_cached_per_token(rtd, monkeypatch):
+    calls = []
+
+    async def http_get(url, stream=False, **kwargs):
+        authorization = kwargs["headers"].get("Authorization")
+        calls.append(authorization)
+        results = [{"title": "Private page", "domain": "https://private.example", "path": "/en/latest/page.html",
+                    "blocks": [{"type": "section", "content": "secret content"}]}] if authorization else []
+        return httpx.Response(200, json={"results": results}, request=httpx.Request("GET", url))
+
+    monkeypatch.setattr(rtd, "http_get", http_get)
+
+    async def main():
+        private = await rtd.search_docs("secret", "private-project", token="secret", source="remote")
+        anonymous = await rtd.search_docs("secret", "private-project", source="remote")
+        return private, anonymous
+
+    private, anonymous = asyncio.run(main())
+    assert "Private page" in private
+    assert "Private page" not in anonymous
+    assert calls == ["Token secret", None]
+
+
+def test_disk_cache_keeps_data_validators_and_body(rtd, disk, monkeypatch):
+    disk.put("page", "https://example.org/", b"<html>page</html>", {"text": "page"}, '"v1"', "Mon, 01 Jan 2024 00:00:00 GMT")
+
+    entry = disk.get("page", "https://example.org/")
+    assert entry["data"] == {"text": "page"} and entry["fresh"]
+    assert disk.get_body("page", "https://example.org/") == b"<html>page</html>"
+    assert rtd.validator_headers(entry) == {"If-None-Match": '"v1"', "If-Modified-Since": "Mon, 01 Jan 2024 00:00:00 GMT"}
+    assert rtd.validator_headers(None) == {}
+    assert disk.get("page", "https://example.org/other") is None
+
+    monkeypatch.setitem(rtd.CACHE_TTLS, "page", 0)
+    assert not disk.get("page", "https://example.org/")["fresh"]
+
+
+def stale_api(rtd, monkeypatch, answer):
+    """An API response on disk that has gone stale, with http_get answering through ``answer``."""
+    requests = []
+
+    async def http_get(url, stream=False, **kwargs):
+        requests.append(kwargs["headers"])
+        return answer(httpx.Request("GET", url))
+
+    key = f"{rtd.token_fingerprint(None)}|{API_URL}"
+    rtd.disk_cache.put("api", key, b'{"slug": "old"}', {"slug": "old"}, '"v1"', "Mon, 01 Jan 2024 00:00:00 GMT")
+    monkeypatch.setitem(rtd.CACHE_TTLS, "api", 0)
+    monkeypatch.setattr(rtd, "API_TOKEN", None)
+    monkeypatch.setattr(rtd, "http_get", http_get)
+    return key, requests
+
+
+def test_stale_disk_entries_are_revalidated_with_a_conditional_request(rtd, disk, monkeypatch):
+    key, requests = stale_api(rtd, monkeypatch, lambda request: httpx.Response(304, headers={"ETag": '"v2"'}, request=request))
+    fetched_at = disk.get("api", key)["fetched_at"]
+
+    assert asyncio.run(rtd.make_readthedocs_request(API_URL)) == {"slug": "old"}
+    assert requests[0]["If-None-Match"] == '"v1"'
+    assert requests[0]["If-Modified-Since"] == "Mon, 01 Jan 2024 00:00:00 GMT"
+    entry = disk.get("api", key)
+    assert entry["etag"] == '"v2"' and entry["fetched_at"] > fetched_at
+    assert disk.stats["revalidated"] == 1
+
+
+def test_changed_responses_replace_the_disk_entry(rtd, disk, monkeypatch):
+    key, _ = stale_api(rtd, monkeypatch, lambda request: httpx.Response(200, json={"slug": "new"}, request=request))
+
+    assert asyncio.run(rtd.make_readthedocs_request(API_URL)) == {"slug": "new"}
+    assert disk.get("api", key)["data"] == {"slug": "new"}
+
+
+def test_stale_disk_entries_are_served_when_the_upstream_request_fails(rtd, disk, monkeypatch):
+    def fail(request):
+        raise httpx.ConnectError("connection refused", request=request)
+
+    stale_api(rtd, monkeypatch, fail)
+    assert asyncio.run(rtd.make_readthedocs_request(API_URL)) == {"slug": "old"}
+
+    stale_api(rtd, monkeypatch, lambda request: httpx.Response(503, request=request))
+    assert asyncio.run(rtd.make_readthedocs_request(API_URL)) == {"slug": "old"}
+    assert disk.stats["stale_served"] == 2
+
+
+def test_disk_cache_deletes_the_least_recently_fetched_rows_beyond_max_rows(rtd, tmp_path):
+    disk = rtd.DiskCache(str(tmp_path), max_rows=3)
+    try:
+        for key in "abc":
+            disk.put("page", key, None, key)
+        disk.touch("page", "a")  # revalidated, so a is now the most recent
+
+        disk.put("page", "d", None, "d")
+        disk.put("page", "c", None, "c2")  # replacing an entry does not evict
+
+        assert [key for key in "abcd" if disk.get("page", key)] == ["a", "c", "d"]
+        assert disk.summary()["entries"] == {"page": 3}
+        assert disk.stats["evictions"] == 1
+    finally:
+        disk.close()
@@ -0,0 +1,291 @@
+"""Upstream requests: coalescing, rate limiting, retries and the circuit breaker."""
+
+import asyncio
+
+import httpx
+import pytest
+
+
+def test_concurrent_identical_fetches_share_one_upstream_call(rtd):
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return {"slug": "requests"}
+
+    async def main():
+        return await asyncio.gather(*(rtd.single_flight("api|requests", fetch) for _ in range(5)))
+
+    assert asyncio.run(main()) == [{"slug": "requests"}] * 5
+    assert len(calls) == 1
+    assert rtd.coalescing_stats == {"upstream_fetches": 1, "coalesced": 4}
+    assert rtd.inflight_requests == {}
+
+
+def test_concurrent_api_requests_make_one_upstream_request(rtd, monkeypatch):
+    calls = []
+
+    async def http_get(url, stream=False, **kwargs):
+        calls.append(url)
+        await asyncio.sleep(0.01)
+        return httpx.Response(200, json={"slug": "requests"}, request=httpx.Request("GET", url))
+
+    monkeypatch.setattr(rtd, "http_get", http_get)
+    url = "https://readthedocs.org/api/v3/projects/requests/"
+
+    async def main():
+        return await asyncio.gather(*(rtd.make_readthedocs_request(url) for _ in range(5)))
+
+    assert asyncio.run(main()) == [{"slug": "requests"}] * 5
+    assert calls == [url]
+
+
+def test_a_cancelled_waiter_leaves_the_fetch_running_for_the_others(rtd):
+    started = []
+    release = None
+
+    async def fetch():
+        started.append(1)
+        await release.wait()
+        return "page"
+
+    async def main():
+        nonlocal release
+        release = asyncio.Event()
+        first = asyncio.create_task(rtd.single_flight("page|index", fetch))
+        second = asyncio.create_task(rtd.single_flight("page|index", fetch))
+        await asyncio.sleep(0)
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        shared = rtd.inflight_requests["page|index"]
+        assert not shared.done()
+        release.set()
+        return await second, shared
+
+    result, shared = asyncio.run(main())
+    assert result == "page" and shared.result() == "page"
+    assert len(started) == 1
+
+
+def test_failed_fetches_are_not_remembered(rtd):
+    attempts = []
+
+    async def fetch():
+        attempts.append(1)
+        raise httpx.ConnectError("connection refused")
+
+    async def main():
+        for _ in range(2):
+            with pytest.raises(httpx.ConnectError):
+                await rtd.single_flight("api|down", fetch)
+
+    asyncio.run(main())
+    assert len(attempts) == 2
+
+
+def test_token_bucket_halves_its_rate_when_throttled_and_recovers_additively(rtd):
+    bucket = rtd.TokenBucket(10.0, 5)
+
+    bucket.slow_down()
+    bucket.slow_down()
+    assert bucket.rate == 2.5
+    for _ in range(10):
+        bucket.slow_down()
+    assert bucket.rate == 10.0 / 32  # never below a 32nd of the configured rate
+
+    bucket.rate = 2.5
+    bucket.speed_up()
+    assert bucket.rate == 3.0
+    for _ in range(100):
+        bucket.speed_up()
+    assert bucket.rate == 10.0
+    assert bucket.stats["slowdowns"] == 12
+
+
+def test_token_bucket_allows_a_burst_then_spaces_requests_out(rtd):
+    bucket = rtd.TokenBucket(50.0, 3)
+
+    async def main():
+        started = rtd.time.perf_counter()
+        for _ in range(5):
+            await bucket.acquire()
+        return rtd.time.perf_counter() - started
+
+    elapsed = asyncio.run(main())
+    assert bucket.stats["throttled"] == 2
+    assert 0.03 <= elapsed < 1.0  # two requests beyond the burst, 20 ms apart
+
+
+def test_paused_token_bucket_holds_requests_back(rtd):
+    bucket = rtd.TokenBucket(1000.0, 10)
+    bucket.pause(0.05)
+
+    async def main():
+        started = rtd.time.perf_counter()
+        await bucket.acquire()
+        return rtd.time.perf_counter() - started
+
+    assert asyncio.run(main()) >= 0.04
+    assert bucket.stats["throttled"] == 1
+
+
+def test_parse_retry_after_accepts_seconds_and_http_dates(rtd):
+    assert rtd.parse_retry_after("120") == 120.0
+    assert rtd.parse_retry_after(" 0 ") == 0.0
+    later = rtd.email.utils.formatdate(rtd.time.time() + 60, usegmt=True)
+    assert 55 <= rtd.parse_retry_after(later) <= 60
+    assert rtd.parse_retry_after("Mon, 01 Jan 2001 00:00:00 GMT") == 0.0
+    assert rtd.parse_retry_after("soon") is None
+    assert rtd.parse_retry_after("") is None
+    assert rtd.parse_retry_after(None) is None
+
+
+def test_backoff_delays_are_jittered_and_capped(rtd, monkeypatch):
+    monkeypatch.setattr(rtd, "BACKOFF_BASE", 0.5)
+    monkeypatch.setattr(rtd, "BACKOFF_MAX", 3.0)
+    rtd.random.seed(0)
+
+    for attempt, ceiling in ((0, 0.5), (1, 1.0), (2, 2.0), (3, 3.0), (10, 3.0)):
+        delays = [rtd.backoff_delay(attempt) for _ in range(200)]
+        assert all(0 <= delay <= ceiling for delay in delays)
+        assert max(delays) > ceiling * 0.8 and min(delays) < ceiling * 0.2
+        assert len(set(delays)) == len(delays)
+
+
+def test_circuit_breaker_opens_probes_and_closes(rtd, clock):
+    breaker = rtd.CircuitBreaker(3, 30.0)
+    for _ in range(2):
+        breaker.record_failure()
+    assert breaker.state == "closed" and breaker.allow()
+    breaker.record_success()
+    for _ in range(3):
+        breaker.record_failure()
+    assert breaker.state == "open"
+    assert not breaker.allow()
+
+    clock[0] += 30
+    assert breaker.allow() and breaker.state == "half-open"
+    assert not breaker.allow()  # one trial at a time
+    breaker.record_failure()
+    assert breaker.state == "open" and not breaker.allow()
+
+    clock[0] += 30
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed" and breaker.allow()
+    assert breaker.stats == {"opened": 2, "rejected": 3}
+
+
+def test_circuit_breaker_replaces_a_trial_that_never_reports_back(rtd, clock):
+    breaker = rtd.CircuitBreaker(1, 30.0)
+    breaker.record_failure()
+    clock[0] += 30
+    assert breaker.allow()
+
+    clock[0] += 29
+    assert not breaker.allow()
+    clock[0] += 1
+    assert breaker.allow() and breaker.state == "half-open"
+
+
+def fake_upstream(rtd, monkeypatch, answers):
+    """Answer send_get with each of ``answers`` in turn: a status code, an exception or a coroutine function."""
+    sent = []
+
+    async def send_get(host, url, stream=False, **kwargs):
+        answer = answers[min(len(sent), len(answers) - 1)]
+        sent.append(url)
+        if isinstance(answer, Exception):
+            raise answer
+        if callable(answer):
+            return await answer()
+        status, headers = answer if isinstance(answer, tuple) else (answer, {})
+        return httpx.Response(status, headers=headers, request=httpx.Request("GET", url))
+
+    monkeypatch.setattr(rtd, "send_get", send_get)
+    monkeypatch.setattr(rtd, "BACKOFF_BASE", 0.0)
+    return sent
+
+
+def test_http_get_retries_throttled_requests_and_slows_down(rtd, monkeypatch):
+    sent = fake_upstream(rtd, monkeypatch, [(429, {"Retry-After": "0"}), 200])
+
+    response = asyncio.run(rtd.http_get("https://docs.example.org/page.html"))
+
+    assert response.status_code == 200 and len(sent) == 2
+    bucket = rtd.host_buckets["docs.example.org"]
+    assert bucket.stats["slowdowns"] == 1
+    assert bucket.rate == rtd.RATE_LIMIT_HOST / 2 + rtd.RATE_LIMIT_HOST / 20
+    assert rtd.retry_stats == {"retries": 1, "retry_after": 1, "gave_up": 0}
+    assert rtd.circuit_breakers["docs.example.org"].state == "closed"
+
+
+def test_http_get_gives_up_after_the_configured_retries(rtd, monkeypatch):
+    monkeypatch.setattr(rtd, "HTTP_RETRIES", 2)
+    sent = fake_upstream(rtd, monkeypatch, [503])
+
+    response = asyncio.run(rtd.http_get("https://docs.example.org/page.html"))
+
+    assert response.status_code == 503 and len(sent) == 3
+    assert rtd.retry_stats == {"retries": 2, "retry_after": 0, "gave_up": 1}
+
+
+def test_http_get_does_not_wait_out_a_long_retry_after(rtd, monkeypatch):
+    sent = fake_upstream(rtd, monkeypatch, [(429, {"Retry-After": str(int(rtd.BACKOFF_MAX) + 60)})])
+
+    response = asyncio.run(rtd.http_get("https://docs.example.org/page.html"))
+
+    assert response.status_code == 429 and len(sent) == 1
+    assert rtd.host_buckets["docs.example.org"].paused_until > rtd.time.monotonic()
+
+
+def test_http_get_stops_calling_a_failing_host(rtd, monkeypatch):
+    monkeypatch.setattr(rtd, "HTTP_RETRIES", 0)
+    monkeypatch.setattr(rtd, "CIRCUIT_THRESHOLD", 2)
+    sent = fake_upstream(rtd, monkeypatch, [httpx.ConnectError("connection refused")])
+
+    async def main():
+        for _ in range(2):
+            with pytest.raises(httpx.ConnectError):
+                await rtd.http_get("https://docs.example.org/page.html")
+        with pytest.raises(rtd.UpstreamUnavailable):
+            await rtd.http_get("https://docs.example.org/other.html")
+
+    asyncio.run(main())
+    assert len(sent) == 2
+
+
+def half_open_breaker(rtd, monkeypatch, answer):
+    monkeypatch.setattr(rtd, "HTTP_RETRIES", 0)
+    fake_upstream(rtd, monkeypatch, [answer])
+    breaker = rtd.get_circuit_breaker("docs.example.org")
+    breaker.state, breaker.opened_at = "open", rtd.time.monotonic() - breaker.cooldown
+    return breaker
+
+
+def test_a_cancelled_half_open_trial_reopens_the_breaker(rtd, monkeypatch):
+    async def hang():
+        await asyncio.sleep(10)
+
+    breaker = half_open_breaker(rtd, monkeypatch, hang)
+
+    async def main():
+        request = asyncio.create_task(rtd.http_get("https://docs.example.org/page.html"))
+        await asyncio.sleep(0.01)
+        assert breaker.state == "half-open"
+        request.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await request
+
+    asyncio.run(main())
+    assert breaker.state == "open"
+
+
+def test_a_half_open_trial_failing_outside_the_transport_reopens_the_breaker(rtd, monkeypatch):
+    breaker = half_open_breaker(rtd, monkeypatch, httpx.TooManyRedirects("Exceeded maximum allowed redirects."))
+
+    with pytest.raises(httpx.TooManyRedirects):
+        asyncio.run(rtd.http_get("https://docs.example.org/page.html"))
+    assert breaker.state == "open" and breaker.stats["opened"] == 1
@@ -0,0 +1,98 @@
+"""Symbol lookup from Sphinx objects.inv inventories."""
+
+import zlib
+
+import pytest
+
+INVENTORY = """\
+requests py:module 0 api.html#module-$ -
+requests.Session py:class 1 api.html#$ -
+requests.Session.send py:method 1 api.html#$ -
+requests.adapters.HTTPAdapter.send py:method 1 api.html#$ -
+requests.get py:function 1 api.html#requests.get Send a GET request
+session std:label -1 user/advanced.html#session-objects Session Objects
+requests.Session std:label -1 user/advanced.html#session Session docs
+quickstart std:doc -1 user/quickstart.html Quickstart
+timeouts std:label -1 user/quickstart.html#timeouts Timeouts
+Timeouts py:data 1 api.html#$ -
+"""
+
+SINGLE_PAGE_INVENTORY = """\
+index std:doc -1 index.html#document-index Requests
+requests.get py:function 1 #document-api#requests.get -
+timeouts std:label -1 #document-user/quickstart#timeouts Timeouts
+"""
+
+
+def objects_inv(lines):
+    header = b"# Sphinx inventory version 2\n# Project: requests\n# Version: 2.32\n# The remainder of this file is compressed using zlib.\n"
+    return header + zlib.compress(lines.encode())
+
+
+@pytest.fixture
+def index(rtd):
+    index = rtd.SymbolIndex("requests", "latest")
+    index.load(objects_inv(INVENTORY))
+    return index
+
+
+def test_dollar_anchors_expand_to_the_symbol_name(index):
+    assert index.get("requests.Session") == {"name": "requests.Session", "page": "api.html", "anchor": "requests.Session",
+                                             "role": "py:class", "title": "requests.Session"}
+    assert index.get("requests")["anchor"] == "module-requests"
+    assert index.get("requests.get")["title"] == "Send a GET request"
+    assert index.get("quickstart") == {"name": "quickstart", "page": "user/quickstart.html", "anchor": "",
+                                       "role": "std:doc", "title": "Quickstart"}
+
+
+def test_api_objects_win_over_documents_and_labels_of_the_same_name(index):
+    # The label comes after the class in the inventory, the data entry after the label
+    assert index.get("requests.Session")["role"] == "py:class"
+    assert index.get("Timeouts")["role"] == "py:data"
+    assert index.get("timeouts")["role"] == "std:label"
+
+
+def test_lookup_ignores_case(index):
+    match, candidates = index.lookup("REQUESTS.session")
+    assert match["name"] == "requests.Session" and candidates == []
+
+
+def test_lookup_by_trailing_dotted_name(index):
+    match, _ = index.lookup("Session.send")
+    assert match["name"] == "requests.Session.send"
+    match, _ = index.lookup("HTTPAdapter.send")
+    assert match["name"] == "requests.adapters.HTTPAdapter.send"
+    match, _ = index.lookup("  get ")
+    assert match["name"] == "requests.get"
+
+
+def test_ambiguous_or_unknown_names_return_candidates(index):
+    match, candidates = index.lookup("send")
+    assert match is None
+    assert sorted(candidates) == ["requests.Session.send", "requests.adapters.HTTPAdapter.send"]
+    assert index.lookup("nothing.here") == (None, [])
+
+
+def test_single_page_builds_map_back_to_their_documents(rtd):
+    index = rtd.SymbolIndex("requests", "latest")
+    index.load(objects_inv(SINGLE_PAGE_INVENTORY))
+
+    assert index.get("requests.get")["page"] == "api.html"
+    assert index.get("requests.get")["anchor"] == "requests.get"
+    assert index.get("timeouts")["page"] == "user/quickstart.html"
+    assert index.get("timeouts")["anchor"] == "timeouts"
+    assert index.get("index")["page"] == "index.html"
+
+
+def test_snapshots_restore_the_same_index(rtd, index):
+    restored = rtd.SymbolIndex("requests", "latest")
+    restored.restore(rtd.json.loads(rtd.json.dumps(index.snapshot())))
+
+    for name in ("requests.Session", "requests", "quickstart", "Timeouts"):
+        assert restored.get(name) == index.get(name)
+    assert restored.lookup("Session.send") == index.lookup("Session.send")
+
+
+def test_other_inventory_formats_are_rejected(rtd):
+    with pytest.raises(ValueError):
+        rtd.SymbolIndex("requests", "latest").load(b"# Sphinx inventory version 1\n# Project: requests\n")
@@ -0,0 +1,108 @@
+"""Project and version listings walked from the paginated API v3."""
+
+import asyncio
+
+import fakertd
+import pytest
+
+VERSIONS_URL = "https://readthedocs.org/api/v3/projects/sphinxdemo/versions/?limit=100"
+
+
+def versions(*slugs):
+    return [{"slug": slug} for slug in slugs]
+
+
+def test_listings_walk_every_next_page_in_the_background(rtd, fake_rtd):
+    async def main():
+        listing = await rtd.get_listing(VERSIONS_URL)
+        first = (len(listing.records), listing.complete, rtd.listing_note(listing, "versions"))
+        await listing.task
+        return listing, first
+
+    listing, (loaded, complete, note) = asyncio.run(main())
+    assert loaded == fakertd.API_PAGE_SIZE and not complete
+    assert note.startswith(f"(Loaded {fakertd.API_PAGE_SIZE} of {len(fakertd.VERSIONS)} versions so far")
+    assert listing.complete and listing.error is None
+    assert [record["slug"] for record in listing.records] == fakertd.VERSIONS
+    assert len(listing.pages) == 2 and listing.pages[-1]["next"] is None
+    assert listing.stats["pages_fetched"] == 2
+    assert rtd.listing_note(listing, "versions") == ""
+
+
+def test_listing_refreshes_download_only_the_pages_that_changed(rtd, fake_rtd, monkeypatch):
+    async def refresh(listing):
+        listing.refresh()
+        await listing.task
+        return dict(listing.stats)
+
+    async def main():
+        listing = await rtd.get_listing(VERSIONS_URL)
+        await listing.task
+        unchanged = await refresh(listing)
+        # A new release on the second page
+        monkeypatch.setattr(fakertd, "VERSIONS", fakertd.VERSIONS[:-1] + ["0.9"])
+        return listing, unchanged, await refresh(listing)
+
+    listing, unchanged, changed = asyncio.run(main())
+    assert unchanged == {"pages_fetched": 2, "not_modified": 2, "refreshes": 1}
+    assert changed == {"pages_fetched": 3, "not_modified": 3, "refreshes": 2}
+    assert listing.records[-1]["slug"] == "0.9"
+
+
+def test_stale_listings_are_served_while_they_refresh(rtd, fake_rtd, monkeypatch):
+    async def main():
+        listing = await rtd.get_listing(VERSIONS_URL)
+        await listing.task
+        monkeypatch.setitem(rtd.CACHE_TTLS, "metadata", 0)
+        again = await rtd.get_listing(VERSIONS_URL)
+        assert again is listing and listing.loading
+        assert len(again.records) == len(fakertd.VERSIONS)
+        await listing.task
+        return listing
+
+    listing = asyncio.run(main())
+    assert listing.stats["refreshes"] == 1 and listing.stats["not_modified"] == 2
+
+
+def test_listings_are_kept_per_token(rtd, fake_rtd):
+    async def main():
+        anonymous = await rtd.get_listing(VERSIONS_URL)
+        private = await rtd.get_listing(VERSIONS_URL, token="secret")
+        await asyncio.gather(anonymous.task, private.task)
+        return anonymous, private
+
+    anonymous, private = asyncio.run(main())
+    assert anonymous is not private
+    assert private.headers["Authorization"] == "Token secret"
+    assert "Authorization" not in anonymous.headers
+
+
+def test_versions_are_ordered_aliases_first_then_newest_numbers_then_branches(rtd):
+    ordered = rtd.sort_versions(versions("main", "1.0", "stable", "3.0.0rc1", "v10.0", "2.9.1", "latest",
+                                         "3.x", "3.0.0", "feature", "3.0.0b2", "2.10.0"))
+
+    assert [version["slug"] for version in ordered] == [
+        "latest", "stable", "v10.0", "3.x", "3.0.0", "3.0.0rc1", "3.0.0b2", "2.10.0", "2.9.1", "1.0", "feature", "main",
+    ]
+
+
+@pytest.mark.parametrize("slug, expected", [("2.1", True), ("v3.0.0rc1", True), ("4.x", True), ("main", False),
+                                            ("release-2.0", False)])
+def test_version_numbers_are_told_apart_from_branch_names(rtd, slug, expected):
+    assert (rtd.parse_version_number(slug) is not None) == expected
+
+
+def test_get_project_versions_lists_active_versions_in_order(rtd, fake_rtd):
+    async def main():
+        reply = await rtd.get_project_versions("sphinxdemo")
+        listing = rtd.metadata_listings[f"{rtd.token_fingerprint(rtd.API_TOKEN)}|{VERSIONS_URL}"]
+        if listing.task is not None:
+            await listing.task
+        return reply, await rtd.get_project_versions("sphinxdemo", output_format="json")
+
+    _, reply = asyncio.run(main())
+    data = rtd.json.loads(reply)
+    assert [item["title"] for item in data["items"]] == [
+        "latest", "stable", "3.x", "3.1.0", "3.0.0", "3.0.0rc1", "2.9.1", "2.9.0", "main",
+    ]
+    assert data["fields"] == {"latest": "main", "stable": "3.1.0"}
@@ -0,0 +1,84 @@
+"""Tool replies: output formats and character budgets."""
+
+import asyncio
+import json
+
+import pytest
+
+
+def long_reply(rtd):
+    reply = rtd.ToolReply("Documentation for sphinxdemo (latest) - " + "deeply/nested/" * 8 + "page.html", "word " * 200)
+    reply.fields["Previous"] = "Page 0 (page0.html)"
+    reply.items = [{"title": f"Entry {n}", "link": f"https://example.org/{n}.html", "text": "text " * 10} for n in range(5)]
+    reply.notes += ["[Showing characters 0-1000 of 23320. Call get_page with offset=1000 to continue.]",
+                    "[The page is larger than the download limit; later parts are not included.]"]
+    reply.hints.append("Use get_page to read an entry.")
+    return reply
+
+
+@pytest.mark.parametrize("output_format", ["text", "compact", "markdown", "json"])
+@pytest.mark.parametrize("budget", [200, 250, 350, 600, 2000])
+def test_rendered_replies_never_exceed_the_budget(rtd, output_format, budget):
+    reply = long_reply(rtd)
+
+    text = reply.render(output_format, budget, content_hash="0123456789abcdef")
+
+    assert len(text) <= budget
+    assert text == reply.render(output_format, budget, content_hash="0123456789abcdef")  # the reply is not modified
+
+
+def test_optional_parts_go_before_the_content_that_fits(rtd):
+    reply = long_reply(rtd)
+    full = reply.render("text", content_hash="0123456789abcdef")
+
+    text = reply.render("text", len(full) - 100, content_hash="0123456789abcdef")
+
+    assert "Content hash" in text and "Trimmed to" in text
+    text = reply.render("text", 300, content_hash="0123456789abcdef")
+    assert "Content hash" not in text and "Use get_page" not in text
+    assert text.startswith("Documentation for sphinxdemo (latest)")
+
+
+@pytest.mark.parametrize("output_format", ["text", "compact", "markdown", "json"])
+@pytest.mark.parametrize("max_chars", [200, 250, 400, 1000])
+def test_get_page_replies_fit_max_chars(rtd, fake_rtd, output_format, max_chars):
+    async def main():
+        return [
+            await rtd.get_page("sphinxdemo", "latest", "page1.html", output_format=output_format,
+                               max_chars=max_chars, navigation=navigation)
+            for navigation in (False, True)
+        ]
+
+    for text in asyncio.run(main()):
+        assert text.startswith(("Documentation", "## Documentation", '{"heading"'))
+        assert len(text) <= max_chars
+
+
+def test_get_project_details_follows_the_output_options(rtd, fake_rtd):
+    async def main():
+        return [await rtd.get_project_details("sphinxdemo", output_format=output_format)
+                for output_format in ("text", "json")]
+
+    text, reply = asyncio.run(main())
+    assert text.startswith("Project Details for")
+    assert "Documentation: https://sphinxdemo.readthedocs.io/" in text
+    fields = json.loads(reply)["fields"]
+    assert fields["slug"] == "sphinxdemo" and fields["documentation"] == "https://sphinxdemo.readthedocs.io/"
+    assert asyncio.run(rtd.get_project_details("sphinxdemo", output_format="yaml")).startswith("Error: output_format")
+
+
+@pytest.mark.parametrize("output_format", ["text", "compact", "markdown", "json"])
+def test_cache_stats_follows_the_output_options(rtd, disk, output_format):
+    rtd.cache.set("page", "https://example.org/", "text")
+    rtd.cache.get("page", "https://example.org/")
+    disk.put("page", "https://example.org/", None, "text")
+
+    reply = asyncio.run(rtd.cache_stats(output_format=output_format, max_chars=300))
+
+    assert len(reply) <= 300
+    full = asyncio.run(rtd.cache_stats(output_format=output_format))
+    assert "Disk cache" in full or '"Disk cache"' in full
+    if output_format == "json":
+        items = json.loads(full)["items"]
+        assert items[0]["title"] == "page" and items[0]["hits"] == "1"
+        assert items[-1]["page_entries"] == "1"
@@ -0,0 +1,51 @@
+"""Background prefetching of a project's pages."""
+
+import asyncio
+
+import pytest
+
+
+@pytest.fixture
+def prefetch_calls(rtd, monkeypatch):
+    calls = []
+
+    async def run_prefetch(job, max_pages, concurrency, progress=None):
+        calls.append((max_pages, concurrency))
+        return job
+
+    monkeypatch.setattr(rtd, "run_prefetch", run_prefetch)
+    return calls
+
+
+@pytest.mark.parametrize("max_pages, concurrency, expected", [
+    (10**6, 1000, (200, 4)),
+    (10, 2, (10, 2)),
+    (0, -3, (1, 1)),
+])
+def test_prefetch_project_keeps_client_limits_within_the_server_maximums(rtd, prefetch_calls, monkeypatch,
+                                                                         max_pages, concurrency, expected):
+    monkeypatch.setattr(rtd, "PREFETCH_MAX_PAGES", 200)
+    monkeypatch.setattr(rtd, "PREFETCH_CONCURRENCY", 4)
+
+    async def main():
+        reply = await rtd.prefetch_project("sphinxdemo", max_pages=max_pages, concurrency=concurrency)
+        await asyncio.gather(*(job["task"] for job in rtd.prefetch_jobs.values()))
+        return reply
+
+    assert asyncio.run(main()).startswith("Started prefetching sphinxdemo (latest).")
+    assert prefetch_calls == [expected]
+
+
+def test_prefetch_project_fetches_pages_from_the_table_of_contents(rtd, fake_rtd, monkeypatch):
+    monkeypatch.setattr(rtd, "PREFETCH_DELAY", 0.0)
+    monkeypatch.setattr(rtd, "PREFETCH_RATE", 0.0)
+
+    async def main():
+        await rtd.prefetch_project("sphinxdemo", max_pages=5)
+        job = next(iter(rtd.prefetch_jobs.values()))
+        await job["task"]
+        return job, await rtd.prefetch_status(job["id"])
+
+    job, status = asyncio.run(main())
+    assert (job["status"], job["total"], job["done"], job["failed"]) == ("completed", 5, 5, 0)
+    assert status.startswith(f"Job {job['id']}: sphinxdemo (latest) - completed, 5/5 pages cached")
@@ -0,0 +1,98 @@
+"""Streaming extraction must give the same pages as whole-document extraction."""
+
+import asyncio
+import importlib.util
+
+import httpx
+import pytest
+
+import readthedocs
+from pages import THEMES
+
+BACKENDS = [
+    "html.parser",
+    pytest.param("lxml", marks=pytest.mark.skipif(importlib.util.find_spec("lxml") is None, reason="lxml not installed")),
+]
+PAGE_OPTIONS = {
+    "small": {"sections": 2},
+    "api": {"sections": 10, "api_entries": 40},
+}
+
+
+def stream(html: str, section: str | None = None, chunk_chars: int = 4096) -> tuple[dict | None, int]:
+    """Feed a page in chunks, as load_page does; return the page and the characters fed."""
+    parser = readthedocs.StreamingPageParser(section)
+    read = 0
+    while read < len(html) and not parser.done:
+        parser.feed(html[read:read + chunk_chars])
+        read += chunk_chars
+    return parser.close(), min(read, len(html))
+
+
+def section_text(page: dict, section: str) -> str:
+    found = readthedocs.find_section(page, section)
+    assert found is not None, section
+    return page["text"][found["start"]:found["end"]]
+
+
+@pytest.fixture(params=BACKENDS)
+def backend(request, monkeypatch):
+    """The tree builder to compare against; the streaming parser uses its event-driven counterpart."""
+    monkeypatch.setattr(readthedocs, "HTML_PARSER", request.param)
+    return request.param
+
+
+@pytest.mark.parametrize("options", PAGE_OPTIONS.values(), ids=PAGE_OPTIONS.keys())
+@pytest.mark.parametrize("theme", THEMES)
+@pytest.mark.parametrize("chunk_chars", [97, 4096, 1 << 20])
+def test_streaming_matches_tree_extraction(backend, theme, options, chunk_chars):
+    html = THEMES[theme](**options)
+    page, read = stream(html, chunk_chars=chunk_chars)
+    assert read == len(html)
+    assert page == readthedocs.extract_page(html, backend)
+
+
+@pytest.mark.parametrize("section", ["section-3", "Quickstart > Section 5", "demo.Client.method_7"])
+@pytest.mark.parametrize("theme", ["sphinx_rtd", "furo"])
+def test_streaming_stops_after_section(backend, theme, section):
+    html = THEMES[theme](sections=10, api_entries=40)
+    full = readthedocs.extract_page(html, backend)
+    page, read = stream(html, section, chunk_chars=1024)
+    assert read < len(html)
+    assert section_text(page, section) == section_text(full, section)
+
+
+def test_streaming_without_section_match_reads_whole_page(backend):
+    html = THEMES["sphinx_rtd"](sections=10)
+    page, read = stream(html, "no-such-section", chunk_chars=1024)
+    assert read == len(html)
+    assert page == readthedocs.extract_page(html, backend)
+
+
+def read_response(html: str, section: str | None = None) -> dict | None:
+    response = httpx.Response(200, text=html, request=httpx.Request("GET", "https://demo.readthedocs.io/en/latest/"))
+    page, _ = asyncio.run(readthedocs.read_page(response, section))
+    return page
+
+
+@pytest.fixture
+def streamed_pages(monkeypatch):
+    """Make read_page stream every fixture page instead of extracting it whole."""
+    monkeypatch.setattr(readthedocs, "STREAM_THRESHOLD", 1024)
+    monkeypatch.setattr(readthedocs, "STREAM_FEED_CHARS", 1024)
+
+
+def test_read_page_marks_early_stop_as_partial(streamed_pages, backend):
+    html = THEMES["sphinx_rtd"](sections=20, api_entries=200)
+    full = readthedocs.extract_page(html, backend)
+    page = read_response(html, "section-2")
+    assert page["partial"] is True
+    assert "truncated" not in page
+    assert section_text(page, "section-2") == section_text(full, "section-2")
+
+
+def test_read_page_complete_stream_is_not_partial(streamed_pages, backend):
+    html = THEMES["furo"](sections=5, api_entries=20)
+    page = read_response(html)
+    assert "partial" not in page
+    assert page == readthedocs.extract_page(html, backend)
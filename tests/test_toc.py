@@ -0,0 +1,119 @@
+"""Tables of contents: the tree built from sidebar links, get_toc and page navigation."""
+
+import asyncio
+import json
+
+import fakertd
+import pytest
+
+BASE_URL = "https://sphinxdemo.readthedocs.io/en/latest/"
+
+
+@pytest.fixture
+def toc(rtd):
+    links = rtd.extract_toc_links(fakertd.page_html("sphinxdemo", 0).decode())
+    return {"url": BASE_URL, "base_url": BASE_URL, "links": links, "tree": rtd.build_toc_tree(BASE_URL, BASE_URL, links)}
+
+
+def test_sidebar_links_become_a_tree(toc):
+    tree, links = toc["tree"], toc["links"]
+    # Each fixture page is a top-level entry followed by its four parts
+    assert len(links) == fakertd.PAGES * 5
+    assert tree["roots"] == list(range(0, len(links), 5))
+    assert links[5] == (0, "Page 1", "page1.html") and links[6] == (1, "Part 1.0", "page1.html#part-0")
+    assert tree["children"][5] == [6, 7, 8, 9]
+    assert tree["parents"][5] is None and tree["parents"][6] == 5
+    assert tree["depths"][5] == 0 and tree["depths"][6] == 1
+
+
+def test_entries_know_their_siblings_and_pages(toc):
+    tree = toc["tree"]
+    assert tree["previous_siblings"][5] == 0 and tree["next_siblings"][5] == 10
+    assert tree["previous_siblings"][0] is None and tree["next_siblings"][tree["roots"][-1]] is None
+    assert tree["previous_siblings"][7] == 6 and tree["next_siblings"][9] is None
+    assert tree["pages"][5] == tree["pages"][7] == "page1.html"
+    # Reading order has each page once, at its first entry
+    assert tree["page_order"] == tree["roots"]
+    assert tree["page_positions"]["page3.html"] == 3
+
+
+def test_levels_that_skip_ahead_hang_under_the_nearest_shallower_entry(rtd):
+    links = [(1, "Guide", "guide/"), (3, "Deep", "guide/deep.html"), (2, "Install", "guide/install.html"),
+             (1, "API", "api/index.html"), (2, "External", "https://example.org/")]
+    tree = rtd.build_toc_tree(BASE_URL, BASE_URL, links)
+
+    assert tree["roots"] == [0, 3]
+    assert tree["children"][0] == [1, 2]
+    assert tree["previous_siblings"][2] == 1
+    assert tree["pages"] == ["guide/", "guide/deep.html", "guide/install.html", "api/", None]
+    assert tree["page_order"] == [0, 1, 2, 3]
+
+
+def test_entries_are_found_by_path_link_or_title(rtd, toc):
+    assert rtd.find_toc_entry(toc, "page2.html") == 10
+    assert rtd.find_toc_entry(toc, "/page2.html") == 10
+    assert rtd.find_toc_entry(toc, "page2.html#part-1") == 12
+    assert rtd.find_toc_entry(toc, "part 2.3") == 14
+    assert rtd.find_toc_entry(toc, "page99.html") is None
+
+
+def test_navigation_follows_the_reading_order(rtd, toc):
+    assert rtd.toc_navigation(toc, BASE_URL + "page1.html") == {
+        "previous": ("Page 0", "page0.html"), "next": ("Page 2", "page2.html"), "parent": None,
+    }
+    last = fakertd.PAGES - 1
+    assert rtd.toc_navigation(toc, BASE_URL + f"page{last}.html#part-2")["next"] is None
+    # The homepage is not in the sidebar; it leads to the first entry
+    assert rtd.toc_navigation(toc, BASE_URL) == {"previous": None, "next": ("Page 0", "page0.html"), "parent": None}
+    assert rtd.toc_navigation(toc, BASE_URL + "page99.html") is None
+    assert rtd.toc_navigation(toc, "https://other.readthedocs.io/en/latest/page1.html") is None
+
+
+def test_navigation_names_the_parent_page(rtd):
+    links = [(1, "Guide", "guide/index.html"), (2, "Install", "guide/install.html"), (3, "Linux", "guide/install.html#linux"),
+             (2, "Usage", "guide/usage.html")]
+    toc = {"base_url": BASE_URL, "links": links, "tree": rtd.build_toc_tree(BASE_URL, BASE_URL, links)}
+
+    assert rtd.toc_navigation(toc, BASE_URL + "guide/usage.html") == {
+        "previous": ("Install", "guide/install.html"), "next": None, "parent": ("Guide", "guide/"),
+    }
+
+
+def get_toc(rtd, **arguments):
+    return json.loads(asyncio.run(rtd.get_toc("sphinxdemo", output_format="json", **arguments)))
+
+
+def test_get_toc_limits_depth(rtd, fake_rtd):
+    reply = get_toc(rtd, depth=1)
+
+    assert [item["title"] for item in reply["items"]] == [f"Page {n}" for n in range(fakertd.PAGES)]
+    assert reply["notes"] == ["(Deeper entries are hidden; raise depth or pass one entry as subtree.)"]
+    assert len(get_toc(rtd)["items"]) == fakertd.PAGES * 5
+
+
+def test_get_toc_shows_one_subtree(rtd, fake_rtd):
+    reply = get_toc(rtd, subtree="page2.html")
+
+    assert reply["heading"] == "Table of Contents for sphinxdemo (latest) - Page 2"
+    assert [(item["title"], item["level"]) for item in reply["items"]] == [
+        ("Page 2", 0), ("Part 2.0", 1), ("Part 2.1", 1), ("Part 2.2", 1), ("Part 2.3", 1),
+    ]
+
+
+def test_get_toc_lists_the_top_level_for_an_unknown_subtree(rtd, fake_rtd):
+    reply = get_toc(rtd, subtree="missing.html")
+
+    assert len(reply["items"]) == fakertd.PAGES
+    assert "No entry 'missing.html' in the table of contents" in reply["notes"][-1]
+
+
+def test_get_page_navigation_links_neighbouring_pages(rtd, fake_rtd):
+    async def main():
+        return [
+            json.loads(await rtd.get_page(project, "latest", path, output_format="json", max_chars=1000, navigation=True))
+            for project, path in (("sphinxdemo", "page1.html"), ("mkdocsdemo", "page5/"))
+        ]
+
+    sphinx, mkdocs = asyncio.run(main())
+    assert sphinx["fields"] == {"previous": "Page 0 (page0.html)", "next": "Page 2 (page2.html)"}
+    assert mkdocs["fields"] == {"previous": "Page 4 (page4/)", "next": "Page 6 (page6/)"}